@@ -0,0 +1,308 @@
+"""
+Offline evaluation of the agent stack on a labeled JSONL corpus.
+
+Each line is replayed through AgentManager.process_message (no HTTP, no
+Redis), the replies are scored by CriticAgent in batches, and a report with
+answer quality, routing accuracy, per-agent latency percentiles and LLM token
+counts is printed and optionally written as JSON.
+
+Corpus lines:
+    {"id": "faq-1", "question": "...", "expected_agent": "faq",
+     "expected_keywords": ["học phí"], "chat_history": [...]}
+Only "question" (or "text") is required.
+
+LLM results are cached in a SQLite file keyed by provider routes + prompt, so
+re-running after a prompt change only pays for the prompts that changed.
+Latency numbers include cache hits; use --no-cache for a latency run.
+
+Items run in a thread pool (default) or a process pool; each worker drives
+its own event loop because the agents call the LLM synchronously.
+
+Usage:
+    python benchmarks/eval_runner.py benchmarks/fixtures/eval_corpus.jsonl \\
+        --workers 8 --critic-batch-size 10 --output eval_report.json
+    python benchmarks/eval_runner.py corpus.jsonl --mode process --no-cache
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_CACHE = os.path.join(ROOT, ".eval_cache", "llm.sqlite")
+
+from loadtest import percentile  # noqa: E402  (benchmarks/ is on sys.path when run as a script)
+
+_usage: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("eval_usage", default=None)
+_worker: Dict = {}
+
+
+class LLMResultCache:
+    """SQLite cache in front of common.llm's router; also tallies tokens per item"""
+
+    def __init__(self, path: Optional[str], inner):
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+
+    def _key(self, messages: List[Dict], tools: Optional[List[Dict]], profile: Optional[str]) -> str:
+        from common.llm import configured_routes, model_profile
+
+        settings = model_profile(profile)
+        payload = json.dumps({"routes": configured_routes(settings), "profile": settings,
+                              "messages": messages, "tools": tools}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None, profile: Optional[str] = None) -> Dict:
+        result, hit, key = None, False, None
+        if self._db is not None:
+            key = self._key(messages, tools, profile)
+            with self._lock:
+                row = self._db.execute("SELECT result FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                result, hit = json.loads(row[0]), True
+        if result is None:
+            result = self.inner(messages, tools, profile)
+            if self._db is not None:
+                with self._lock:
+                    self._db.execute("INSERT OR REPLACE INTO llm_cache (key, result) VALUES (?, ?)",
+                                     (key, json.dumps(result, ensure_ascii=False)))
+                    self._db.commit()
+
+        usage = _usage.get()
+        if usage is not None:
+            # Same accounting as /metrics and the token ledger
+            from common.llm import usage_of
+
+            prompt, completion, _, _ = usage_of(messages, result)
+            usage["llm_calls"] += 1
+            usage["cache_hits"] += int(hit)
+            usage["prompt_tokens"] += prompt
+            usage["completion_tokens"] += completion
+        return result
+
+
+def _init_worker(cache_path: Optional[str]) -> None:
+    """Builds the agent stack once per worker (process) or once for all threads"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "services", "gateway"))
+    from common import llm
+    from agents import AgentManager, CriticAgent
+
+    cache = LLMResultCache(cache_path, llm.router.chat)
+    llm.router.chat = cache.chat
+    _worker.update(manager=AgentManager(), critic=CriticAgent())
+
+
+def _new_usage() -> Dict:
+    return {"llm_calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def run_item(item: Dict) -> Dict:
+    question = item.get("question") or item.get("text") or ""
+    usage = _new_usage()
+    _usage.set(usage)
+    started = time.perf_counter()
+    error = None
+    try:
+        response = asyncio.run(_worker["manager"].process_message(
+            user_message=question,
+            chat_history=item.get("chat_history") or [],
+            session_id=f"eval-{item.get('id')}",
+        ))
+        if response.get("success") is False:
+            error = response.get("error") or "agent reported failure"
+    except Exception as e:
+        response, error = {}, str(e)
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    reply = response.get("reply") or ""
+    record = {
+        "id": item.get("id"),
+        "question": question,
+        "agent": response.get("agent", "error" if error else "unknown"),
+        "reply": reply,
+        "latency_ms": round(latency_ms, 1),
+        "usage": usage,
+        "error": error,
+    }
+    if item.get("expected_agent"):
+        record["routing_ok"] = record["agent"] == item["expected_agent"]
+    if item.get("expected_keywords"):
+        lowered = reply.lower()
+        hits = sum(1 for k in item["expected_keywords"] if k.lower() in lowered)
+        record["keyword_recall"] = hits / len(item["expected_keywords"])
+    return record
+
+
+def score_batch(records: List[Dict]) -> List[Dict]:
+    usage = _new_usage()
+    _usage.set(usage)
+    evaluations = _worker["critic"].evaluate_batch([
+        {"original_request": r["question"], "response": {"reply": r["reply"], "agent": r["agent"]}}
+        for r in records
+    ])
+    return [{"evaluation": e, "critic_usage": usage} for e in evaluations]
+
+
+def load_corpus(path: str, limit: int = 0) -> List[Dict]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(number))
+            items.append(item)
+            if limit and len(items) >= limit:
+                break
+    return items
+
+
+def _scored(rows: List[Dict]) -> List[Dict]:
+    """Critic evaluations, without the heuristic ones made when the critic reply could not be parsed"""
+    return [r["evaluation"] for r in rows if r.get("evaluation") and not r["evaluation"].get("fallback")]
+
+
+def _fallbacks(rows: List[Dict]) -> int:
+    return sum(1 for r in rows if (r.get("evaluation") or {}).get("fallback"))
+
+
+def build_report(records: List[Dict], elapsed: float) -> Dict:
+    def latency_summary(values: List[float]) -> Dict:
+        return {
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+        }
+
+    by_agent = defaultdict(list)
+    for r in records:
+        by_agent[r["agent"]].append(r)
+
+    agents = {}
+    for agent, rows in sorted(by_agent.items()):
+        scores = [e["overall_score"] for e in _scored(rows)]
+        agents[agent] = {
+            "count": len(rows),
+            **latency_summary([r["latency_ms"] for r in rows]),
+            "prompt_tokens": sum(r["usage"]["prompt_tokens"] for r in rows),
+            "completion_tokens": sum(r["usage"]["completion_tokens"] for r in rows),
+            "mean_score": round(sum(scores) / len(scores), 2) if scores else None,
+            "critic_fallbacks": _fallbacks(rows),
+        }
+
+    routed = [r["routing_ok"] for r in records if "routing_ok" in r]
+    recalls = [r["keyword_recall"] for r in records if "keyword_recall" in r]
+    evaluations = _scored(records)
+    scores = [e["overall_score"] for e in evaluations]
+    criteria = defaultdict(list)
+    for evaluation in evaluations:
+        for name, value in (evaluation.get("scores") or {}).items():
+            if isinstance(value, (int, float)):
+                criteria[name].append(value)
+
+    # Critic usage is shared by every record of a batch; count each batch once
+    critic_usages = list({id(r["critic_usage"]): r["critic_usage"] for r in records if "critic_usage" in r}.values())
+    usages = [r["usage"] for r in records] + critic_usages
+    return {
+        "items": len(records),
+        "errors": sum(1 for r in records if r["error"]),
+        "elapsed_s": round(elapsed, 2),
+        "latency": latency_summary([r["latency_ms"] for r in records]),
+        "routing_accuracy": round(sum(routed) / len(routed), 3) if routed else None,
+        "keyword_recall": round(sum(recalls) / len(recalls), 3) if recalls else None,
+        "critic": {
+            "mean_overall_score": round(sum(scores) / len(scores), 2) if scores else None,
+            "scored": len(scores),
+            "fallback": _fallbacks(records),
+            "criteria": {k: round(sum(v) / len(v), 2) for k, v in sorted(criteria.items())},
+        },
+        "tokens": {
+            "agent_prompt": sum(r["usage"]["prompt_tokens"] for r in records),
+            "agent_completion": sum(r["usage"]["completion_tokens"] for r in records),
+            "critic_prompt": sum(u["prompt_tokens"] for u in critic_usages),
+            "critic_completion": sum(u["completion_tokens"] for u in critic_usages),
+        },
+        "llm_cache": {
+            "calls": sum(u["llm_calls"] for u in usages),
+            "hits": sum(u["cache_hits"] for u in usages),
+        },
+        "agents": agents,
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['items']} items, {report['errors']} errors in {report['elapsed_s']}s | "
+          f"p50 {report['latency']['p50_ms']} ms, p95 {report['latency']['p95_ms']} ms, "
+          f"p99 {report['latency']['p99_ms']} ms")
+    print(f"routing accuracy {report['routing_accuracy']} | keyword recall {report['keyword_recall']} | "
+          f"critic score {report['critic']['mean_overall_score']} "
+          f"({report['critic']['scored']} scored, {report['critic']['fallback']} unparsed)")
+    print(f"tokens {report['tokens']} | llm cache {report['llm_cache']}")
+    print(f"{'agent':<18}{'count':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'prompt_tok':>12}{'compl_tok':>11}{'score':>7}")
+    for agent, row in report["agents"].items():
+        print(f"{agent:<18}{row['count']:>6}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+              f"{row['prompt_tokens']:>12}{row['completion_tokens']:>11}{str(row['mean_score']):>7}")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Offline evaluation of the agent stack")
+    parser.add_argument("corpus", help="Labeled JSONL corpus")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--critic-batch-size", type=int, default=10, help="0 disables critic scoring")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="SQLite file for cached LLM results")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--records", help="Write per-item records (JSONL) here")
+    args = parser.parse_args(argv)
+
+    items = load_corpus(args.corpus, args.limit)
+    cache_path = None if args.no_cache else args.cache
+    started = time.perf_counter()
+
+    if args.mode == "process":
+        pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(cache_path,))
+    else:
+        _init_worker(cache_path)
+        pool = ThreadPoolExecutor(max_workers=args.workers)
+
+    with pool:
+        records = list(pool.map(run_item, items))
+        if args.critic_batch_size > 0:
+            batches = [records[i:i + args.critic_batch_size] for i in range(0, len(records), args.critic_batch_size)]
+            for batch, scored in zip(batches, pool.map(score_batch, batches)):
+                for record, result in zip(batch, scored):
+                    record.update(result)
+
+    report = build_report(records, time.perf_counter() - started)
+    if args.records:
+        with open(args.records, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Minimal OpenAI-compatible chat server standing in for vLLM / Ollama.
+
+Answers /v1/chat/completions (plain and stream=true) by echoing the last user
+message after --latency-ms, and /v1/models. It counts requests and the peak
+number of requests in flight, so batching and connection reuse can be checked
+without a GPU. Like vLLM's prefix caching, a system message seen before is
+reported as cached prompt tokens. Standard library only.
+
+Usage:
+    python benchmarks/fake_openai_server.py --port 8001 --latency-ms 150
+    VLLM_BASE_URL=http://localhost:8001/v1 LLM_PROVIDER=vllm LLM_MODEL=fake python benchmarks/loadtest.py ...
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency_ms: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency_ms / 1000
+        self.fail_next = 0
+        self.stats = {"requests": 0, "streams": 0, "in_flight": 0, "max_in_flight": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._prefixes = set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def reply_for(self, body: Dict) -> str:
+        messages = body.get("messages") or [{}]
+        return f"echo: {messages[-1].get('content', '')}"
+
+    def cached_tokens(self, body: Dict) -> int:
+        first = (body.get("messages") or [{}])[0]
+        if first.get("role") != "system":
+            return 0
+        prefix = first.get("content") or ""
+        with self._lock:
+            hit = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        return len(prefix) // 4 if hit else 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        server: FakeOpenAIServer = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        with server._lock:
+            server.stats["requests"] += 1
+            server.stats["in_flight"] += 1
+            server.stats["max_in_flight"] = max(server.stats["max_in_flight"], server.stats["in_flight"])
+            fail = server.fail_next > 0
+            server.fail_next -= 1 if fail else 0
+        try:
+            time.sleep(server.latency)
+            if fail:
+                self._send_json(503, {"error": "overloaded"})
+                return
+            content = server.reply_for(body)
+            if body.get("stream"):
+                self._stream(body, content)
+                return
+            prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                          "prompt_tokens_details": {"cached_tokens": server.cached_tokens(body)}},
+            })
+        finally:
+            with server._lock:
+                server.stats["in_flight"] -= 1
+
+    def _stream(self, body: Dict, content: str) -> None:
+        with self.server._lock:
+            self.server.stats["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: str) -> None:
+            chunk = data.encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+
+        for i, word in enumerate(content.split(" ")):
+            delta = {"content": word if i == 0 else " " + word}
+            write("data: " + json.dumps({"choices": [{"index": 0, "delta": delta}]}, ensure_ascii=False) + "\n\n")
+        write("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server (vLLM / Ollama stand-in)")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.port, args.latency_ms)
+    print(f"Serving on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats)
@@ -0,0 +1,419 @@
+"""
+End-to-end load test for the gateway.
+
+Drives /ask, /voice-chat, /call_tool and /tickets with a weighted mix of requests
+taken from a JSONL corpus and reports throughput, p50/p95/p99 latency per
+endpoint and the per-stage breakdown the gateway emits in its Server-Timing
+header (history_load, agents, llm, history_save, action, ticket, stt, tts, ...).
+
+Corpus lines look like
+    {"endpoint": "ask", "text": "..."}
+    {"endpoint": "voice_chat", "text": "..."}          # transcript for the stub STT
+    {"endpoint": "call_tool", "tool_name": "...", "tool_args": {...}}
+    {"endpoint": "tickets", "method": "GET", "path": "/tickets/my"}
+Lines without "endpoint" but with "title"/"body" (backlog style) are sent to /ask.
+
+Two modes:
+  --target URL   hit a running gateway (docker compose up with LLM_PROVIDER=stub)
+  --in-process   (default) run the gateway app on this box through httpx's ASGI
+                 transport: fakeredis stands in for Redis (or --redis-url for a
+                 local server), action/ticket upstreams are answered by a mock
+                 transport after --upstream-ms, policy retrieval returns canned
+                 citations after --policy-ms (the agents' own calls to the
+                 policy and action services are stubbed too), voice STT/TTS
+                 are simulated.
+                 The LLM is the latency-simulating stub from common.llm
+                 (STUB_LLM_* settings, see .env.example).
+
+Usage:
+    python benchmarks/loadtest.py --concurrency 32 --duration 30 \\
+        --llm-dist lognormal --llm-ttft-ms 400 --llm-tokens-per-sec 60
+    python benchmarks/loadtest.py --target http://localhost:8000 --requests 500 \\
+        --mix ask=80,tickets=20 --corpus requests.jsonl
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import time
+import uuid
+import wave
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "fixtures", "loadtest_corpus.jsonl")
+ENDPOINTS = ("ask", "voice_chat", "call_tool", "tickets")
+
+
+# --- Corpus ---
+
+def load_corpus(path: str) -> dict:
+    pools = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            endpoint = item.get("endpoint")
+            if not endpoint:
+                text = " ".join(p for p in (item.get("title"), item.get("body")) if p)
+                if not text:
+                    continue
+                item = {"endpoint": "ask", "text": text}
+                endpoint = "ask"
+            if endpoint not in ENDPOINTS:
+                raise ValueError(f"Unknown endpoint {endpoint!r} in corpus")
+            pools[endpoint].append(item)
+    return pools
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().replace("-", "_")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r} in --mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _silent_wav(seconds: float = 0.5, rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+def build_request(item: dict, session_id: str, student_id: str, in_process: bool) -> dict:
+    endpoint = item["endpoint"]
+    if endpoint == "ask":
+        return {"method": "POST", "url": "/ask",
+                "json": {"channel": "web", "text": item["text"], "session_id": session_id, "student_id": student_id}}
+    if endpoint == "voice_chat":
+        # The in-process stub STT "transcribes" the uploaded bytes as UTF-8 text
+        audio = item["text"].encode("utf-8") if in_process else _silent_wav()
+        return {"method": "POST", "url": "/voice-chat", "params": {"session_id": session_id},
+                "files": {"audio_file": ("turn.wav", audio, "audio/wav")}}
+    if endpoint == "call_tool":
+        return {"method": "POST", "url": "/call_tool",
+                "json": {"tool_name": item["tool_name"], "tool_args": dict(item.get("tool_args") or {})}}
+    request = {"method": item.get("method", "GET"), "url": item.get("path", "/tickets/my")}
+    if "json" in item:
+        request["json"] = item["json"]
+    return request
+
+
+# --- In-process gateway with local stand-ins ---
+
+class _StubVoiceManager:
+    """Simulates Whisper/ElevenLabs latency without calling either API"""
+
+    def __init__(self, stt_ms: float, tts_ms: float):
+        self.stt_s = stt_ms / 1000
+        self.tts_s = tts_ms / 1000
+
+    async def process_voice_chat(self, audio_file, filename, ask_agent_func) -> dict:
+        from common import timing
+
+        with timing.stage("stt"):
+            await asyncio.sleep(self.stt_s)
+            transcript = audio_file.read().decode("utf-8", "ignore") or "xin chào"
+        reply = await ask_agent_func(transcript)
+        text = reply.get("reply", "") if isinstance(reply, dict) else str(reply)
+        with timing.stage("tts"):
+            await asyncio.sleep(self.tts_s)
+        return {"transcript": transcript, "text": text, "audio_url": f"/static/audio/tts_{uuid.uuid4().hex}.mp3"}
+
+
+def _json_response(status: int, payload) -> httpx.Response:
+    # Streamed body: the ticket proxy reads upstream responses with aiter_raw()
+    body = json.dumps(payload).encode("utf-8")
+
+    async def stream():
+        yield body
+
+    return httpx.Response(status, headers={"content-type": "application/json"}, content=stream())
+
+
+def _upstream_transport(upstream_ms: float) -> httpx.MockTransport:
+    """Answers the gateway's calls to the action and ticket services"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(upstream_ms / 1000)
+        path = request.url.path
+        if path.endswith("/call_tool"):
+            return _json_response(200, {"status": "success", "message": "ok", "request_id": uuid.uuid4().hex[:8]})
+        if request.method == "GET":
+            return _json_response(200, [{"id": i, "subject": "Ticket", "category": "technical",
+                                         "status": "open"} for i in range(5)])
+        await request.aread()
+        return _json_response(201, {"id": random.randint(1, 10_000), "status": "open"})
+
+    return httpx.MockTransport(handler)
+
+
+_STUB_CITATIONS = [
+    {"source": f"Quy chế đào tạo, Điều {i}", "quote": "Sinh viên được đăng ký tối đa 25 tín chỉ mỗi học kỳ.",
+     "relevance_score": 0.9 - i / 10}
+    for i in range(1, 4)
+]
+
+
+def _action_catalog() -> dict:
+    """GET /tools body of the action service, rendered from its tool registry"""
+    flat_modules = ("toolspec", "tools")
+    sys.path.insert(0, os.path.join(ROOT, "services", "action"))
+    for name in flat_modules:
+        sys.modules.pop(name, None)
+    try:
+        import toolspec
+        import tools  # noqa: F401
+        return json.loads(toolspec.registry.catalog())
+    finally:
+        sys.path.pop(0)
+        for name in flat_modules:
+            sys.modules.pop(name, None)
+
+
+def _stub_agent_upstreams(policy_ms: float, upstream_ms: float) -> None:
+    """
+    The agents call the policy and action services with their own httpx
+    clients; without this the "retrieval" stage would measure DNS failures and
+    then an open circuit breaker instead of retrieval latency.
+    """
+    from agents import ActionExecutorAgent, EnhancedRAGAgent
+
+    async def search_documents(self, query):
+        await asyncio.sleep(policy_ms / 1000)
+        return list(_STUB_CITATIONS)
+
+    catalog = _action_catalog()
+
+    async def load_tools(self):
+        if not self.available_tools:
+            self._apply_catalog(catalog)
+
+    async def execute_tool(self, tool_name, params, context=None):
+        await asyncio.sleep(upstream_ms / 1000)
+        return {"success": True, "tool_name": tool_name, "status_code": 200,
+                "result": {"status": "success", "message": "ok"}}
+
+    EnhancedRAGAgent._search_documents = search_documents
+    ActionExecutorAgent._load_tools = load_tools
+    ActionExecutorAgent._execute_tool = execute_tool
+
+
+def build_in_process_app(args):
+    os.environ.setdefault("DB_CONNECTION", "mysql+pymysql")
+    os.environ.setdefault("DB_HOST", "localhost")
+    os.environ.setdefault("DB_PORT", "3306")
+    os.environ["ARCHIVER_INTERVAL_SECONDS"] = "0"
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ.setdefault("STATIC_AUDIO_DIR", "/tmp/static/audio")
+    os.environ["STUB_LLM_LATENCY_DIST"] = args.llm_dist
+    os.environ["STUB_LLM_TTFT_MS"] = str(args.llm_ttft_ms)
+    os.environ["STUB_LLM_TTFT_JITTER_MS"] = str(args.llm_jitter_ms)
+    os.environ["STUB_LLM_TOKENS_PER_SEC"] = str(args.llm_tokens_per_sec)
+    os.environ["STUB_LLM_ERROR_RATE"] = str(args.llm_error_rate)
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "services", "gateway"))
+    import app as gateway
+
+    if args.redis_url:
+        from redis import Redis
+        gateway.r = Redis.from_url(args.redis_url, decode_responses=True)
+        gateway.r_history = Redis.from_url(args.redis_url, decode_responses=False)
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("fakeredis is not installed; pip install fakeredis or pass --redis-url")
+        server = fakeredis.FakeServer()
+        gateway.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+        gateway.r_history = fakeredis.FakeRedis(server=server, decode_responses=False)
+
+    _stub_agent_upstreams(args.policy_ms, args.upstream_ms)
+    gateway.voice_manager = _StubVoiceManager(args.stt_ms, args.tts_ms)
+    gateway.app.state.http_client = httpx.AsyncClient(transport=_upstream_transport(args.upstream_ms))
+    return gateway.app
+
+
+# --- Runner ---
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def run_load(client: httpx.AsyncClient, pools: dict, mix: dict, args) -> dict:
+    rng = random.Random(args.seed)
+    endpoints = [e for e in mix if pools.get(e)]
+    if not endpoints:
+        raise SystemExit("No corpus entries for the endpoints in --mix")
+    weights = [mix[e] for e in endpoints]
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {"x-student-id": args.student_id}
+
+    samples = defaultdict(list)          # endpoint -> [latency_ms]
+    errors = defaultdict(int)
+    stages = defaultdict(lambda: defaultdict(list))  # endpoint -> stage -> [ms]
+    issued = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_slot() -> bool:
+        nonlocal issued
+        if args.requests and issued >= args.requests:
+            return False
+        if deadline and time.perf_counter() >= deadline:
+            return False
+        issued += 1
+        return True
+
+    async def worker(worker_id: int):
+        # Each virtual user keeps one chat session, like a real browser tab
+        session_id = f"loadtest-{worker_id}-{uuid.uuid4().hex[:8]}"
+        while next_slot():
+            endpoint = rng.choices(endpoints, weights)[0]
+            item = rng.choice(pools[endpoint])
+            request = build_request(item, session_id, args.student_id, args.in_process)
+            started = time.perf_counter()
+            try:
+                resp = await client.request(headers=headers, timeout=args.timeout, **request)
+                ok = resp.status_code < 400
+                timing_header = resp.headers.get("server-timing")
+                if ok and endpoint == "ask":
+                    # /ask reports agent failures in-band with a 200
+                    ok = resp.json().get("answer", {}).get("agent_info", {}).get("agent") != "error"
+            except httpx.HTTPError:
+                ok, timing_header = False, None
+            samples[endpoint].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors[endpoint] += 1
+            for name, ms in parse_server_timing(timing_header or "").items():
+                stages[endpoint][name].append(ms)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in samples.values())
+    report = {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "endpoints": {},
+    }
+    for endpoint, latencies in sorted(samples.items()):
+        report["endpoints"][endpoint] = {
+            "count": len(latencies),
+            "errors": errors[endpoint],
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1),
+            "stages": {
+                name: {"mean_ms": round(sum(v) / len(v), 1), "p95_ms": round(percentile(v, 95), 1)}
+                for name, v in sorted(stages[endpoint].items())
+            },
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['requests']} requests in {report['elapsed_s']}s "
+          f"-> {report['throughput_rps']} req/s, {report['errors']} errors")
+    print(f"{'endpoint':<12}{'count':>7}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:<12}{row['count']:>7}{row['errors']:>6}{row['p50_ms']:>9}"
+              f"{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}")
+        for name, st in row["stages"].items():
+            print(f"    {name:<16} mean {st['mean_ms']:>8} ms   p95 {st['p95_ms']:>8} ms")
+
+
+async def main_async(args) -> dict:
+    pools = load_corpus(args.corpus)
+    mix = parse_mix(args.mix)
+    if args.target:
+        async with httpx.AsyncClient(base_url=args.target.rstrip("/")) as client:
+            return await run_load(client, pools, mix, args)
+    app = build_in_process_app(args)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+        try:
+            return await run_load(client, pools, mix, args)
+        finally:
+            await app.state.http_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", help="Gateway base URL; omit to run the app in-process")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--mix", default="ask=70,call_tool=15,tickets=10,voice_chat=5",
+                        help="Endpoint weights, e.g. ask=70,tickets=30")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=0, help="Seconds to run (0 = use --requests)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--token", help="Bearer token; otherwise x-student-id is sent")
+    parser.add_argument("--student-id", default="LOADTEST001")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    local = parser.add_argument_group("in-process stand-ins")
+    local.add_argument("--redis-url", help="Use a local Redis instead of fakeredis")
+    local.add_argument("--llm-dist", default="lognormal",
+                       choices=["none", "fixed", "uniform", "normal", "lognormal"])
+    local.add_argument("--llm-ttft-ms", type=float, default=300)
+    local.add_argument("--llm-jitter-ms", type=float, default=100)
+    local.add_argument("--llm-tokens-per-sec", type=float, default=50)
+    local.add_argument("--llm-error-rate", type=float, default=0.0)
+    local.add_argument("--upstream-ms", type=float, default=20, help="Action/ticket service latency")
+    local.add_argument("--policy-ms", type=float, default=50, help="Policy service retrieval latency")
+    local.add_argument("--stt-ms", type=float, default=400)
+    local.add_argument("--tts-ms", type=float, default=600)
+    args = parser.parse_args()
+    args.in_process = not args.target
+    if not args.duration and not args.requests:
+        parser.error("set --duration or --requests")
+    if args.duration:
+        args.requests = 0
+
+    report = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
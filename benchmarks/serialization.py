@@ -0,0 +1,129 @@
+"""
+Serialization and compression benchmark for the large JSON endpoints.
+
+Builds realistic payloads for /chat-logs, /admin/action-requests and
+/tickets, then compares render time of the stdlib JSONResponse against
+common.web.ORJSONResponse and the payload size raw / gzip / brotli at the
+levels used by common.web.CompressionMiddleware.
+
+Usage:
+    python benchmarks/serialization.py --repeat 200
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+import uuid
+
+from starlette.responses import JSONResponse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from common import web
+
+QUESTIONS = [
+    "Làm thế nào để đặt lại mật khẩu tài khoản sinh viên?",
+    "Học phí học kỳ này đóng đến hạn ngày nào vậy ạ?",
+    "Mình muốn gia hạn thẻ thư viện thêm 6 tháng",
+    "Phòng ký túc xá B203 bị hỏng vòi nước, nhờ sửa giúp",
+    "Lịch thi cuối kỳ môn Cấu trúc dữ liệu khi nào có?",
+]
+AGENTS = ["smart_lead", "faq", "technical", "action_executor", "greeting"]
+
+
+def chat_logs_fixture(sessions: int = 500) -> dict:
+    now = time.time()
+    logs = []
+    for _ in range(sessions):
+        start = now - random.randint(60, 86400)
+        logs.append({
+            "id": str(uuid.uuid4()),
+            "session_id": str(uuid.uuid4()),
+            "student_id": f"SV{random.randint(100000, 999999)}",
+            "messages_count": random.randint(1, 40),
+            "start_time": start,
+            "end_time": start + random.randint(30, 1800),
+            "status": random.choice(["active", "completed"]),
+            "last_message": random.choice(QUESTIONS)[:50],
+            "agent": random.choice(AGENTS),
+        })
+    return {"logs": logs, "total": len(logs)}
+
+
+def action_requests_fixture(count: int = 200) -> list:
+    items = []
+    for i in range(count):
+        items.append({
+            "id": i + 1,
+            "student_id": f"SV{random.randint(100000, 999999)}",
+            "action_type": random.choice(["reset_password", "renew_library_card", "book_room", "request_dorm_fix"]),
+            "status": random.choice(["submitted", "completed", "failed"]),
+            "request_data": {"student_id": "SV123456", "card_number": "LIB-2024-0042", "duration": "6_months"},
+            "result_data": {"status": "success", "message": "Library card renewed for 6_months.", "new_expiry": "2026-02-28"},
+            "external_id": str(uuid.uuid4())[:8],
+            "submitted_at": "2025-09-01T08:15:30.123456",
+            "processed_at": "2025-09-01T08:15:31.654321",
+            "processed_by": None,
+            "notes": None,
+            "client_ip": "172.18.0.5",
+        })
+    return items
+
+
+def tickets_fixture(count: int = 100) -> dict:
+    tickets = []
+    for i in range(count):
+        tickets.append({
+            "id": i + 1,
+            "subject": random.choice(QUESTIONS)[:60],
+            "content": " ".join(random.choice(QUESTIONS) for _ in range(6)),
+            "category": random.choice(["technical", "academic", "general"]),
+            "priority": random.choice(["low", "normal", "high"]),
+            "status": random.choice(["open", "in_progress", "resolved"]),
+            "user_name": f"student{i}",
+            "student_id": f"SV{random.randint(100000, 999999)}",
+            "assigned_to": None,
+            "created_at": "2025-09-01T08:15:30",
+            "updated_at": "2025-09-02T10:00:00",
+        })
+    return {"tickets": tickets, "total": 1234, "page": 1, "per_page": count, "total_pages": 13}
+
+
+def _time_render(response_cls, payload, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response_cls(payload)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    fixtures = {
+        "/chat-logs": chat_logs_fixture(),
+        "/admin/action-requests": action_requests_fixture(),
+        "/tickets": tickets_fixture(),
+    }
+    print(f"orjson={web.ORJSON_AVAILABLE} brotli={web.BROTLI_AVAILABLE}")
+    for name, payload in fixtures.items():
+        raw = web.DefaultJSONResponse(payload).body
+        row = {
+            "endpoint": name,
+            "stdlib_ms": round(_time_render(JSONResponse, payload, args.repeat), 3),
+            "orjson_ms": round(_time_render(web.DefaultJSONResponse, payload, args.repeat), 3),
+            "raw_bytes": len(raw),
+            "gzip_bytes": len(gzip.compress(raw, compresslevel=web.GZIP_LEVEL)),
+        }
+        if web.BROTLI_AVAILABLE:
+            row["brotli_bytes"] = len(web.brotli.compress(raw, quality=web.BROTLI_QUALITY))
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
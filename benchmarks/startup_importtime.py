@@ -0,0 +1,95 @@
+"""
+Cold-start import cost of a service module, measured with `python -X importtime`.
+
+Every run starts a fresh interpreter (like a new container), imports the
+target module and parses the importtime report from stderr. The median wall
+time and target import time are printed with the modules that cost the most
+(cumulative, i.e. including what they import). --forbid fails the run when a
+module shows up that should be loaded lazily, --max-ms when the median
+import time is over budget.
+
+Usage (from the repo root):
+    python benchmarks/startup_importtime.py                  # common.llm with LLM_PROVIDER=stub
+    python benchmarks/startup_importtime.py --forbid openai --forbid google.generativeai --max-ms 500
+    python benchmarks/startup_importtime.py --module app --cwd services/gateway --runs 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for every line of an -X importtime report"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[0].isdigit():
+            continue  # header line
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def measure(module: str, cwd: str = ROOT, env: Optional[Dict[str, str]] = None) -> Dict:
+    run_env = dict(os.environ)
+    run_env.setdefault("LLM_PROVIDER", "stub")
+    run_env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, run_env.get("PYTHONPATH")) if p)
+    run_env.update(env or {})
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=cwd, env=run_env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = parse_importtime(proc.stderr)
+    target = next((cumulative for name, _, cumulative in rows if name == module), 0)
+    return {"wall_ms": wall_ms, "import_ms": target / 1000, "modules": rows}
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Measure cold-start import time with -X importtime")
+    parser.add_argument("--module", default="common.llm")
+    parser.add_argument("--cwd", default=ROOT, help="Working directory (services/gateway for the flat gateway modules)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--forbid", action="append", default=[], help="Module that must not be imported")
+    parser.add_argument("--max-ms", type=float, help="Fail when the median import time exceeds this")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module, os.path.abspath(args.cwd)) for _ in range(args.runs)]
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "wall_ms": round(statistics.median(r["wall_ms"] for r in runs), 1),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+    }
+    print(f"import {args.module}: {report['import_ms']} ms (process wall {report['wall_ms']} ms, "
+          f"median of {args.runs})")
+    last = runs[-1]["modules"]
+    print(f"{'cumulative_ms':>14}{'self_ms':>10}  module")
+    for name, self_us, cumulative in sorted(last, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {name.strip()}")
+
+    loaded = {name.strip() for name, _, _ in last}
+    report["forbidden"] = sorted(m for m in args.forbid if m in loaded)
+    failed = False
+    if report["forbidden"]:
+        print(f"FAIL: imported at startup: {', '.join(report['forbidden'])}")
+        failed = True
+    if args.max_ms is not None and report["import_ms"] > args.max_ms:
+        print(f"FAIL: {report['import_ms']} ms > {args.max_ms} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Micro-benchmarks for the non-LLM work done on every /ask.
+
+Covers prompt assembly, chat history formatting, JSON fence stripping,
+conversation-flow analysis, the rule-based fallbacks and the Redis chat turn
+codec, using the Vietnamese conversations in fixtures/conversations_vi.json.
+The LLM is replaced by a canned reply so only our own CPU time is measured.
+
+Usage (from the repo root, requires pytest-benchmark):
+    # run and print the table
+    python -m pytest benchmarks/test_agent_hot_paths.py --benchmark-only
+    # refresh the stored baseline after an intended change
+    python -m pytest benchmarks/test_agent_hot_paths.py --benchmark-only \\
+        --benchmark-storage=benchmarks/baselines --benchmark-save=agent_hot_paths
+    # fail if any median regressed by more than 25% against the latest baseline
+    python -m pytest benchmarks/test_agent_hot_paths.py --benchmark-only \\
+        --benchmark-storage=benchmarks/baselines --benchmark-compare \\
+        --benchmark-compare-fail=median:25%
+
+Baselines are stored per machine/interpreter (pytest-benchmark's machine id),
+so compare on the same box that produced them.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "services", "gateway"))
+
+import chat_history_codec  # noqa: E402
+from agents import (  # noqa: E402
+    ActionExecutorAgent,
+    EnhancedAgentManager,
+    EnhancedRAGAgent,
+    LeadAgent,
+    SmartLeadAgent,
+)
+from agents.base import strip_json_fence  # noqa: E402
+
+# Tool catalog from the action service registry (flat modules, like the gateway's)
+_FLAT_MODULES = ("toolspec", "tools")
+sys.path.insert(0, os.path.join(ROOT, "services", "action"))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import toolspec  # noqa: E402
+import tools  # noqa: E402,F401
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "conversations_vi.json"), encoding="utf-8") as f:
+    FIXTURES = json.load(f)
+
+CONVERSATIONS = FIXTURES["conversations"]
+MESSAGES = FIXTURES["messages"]
+FENCED_REPLY = FIXTURES["fenced_llm_reply"]
+LONG_HISTORY = CONVERSATIONS["graduation_long"]
+
+
+@pytest.fixture(scope="module")
+def smart_lead():
+    agent = SmartLeadAgent()
+    agent._call_llm = lambda messages, profile=None: FENCED_REPLY
+    return agent
+
+
+@pytest.fixture(scope="module")
+def enhanced_manager():
+    return EnhancedAgentManager()
+
+
+# --- Prompt assembly / history formatting ---
+
+@pytest.mark.parametrize("conversation", sorted(CONVERSATIONS))
+def test_build_messages(benchmark, smart_lead, conversation):
+    history = CONVERSATIONS[conversation]
+    messages = benchmark(smart_lead._build_messages, MESSAGES[0], history)
+    assert len(messages) == 2 * len(history) + 2
+
+
+def test_format_chat_history(benchmark, smart_lead):
+    formatted = benchmark(smart_lead._format_chat_history, LONG_HISTORY[-3:])
+    assert formatted.count(" | ") == 2
+
+
+def test_smart_lead_decision_prompt(benchmark, smart_lead):
+    # Prompt f-string + fence stripping + json.loads with the LLM call stubbed out
+    decision = benchmark(smart_lead._make_intelligent_decision, MESSAGES[1], LONG_HISTORY, {})
+    assert decision["target_specialist"] == "faq"
+
+
+def test_strip_json_fence(benchmark):
+    payload = benchmark(lambda: json.loads(strip_json_fence(FENCED_REPLY)))
+    assert payload["action"] == "delegate_to_specialist"
+
+
+# --- Context preparation ---
+
+def test_analyze_conversation_flow(benchmark, enhanced_manager):
+    flow = benchmark(enhanced_manager._analyze_conversation_flow, LONG_HISTORY)
+    assert flow["type"] == "extended_conversation"
+
+
+def test_prepare_context(benchmark, enhanced_manager):
+    context = benchmark(enhanced_manager._prepare_context, "bench-session", "20210001", LONG_HISTORY)
+    assert context["chat_length"] == len(LONG_HISTORY)
+
+
+# --- Rule-based optimizers / fallbacks ---
+
+def test_rule_based_query_optimization(benchmark):
+    agent = EnhancedRAGAgent()
+    results = benchmark(lambda: [agent._rule_based_query_optimization(m) for m in MESSAGES])
+    assert len(results) == len(MESSAGES)
+
+
+def test_rule_based_complexity_analysis(benchmark):
+    agent = LeadAgent()
+    results = benchmark(lambda: [agent._rule_based_complexity_analysis(m) for m in MESSAGES])
+    assert results[0]["is_simple"]
+
+
+def test_fallback_decision(benchmark, smart_lead):
+    results = benchmark(lambda: [smart_lead._fallback_decision(m) for m in MESSAGES])
+    assert results[1]["target_specialist"] == "technical"
+
+
+def test_tools_description(benchmark):
+    agent = ActionExecutorAgent()
+    agent._apply_catalog(json.loads(toolspec.registry.catalog()))
+    description = benchmark(agent._get_tools_description)
+    assert "book_room" in description
+
+
+# --- Redis chat turn codec ---
+
+def test_encode_history(benchmark):
+    encoded = benchmark(lambda: [chat_history_codec.encode_turn(t) for t in LONG_HISTORY])
+    assert len(encoded) == len(LONG_HISTORY)
+
+
+def test_decode_history(benchmark):
+    encoded = [chat_history_codec.encode_turn(t) for t in reversed(LONG_HISTORY)]
+    decoded = benchmark(lambda: [chat_history_codec.decode_turn(h) for h in reversed(encoded)])
+    assert decoded[0]["user"] == LONG_HISTORY[0]["user"]
@@ -0,0 +1,65 @@
+"""
+Per-call cost of validating /call_tool arguments in the action service.
+
+Compares jsonschema.validate (re-checks the schema and builds a validator on
+every call, what validate_tool_args used to do) with the validator built once
+per tool by the registry (services/action/toolspec.py), for valid and invalid
+arguments of every tool.
+
+Usage (from the repo root, requires pytest-benchmark):
+    python -m pytest benchmarks/test_tool_validation.py --benchmark-only
+    python -m pytest benchmarks/test_tool_validation.py --benchmark-only \\
+        --benchmark-storage=benchmarks/baselines --benchmark-save=tool_validation
+"""
+import os
+import sys
+
+import jsonschema
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+_FLAT_MODULES = ("toolspec", "tools")
+sys.path.insert(0, os.path.join(ROOT, "services", "action"))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import toolspec  # noqa: E402
+import tools  # noqa: E402,F401
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+VALID_ARGS = {
+    "reset_password": {"student_id": "20210001"},
+    "renew_library_card": {"student_id": "20210001", "card_number": "LIB-0042", "duration": "6 months"},
+    "create_glpi_ticket": {"title": "Wifi KTX", "description": "Mất wifi tầng 3 nhà B", "category": "network"},
+    "request_dorm_fix": {"room_number": "B305", "issue_type": "electric", "description": "Ổ cắm hỏng"},
+    "book_room": {"room_id": "A101", "start_time": "2024-01-15T10:00:00", "end_time": "2024-01-15T12:00:00+07:00"},
+}
+INVALID_ARGS = {
+    "reset_password": {},
+    "book_room": {"room_id": "A101", "start_time": "15/1 10h", "end_time": "2024-01-15T12:00:00"},
+}
+
+
+def test_every_tool_has_benchmark_args():
+    assert set(VALID_ARGS) == set(toolspec.registry.names())
+
+
+@pytest.mark.parametrize("tool_name", sorted(VALID_ARGS))
+def test_validate_per_call(benchmark, tool_name):
+    schema = toolspec.registry.get(tool_name).schema
+    benchmark(jsonschema.validate, VALID_ARGS[tool_name], schema)
+
+
+@pytest.mark.parametrize("tool_name", sorted(VALID_ARGS))
+def test_precompiled_validator(benchmark, tool_name):
+    tool = toolspec.registry.get(tool_name)
+    assert benchmark(tool.validation_error, VALID_ARGS[tool_name]) is None
+
+
+@pytest.mark.parametrize("tool_name", sorted(INVALID_ARGS))
+def test_precompiled_validator_invalid(benchmark, tool_name):
+    tool = toolspec.registry.get(tool_name)
+    assert benchmark(tool.validation_error, INVALID_ARGS[tool_name]) is not None
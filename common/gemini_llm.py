@@ -0,0 +1,240 @@
+"""
+Google Gemini backend (google.generativeai) for common.llm.
+
+- GenerativeModel handles are cached per (model, system instruction, tools):
+  the static system prompt (see BaseAgent._assemble_messages) becomes a native
+  system_instruction and the tool declarations are converted once, instead of
+  building a model and prepending the system text to the first user turn on
+  every call.
+- OpenAI-style messages and tools in, the common.llm result shape out:
+  native function calling (tools -> function_declarations, function_call
+  parts -> "tool_calls"), role "tool" messages -> function_response parts.
+- chat (blocking), achat (async) and astream (async streaming).
+
+The SDK is imported on first use, like the other provider SDKs in common.llm.
+
+Settings:
+    GOOGLE_API_KEY
+    GEMINI_MODEL_CACHE_SIZE   cached model handles (default 64)
+"""
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_MODEL_CACHE_SIZE = int(os.getenv("GEMINI_MODEL_CACHE_SIZE", "64"))
+
+EMPTY_REPLY = "Sorry, I could not process the response from Gemini."
+
+# Subset of JSON Schema understood by Gemini function declarations
+_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "required", "items"}
+_SCHEMA_FORMATS = {"date-time", "enum", "float", "double", "int32", "int64"}
+
+_genai = None
+_sdk_lock = threading.Lock()
+
+
+def sdk():
+    """google.generativeai, imported and configured on first use"""
+    global _genai
+    with _sdk_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if GOOGLE_API_KEY:
+                genai.configure(api_key=GOOGLE_API_KEY)
+            _genai = genai
+        return _genai
+
+
+# --- OpenAI format -> Gemini ---
+
+def gemini_schema(schema: Dict) -> Dict:
+    """Drop JSON Schema keywords Gemini rejects (additionalProperties, $schema, default...)"""
+    result = {}
+    for key, value in schema.items():
+        if key not in _SCHEMA_KEYS:
+            continue
+        if key == "format" and value not in _SCHEMA_FORMATS:
+            continue
+        if key == "properties":
+            value = {name: gemini_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            value = gemini_schema(value)
+        result[key] = value
+    return result
+
+
+def function_declarations(tools: Optional[List[Dict]]) -> List[Dict]:
+    """OpenAI `tools` ([{"type": "function", "function": {...}}]) -> Gemini function declarations"""
+    declarations = []
+    for tool in tools or []:
+        function = tool.get("function", tool)
+        declaration = {"name": function["name"], "description": function.get("description", "")}
+        parameters = function.get("parameters") or {}
+        if parameters.get("properties"):
+            declaration["parameters"] = gemini_schema(parameters)
+        declarations.append(declaration)
+    return declarations
+
+
+def _function_response(content: Optional[str]) -> Dict:
+    try:
+        value = json.loads(content or "")
+    except ValueError:
+        value = content
+    return value if isinstance(value, dict) else {"result": value}
+
+
+def to_contents(messages: List[Dict]) -> Tuple[Optional[str], List[Dict]]:
+    """(system instruction, contents); consecutive turns of the same role are merged"""
+    system = [m["content"] for m in messages if m["role"] == "system" and m.get("content")]
+    tool_names: Dict[str, str] = {}
+    contents: List[Dict] = []
+    for message in messages:
+        role = message["role"]
+        if role == "system":
+            continue
+        parts: List = []
+        if role == "assistant":
+            gemini_role = "model"
+            if message.get("content"):
+                parts.append(message["content"])
+            for call in message.get("tool_calls") or []:
+                function = call["function"]
+                tool_names[call.get("id", "")] = function["name"]
+                arguments = function.get("arguments") or "{}"
+                args = json.loads(arguments) if isinstance(arguments, str) else arguments
+                parts.append({"function_call": {"name": function["name"], "args": args}})
+        elif role == "tool":
+            gemini_role = "user"
+            name = message.get("name") or tool_names.get(message.get("tool_call_id", ""), "tool")
+            parts.append({"function_response": {"name": name, "response": _function_response(message.get("content"))}})
+        else:
+            gemini_role = "user"
+            parts.append(message.get("content") or "")
+        if not parts:
+            continue
+        if contents and contents[-1]["role"] == gemini_role:
+            contents[-1]["parts"].extend(parts)
+        else:
+            contents.append({"role": gemini_role, "parts": parts})
+
+    instruction = "\n\n".join(system) or None
+    if not contents:
+        # Only a system prompt: send it as the user turn
+        return None, [{"role": "user", "parts": [instruction or ""]}]
+    return instruction, contents
+
+
+# --- Gemini -> common.llm result ---
+
+def parse_response(response) -> Dict:
+    texts, calls = [], []
+    candidates = getattr(response, "candidates", None) or []
+    parts = candidates[0].content.parts if candidates else []
+    for index, part in enumerate(parts):
+        function_call = getattr(part, "function_call", None)
+        if function_call is not None and function_call.name:
+            args = type(function_call).to_dict(function_call).get("args") or {}
+            calls.append({
+                "id": getattr(function_call, "id", "") or f"call_{index}",
+                "type": "function",
+                "function": {"name": function_call.name, "arguments": json.dumps(args, ensure_ascii=False)},
+            })
+        elif getattr(part, "text", ""):
+            texts.append(part.text)
+
+    result = {"tool_calls": calls} if calls else {"content": "".join(texts) or EMPTY_REPLY}
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.prompt_token_count:
+        result["usage"] = {"prompt_tokens": usage.prompt_token_count,
+                           "completion_tokens": usage.candidates_token_count,
+                           "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0}
+    return result
+
+
+class ModelCache:
+    """LRU of GenerativeModel handles keyed by (model, system instruction, tools)"""
+
+    def __init__(self, size: int = GEMINI_MODEL_CACHE_SIZE):
+        self.size = size
+        self._models: "OrderedDict[Tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, system: Optional[str], tools: Optional[List[Dict]]):
+        key = (model, system, json.dumps(tools, sort_keys=True, ensure_ascii=False) if tools else None)
+        with self._lock:
+            handle = self._models.get(key)
+            if handle is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return handle
+            self.misses += 1
+        declarations = function_declarations(tools)
+        handle = sdk().GenerativeModel(
+            model,
+            system_instruction=system,
+            tools=[{"function_declarations": declarations}] if declarations else None,
+        )
+        with self._lock:
+            self._models[key] = handle
+            while len(self._models) > self.size:
+                self._models.popitem(last=False)
+        return handle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"models": len(self._models), "hits": self.hits, "misses": self.misses}
+
+
+models = ModelCache()
+
+
+def _request(messages: List[Dict], model: str, tools: Optional[List[Dict]], options: Optional[Dict]):
+    options = options or {}
+    system, contents = to_contents(messages)
+    generation_config = {"temperature": options.get("temperature", 0.7)}
+    if options.get("max_tokens"):
+        generation_config["max_output_tokens"] = options["max_tokens"]
+    kwargs = {
+        "generation_config": generation_config,
+        "request_options": {"timeout": options["timeout"]} if options.get("timeout") else None,
+    }
+    return models.get(model, system, tools), contents, kwargs
+
+
+def chat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+         options: Optional[Dict] = None) -> Dict:
+    handle, contents, kwargs = _request(messages, model, tools, options)
+    return parse_response(handle.generate_content(contents, **kwargs))
+
+
+async def achat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+                options: Optional[Dict] = None) -> Dict:
+    handle, contents, kwargs = _request(messages, model, tools, options)
+    return parse_response(await handle.generate_content_async(contents, **kwargs))
+
+
+async def astream(messages: List[Dict], model: str, options: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Yields text deltas as Gemini streams them"""
+    handle, contents, kwargs = _request(messages, model, None, options)
+    response = await handle.generate_content_async(contents, stream=True, **kwargs)
+    async for chunk in response:
+        for part in (chunk.candidates[0].content.parts if chunk.candidates else []):
+            if getattr(part, "text", ""):
+                yield part.text
+
+
+def stats() -> Dict:
+    return models.stats()
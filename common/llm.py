@@ -3,121 +3,754 @@ Provider-agnostic interface for Large Language Models.
 """
 import os
 import json
-from typing import List, Dict, Optional
+import math
+import asyncio
+import time
+import random
+import threading
+import contextvars
+import concurrent.futures
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Optional, Iterator, Tuple, AsyncIterator, Callable
 import logging
 
-from openai import OpenAI
-import google.generativeai as genai
+from common import timing
+from common import local_llm
+from common import gemini_llm
+from common import token_ledger
+from common.resilience import CircuitBreaker, LatencyWindow
 
 logger = logging.getLogger(__name__)
 
+# Provider SDKs (openai, google.generativeai, tiktoken) are imported the first
+# time they are needed: together they cost ~1.3 s at import, which every
+# service importing this module used to pay even with LLM_PROVIDER=stub.
+# preload_providers() warms the SDKs of the configured routes in the background.
 openai_client = None
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+_sdk_lock = threading.Lock()
 
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo") # Default model
 
-def chat(messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
+# --- Provider routing: failover + hedging ---
+# LLM_FALLBACK_PROVIDERS is an ordered list of "provider" or "provider:model"
+# entries tried after LLM_PROVIDER, e.g. "gemini:gemini-1.5-flash,openai:gpt-4o-mini".
+# Add "stub" explicitly if canned answers are acceptable as a last resort.
+LLM_FALLBACK_PROVIDERS = os.getenv("LLM_FALLBACK_PROVIDERS", "")
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "250"))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-1.5-flash",
+    "vllm": None,  # whatever model the server was started with: set LLM_MODEL or "vllm:<model>"
+    "ollama": "llama3.1",
+    "stub": "stub",
+}
+
+
+class LLMUnavailableError(RuntimeError):
+    """Every configured provider failed or has its circuit breaker open"""
+
+
+def _local_provider(name: str):
+    def call(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None, options: Optional[Dict] = None) -> Dict:
+        return local_llm.chat(name, messages, model, tools, options)
+    return call
+
+
+def _stub_provider(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None, options: Optional[Dict] = None) -> Dict:
+    return simulated_stub_chat(messages, tools)
+
+
+def _openai_sdk_client():
+    global openai_client
+    with _sdk_lock:
+        if openai_client is None:
+            from openai import OpenAI
+            openai_client = OpenAI(base_url=os.getenv("OPENAI_BASE_URL"))
+        return openai_client
+
+
+# Loaders run once per provider before its first call (SDK import / client setup)
+_PROVIDER_LOADERS = {
+    "openai": _openai_sdk_client,
+    "gemini": gemini_llm.sdk,
+}
+
+
+def preload_providers() -> List[str]:
     """
-    Sends a chat request to the configured LLM provider.
+    Import the SDKs of every configured route (all profiles) now instead of on
+    the first request. Meant to run in a background thread after startup.
     """
-    provider = os.getenv("LLM_PROVIDER", "stub").lower()
+    names = {provider for name in PROFILE_DEFAULTS for provider, _ in configured_routes(model_profile(name))}
+    loaded = []
+    for name in sorted(names):
+        loader = _PROVIDER_LOADERS.get(name)
+        if loader is None:
+            continue
+        try:
+            loader()
+            loaded.append(name)
+        except Exception as e:
+            logger.warning("Could not preload LLM provider %s: %s", name, e)
+    return loaded
+
 
-    if provider == "openai":
-        model = LLM_MODEL if LLM_MODEL != "gpt-3.5-turbo" else "gpt-4o-mini"
-        return _openai_chat(messages, model, tools)
-    elif provider == "gemini":
-        model = LLM_MODEL if LLM_MODEL != "gpt-3.5-turbo" else "gemini-1.5-flash"
-        return _gemini_chat(messages, model, tools)
-    elif provider == "vllm":
-        raise NotImplementedError("vLLM provider not yet implemented.")
-    elif provider == "ollama":
-        raise NotImplementedError("Ollama provider not yet implemented.")
+def _providers() -> Dict:
+    return {
+        "openai": _openai_chat,
+        "gemini": _gemini_chat,
+        "vllm": _local_provider("vllm"),
+        "ollama": _local_provider("ollama"),
+        "stub": _stub_provider,
+    }
+
+
+_invalid_route_entries: set = set()
+
+
+def _parse_route(entry: str, model: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """(provider, model), or None (logged once) for an unknown provider name"""
+    provider, _, entry_model = entry.strip().partition(":")
+    # Model ids are case-sensitive on self-hosted servers (e.g. Qwen/Qwen2.5-7B-Instruct)
+    provider = provider.lower()
+    if provider not in DEFAULT_MODELS:
+        # A typo must not silently turn production into canned stub replies
+        if entry not in _invalid_route_entries:
+            _invalid_route_entries.add(entry)
+            logger.error("Unknown LLM provider %r in route %r (known: %s); route skipped",
+                         provider, entry.strip(), ", ".join(sorted(DEFAULT_MODELS)))
+        return None
+    return provider, entry_model or model or DEFAULT_MODELS[provider] or LLM_MODEL
+
+
+def configured_routes(profile: Optional[Dict] = None) -> List[Tuple[str, str]]:
+    """(provider, model) pairs in failover order, primary first; unknown providers are skipped"""
+    if profile and profile.get("routes"):
+        entries = profile["routes"].split(",")
+        routes = []
     else:
-        return stub_chat(messages, tools)
+        primary = os.getenv("LLM_PROVIDER") or "stub"
+        primary_model = LLM_MODEL if LLM_MODEL != "gpt-3.5-turbo" else None
+        route = _parse_route(primary, primary_model)
+        routes = [route] if route else []
+        entries = os.getenv("LLM_FALLBACK_PROVIDERS", LLM_FALLBACK_PROVIDERS).split(",")
+    for entry in entries:
+        if entry.strip():
+            route = _parse_route(entry)
+            if route and route not in routes:
+                routes.append(route)
+    if not routes:
+        raise ValueError(f"No valid LLM provider configured (known: {', '.join(sorted(DEFAULT_MODELS))}); "
+                         "check LLM_PROVIDER / LLM_FALLBACK_PROVIDERS / LLM_PROFILE_*_ROUTES")
+    return routes
+
+
+# --- Per-call-site model profiles ---
+# Agents name the kind of call they make; each profile has its own generation
+# options and may pin its own routes (same "provider[:model]" list syntax as
+# LLM_FALLBACK_PROVIDERS, primary first), e.g. a small on-prem model for
+# classification:
+#   LLM_PROFILE_CLASSIFY_ROUTES=vllm:Qwen/Qwen2.5-1.5B-Instruct,openai:gpt-4o-mini
+# Override any field with LLM_PROFILE_<NAME>_ROUTES / _MAX_TOKENS / _TEMPERATURE / _TIMEOUT.
+PROFILE_DEFAULTS = {
+    # Short JSON decisions: routing, query rewriting, tool/parameter extraction
+    "classify": {"temperature": 0.0, "max_tokens": 400, "timeout": 20.0},
+    # User-facing answers (previous behaviour of every call)
+    "generate": {"temperature": 0.7, "max_tokens": None, "timeout": None},
+    # CriticAgent scoring
+    "evaluate": {"temperature": 0.0, "max_tokens": 2000, "timeout": 60.0},
+}
+DEFAULT_PROFILE = "generate"
+
+# USD per 1K (prompt, completion) tokens for the cost estimate in stats();
+# extend/override with LLM_PRICES='{"model": [prompt, completion]}'. Self-hosted models cost 0.
+DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gemini-1.5-flash": (0.000075, 0.0003),
+    "gemini-1.5-pro": (0.00125, 0.005),
+}
+
+
+def model_profile(name: Optional[str] = None) -> Dict:
+    """Resolved settings of a profile; unknown names get the generate profile"""
+    name = name if name in PROFILE_DEFAULTS else DEFAULT_PROFILE
+    base = PROFILE_DEFAULTS[name]
+    prefix = f"LLM_PROFILE_{name.upper()}_"
+
+    def setting(key: str, cast):
+        value = os.getenv(prefix + key.upper())
+        return cast(value) if value else base[key]
+
+    return {
+        "name": name,
+        "routes": os.getenv(prefix + "ROUTES", ""),
+        "temperature": setting("temperature", float),
+        "max_tokens": setting("max_tokens", int),
+        "timeout": setting("timeout", float),
+    }
+
+
+def _prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    try:
+        prices.update({k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICES") or "{}").items()})
+    except (ValueError, TypeError):
+        logger.warning("Ignoring invalid LLM_PRICES")
+    return prices
+
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """Local token count: tiktoken's cl100k_base when installed, else ~4 characters per token"""
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken  # optional dependency
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            pass
+        except Exception as e:  # encoding files are downloaded on first use
+            logger.warning("tiktoken unavailable, estimating tokens from length: %s", e)
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return _estimate_tokens(text)
+
+
+def usage_of(messages: List[Dict], result: Dict) -> Tuple[int, int, float, bool]:
+    """(prompt tokens, completion tokens, est. cost USD, estimated?) of one call"""
+    usage = result.get("usage") or {}
+    estimated = not (usage.get("prompt_tokens") and usage.get("completion_tokens"))
+    prompt = usage.get("prompt_tokens") or sum(count_tokens(m.get("content") or "") for m in messages)
+    completion = usage.get("completion_tokens") or count_tokens(result.get("content") or "")
+    provider, _, model = (result.get("provider") or "").partition(":")
+    price = (0.0, 0.0) if provider in local_llm.DEFAULT_BASE_URLS else _prices().get(model, (0.0, 0.0))
+    return prompt, completion, prompt / 1000 * price[0] + completion / 1000 * price[1], estimated
+
+
+class ProfileStats:
+    """Latency, token and cost totals of one profile"""
+
+    def __init__(self):
+        self.latency = LatencyWindow(min_samples=1)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, messages: List[Dict], result: Dict, seconds: float) -> None:
+        prompt, completion, cost, _ = usage_of(messages, result)
+        self.latency.add(seconds)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cost_usd += cost
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            **self.latency.stats(),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "est_cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class PromptCacheStats:
+    """
+    Provider-side prompt (prefix) caching per calling agent: prompt tokens the
+    provider reported as served from its cache (hit_ratio = cached / prompt
+    tokens) next to static_share, the fraction of prompt characters in the
+    leading system message, i.e. roughly the most that could be cached.
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, agent: str, messages: List[Dict], result: Dict) -> None:
+        usage = result.get("usage") or {}
+        prompt = usage.get("prompt_tokens") or sum(_estimate_tokens(m.get("content") or "") for m in messages)
+        cached = usage.get("cached_tokens") or 0
+        chars = [len(m.get("content") or "") for m in messages]
+        static = chars[0] if messages and messages[0].get("role") == "system" else 0
+        with self._lock:
+            row = self._agents.setdefault(agent, {
+                "calls": 0, "cache_hits": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                "static_chars": 0, "prompt_chars": 0,
+            })
+            row["calls"] += 1
+            row["cache_hits"] += int(cached > 0)
+            row["prompt_tokens"] += prompt
+            row["cached_tokens"] += cached
+            row["static_chars"] += static
+            row["prompt_chars"] += sum(chars)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = {agent: dict(row) for agent, row in self._agents.items()}
+        return {
+            agent: {
+                "calls": row["calls"],
+                "cache_hits": row["cache_hits"],
+                "prompt_tokens": row["prompt_tokens"],
+                "cached_tokens": row["cached_tokens"],
+                "hit_ratio": round(row["cached_tokens"] / row["prompt_tokens"], 3) if row["prompt_tokens"] else 0.0,
+                "static_share": round(row["static_chars"] / row["prompt_chars"], 3) if row["prompt_chars"] else 0.0,
+            }
+            for agent, row in sorted(rows.items())
+        }
+
+
+class LLMRouter:
+    """
+    Sends each chat to the first healthy route and, when the primary is slower
+    than its rolling p95, fires a hedged request at the next healthy route and
+    keeps whichever answers first. Errors fail over down the route list; each
+    route has its own circuit breaker so a dead provider is skipped quickly.
+    """
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyWindow] = {}
+        self._served: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._hedges_fired = 0
+        self._hedges_won = 0
+        self._profiles: Dict[str, ProfileStats] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _key(route: Tuple[str, str]) -> str:
+        return f"{route[0]}:{route[1]}"
+
+    def _breaker(self, route: Tuple[str, str]) -> CircuitBreaker:
+        key = self._key(route)
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+                self._latency[key] = LatencyWindow(min_samples=LLM_HEDGE_MIN_SAMPLES)
+            return self._breakers[key]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def _count(self, counter: Dict[str, int], key: str) -> None:
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+    def _hedge_delay(self, route: Tuple[str, str]) -> Optional[float]:
+        if not LLM_HEDGE_ENABLED:
+            return None
+        self._breaker(route)
+        p = self._latency[self._key(route)].percentile(LLM_HEDGE_PERCENTILE)
+        if p is None:
+            return None
+        return max(p, LLM_HEDGE_MIN_DELAY_MS / 1000)
+
+    def _call(self, route: Tuple[str, str], messages: List[Dict], tools: Optional[List[Dict]],
+              options: Optional[Dict] = None) -> Dict:
+        key = self._key(route)
+        breaker = self._breaker(route)
+        started = time.perf_counter()
+        try:
+            result = _providers()[route[0]](messages, route[1], tools, options)
+        except Exception:
+            breaker.record_failure()
+            self._count(self._errors, key)
+            raise
+        breaker.record_success()
+        self._latency[key].add(time.perf_counter() - started)
+        return result
 
-def _openai_chat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None) -> Dict:
+    def _next_route(self, pending: List[Tuple[str, str]]) -> Optional[Tuple[str, str]]:
+        while pending:
+            route = pending.pop(0)
+            if self._breaker(route).allow_request():
+                return route
+        return None
+
+    def _served_by(self, result: Dict, route: Tuple[str, str], path: str) -> Dict:
+        key = self._key(route)
+        self._count(self._served, f"{key}:{path}")
+        result = dict(result)
+        result["provider"] = key
+        result["served_by"] = path
+        if path != "primary":
+            logger.info("LLM call served by %s (%s)", key, path)
+        return result
+
+    def _profile_stats(self, name: str) -> ProfileStats:
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = ProfileStats()
+            return self._profiles[name]
+
+    def chat(self, messages: List[Dict], tools: Optional[List[Dict]] = None, profile: Optional[str] = None) -> Dict:
+        settings = model_profile(profile)
+        stats = self._profile_stats(settings["name"])
+        started = time.perf_counter()
+        try:
+            result = self._chat(messages, tools, settings)
+        except Exception:
+            stats.record_error()
+            raise
+        stats.record(messages, result, time.perf_counter() - started)
+        return result
+
+    def _chat(self, messages: List[Dict], tools: Optional[List[Dict]], profile: Dict) -> Dict:
+        options = {k: profile[k] for k in ("temperature", "max_tokens", "timeout")}
+        pending = configured_routes(profile)
+        primary = pending[0]
+        last_error: Optional[BaseException] = None
+        path = "primary"
+
+        while True:
+            route = self._next_route(pending)
+            if route is None:
+                raise LLMUnavailableError(f"All LLM providers failed: {last_error!r}") from last_error
+            if route != primary and path == "primary":
+                path = "failover"
+
+            delay = self._hedge_delay(route)
+            hedge_candidates = [r for r in pending if self._breaker(r).available()]
+            if delay is None or not hedge_candidates:
+                try:
+                    return self._served_by(self._call(route, messages, tools, options), route, path)
+                except Exception as e:
+                    logger.warning("LLM provider %s failed: %s", self._key(route), e)
+                    last_error = e
+                    continue
+
+            # Hedged: give the route until its p95, then race the next healthy route
+            pool = self._pool()
+            in_flight = {pool.submit(self._call, route, messages, tools, options): (route, path)}
+            done, _ = wait(in_flight, timeout=delay)
+            if not done:
+                hedge = self._next_route(pending)
+                if hedge is not None:
+                    with self._lock:
+                        self._hedges_fired += 1
+                    in_flight[pool.submit(self._call, hedge, messages, tools, options)] = (hedge, "hedge")
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    served_route, served_path = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning("LLM provider %s failed: %s", self._key(served_route), e)
+                        last_error = e
+                        continue
+                    if served_path == "hedge":
+                        with self._lock:
+                            self._hedges_won += 1
+                    # The slower request keeps running in its worker thread; its result is dropped
+                    return self._served_by(result, served_route, served_path)
+            path = "failover"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            keys = list(self._breakers)
+            served = dict(self._served)
+            errors = dict(self._errors)
+            hedges = {"fired": self._hedges_fired, "won": self._hedges_won}
+            profiles = dict(self._profiles)
+        return {
+            "routes": [self._key(r) for r in configured_routes()],
+            "profiles": {
+                name: {"routes": [self._key(r) for r in configured_routes(model_profile(name))], **p.stats()}
+                for name, p in profiles.items()
+            },
+            "hedging": hedges,
+            "served": served,
+            "errors": errors,
+            "breakers": {k: self._breakers[k].stats() for k in keys},
+            "latency": {k: self._latency[k].stats() for k in keys},
+        }
+
+
+router = LLMRouter()
+prompt_cache = PromptCacheStats()
+
+
+def stats() -> Dict:
+    return {**router.stats(), "local_batching": local_llm.stats(),
+            "gemini_models": gemini_llm.stats(), "prompt_cache": prompt_cache.stats(),
+            "tokens": token_ledger.stats.stats()}
+
+
+# (event loop, on_delta) set by stream_to(); see chat()
+_delta_sink: contextvars.ContextVar[Optional[Tuple[asyncio.AbstractEventLoop, Callable[[str], None]]]] = \
+    contextvars.ContextVar("llm_delta_sink", default=None)
+
+
+@contextmanager
+def stream_to(on_delta: Callable[[str], None], loop: asyncio.AbstractEventLoop):
+    """
+    While active, user-facing chat() calls ("generate" profile, no tools) made
+    from this context stream their reply: each delta is passed to on_delta,
+    which runs on `loop`. `loop` must not be blocked by the caller (e.g. the
+    gateway's main loop when the agents run in a worker thread). on_delta may
+    raise asyncio.CancelledError to stop the generation.
+    """
+    token = _delta_sink.set((loop, on_delta))
+    try:
+        yield
+    finally:
+        _delta_sink.reset(token)
+
+
+def chat(messages: List[Dict], tools: Optional[List[Dict]] = None, profile: Optional[str] = None,
+         agent: Optional[str] = None) -> Dict:
+    """
+    Sends a chat request to the configured LLM provider, failing over to
+    LLM_FALLBACK_PROVIDERS and hedging slow calls (see LLMRouter).
+    `profile` (classify|generate|evaluate) selects the routes and generation
+    options for this call site, see PROFILE_DEFAULTS. `agent` labels the
+    caller in the prompt cache stats and the request's token ledger.
+    The result carries "provider" and "served_by" (primary|hedge|failover);
+    "usage" includes "cached_tokens" when the provider reports them.
+    Inside stream_to(), "generate" calls stream their reply to the sink.
+    """
+    sink = _delta_sink.get()
+    with timing.stage("llm"):
+        if sink is not None and not tools and model_profile(profile)["name"] == "generate":
+            result = _streamed_chat(messages, profile, *sink)
+        else:
+            result = router.chat(messages, tools, profile)
+    prompt_cache.record(agent or "unknown", messages, result)
+    if token_ledger.current() is not None:
+        prompt, completion, cost, estimated = usage_of(messages, result)
+        token_ledger.record(agent or "unknown", model_profile(profile)["name"], prompt, completion, cost, estimated)
+    return result
+
+
+def _native_stream(messages: List[Dict], settings: Dict) -> Tuple[Tuple[str, str], Optional[AsyncIterator[str]]]:
+    """(primary route, its native stream or None when it cannot stream)"""
+    provider, model = configured_routes(settings)[0]
+    options = {k: settings[k] for k in ("temperature", "max_tokens", "timeout")}
+    stream = None
+    if router._breaker((provider, model)).available():
+        if provider in local_llm.DEFAULT_BASE_URLS:
+            stream = local_llm.get_provider(provider).astream(messages, model, options=options)
+        elif provider == "gemini" and gemini_llm.GOOGLE_API_KEY:
+            stream = gemini_llm.astream(messages, model, options=options)
+    return (provider, model), stream
+
+
+def _streamed_chat(messages: List[Dict], profile: Optional[str], loop: asyncio.AbstractEventLoop,
+                   on_delta: Callable[[str], None]) -> Dict:
+    """
+    chat() for a thread whose own loop is blocked: the primary route's stream
+    is consumed on `loop`. Without a native stream, or when it fails before
+    the first delta, the router answers and the reply is one delta.
+    """
+    route, stream = _native_stream(messages, model_profile(profile))
+    parts: List[str] = []
+    if stream is not None:
+        async def consume() -> None:
+            async for delta in stream:
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+
+        try:
+            asyncio.run_coroutine_threadsafe(consume(), loop).result()
+            return {"content": "".join(parts), "provider": f"{route[0]}:{route[1]}", "served_by": "primary"}
+        except concurrent.futures.CancelledError:
+            raise asyncio.CancelledError()
+        except Exception as e:
+            if parts:
+                raise
+            logger.warning("Streaming from %s failed, falling back to chat(): %s", route[0], e)
+    result = router.chat(messages, None, profile)
+    if result.get("content"):
+        future = asyncio.run_coroutine_threadsafe(_deliver(on_delta, result["content"]), loop)
+        try:
+            future.result()
+        except concurrent.futures.CancelledError:
+            raise asyncio.CancelledError()
+    return result
+
+
+async def _deliver(on_delta: Callable[[str], None], delta: str) -> None:
+    on_delta(delta)
+
+
+async def astream_chat(messages: List[Dict], profile: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streams the reply as it is generated when the primary route is a
+    self-hosted provider (vllm/ollama) or Gemini. Other providers, or a stream that fails
+    before its first delta, go through chat() (failover, hedging) in a worker
+    thread and yield the whole reply at once.
+    """
+    (provider, _), stream = _native_stream(messages, model_profile(profile))
+    if stream is not None:
+        started = False
+        try:
+            async for delta in stream:
+                started = True
+                yield delta
+            return
+        except Exception as e:
+            if started:
+                raise
+            logger.warning("Streaming from %s failed, falling back to chat(): %s", provider, e)
+    result = await asyncio.to_thread(chat, messages, None, profile)
+    yield result.get("content") or ""
+
+def _openai_chat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+                 options: Optional[Dict] = None) -> Dict:
     """
     Handles the chat completion call to OpenAI.
     """
-    global openai_client
-    if openai_client is None:
-        openai_client = OpenAI(
-            base_url=os.getenv("OPENAI_BASE_URL")
-        )
+    options = options or {}
+    client = _openai_sdk_client()
         
     try:
-        response = openai_client.chat.completions.create(
+        limits = {k: options[k] for k in ("max_tokens", "timeout") if options.get(k)}
+        response = client.chat.completions.create(
             model=model,
             messages=messages,
             tools=tools,
             tool_choice="auto" if tools else None,
-            temperature=0.7,
+            temperature=options.get("temperature", 0.7),
+            **limits,
         )
         message = response.choices[0].message
         if message.tool_calls:
-            return {"tool_calls": [tc.model_dump() for tc in message.tool_calls]}
-        return {"content": message.content}
+            result = {"tool_calls": [tc.model_dump() for tc in message.tool_calls]}
+        else:
+            result = {"content": message.content}
+        if response.usage:
+            details = getattr(response.usage, "prompt_tokens_details", None)
+            result["usage"] = {"prompt_tokens": response.usage.prompt_tokens,
+                               "completion_tokens": response.usage.completion_tokens,
+                               "cached_tokens": getattr(details, "cached_tokens", None) or 0}
+        return result
     except Exception as e:
         logger.exception("Error calling OpenAI API")
-        return stub_chat(messages, tools)
+        raise
 
-def _gemini_chat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None) -> Dict:
+def _gemini_chat(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+                 options: Optional[Dict] = None) -> Dict:
     """
-    Handles the chat completion call to Google Gemini.
+    Handles the chat completion call to Google Gemini (see common.gemini_llm).
     """
-    if not GOOGLE_API_KEY:
-        logger.error("GOOGLE_API_KEY not found. Falling back to stub.")
-        return stub_chat(messages, tools)
-    
+    if not gemini_llm.GOOGLE_API_KEY:
+        raise RuntimeError("GOOGLE_API_KEY not found")
     try:
-        # Convert messages to Gemini's format (history + current message)
-        # Note: Gemini's message format is slightly different. Roles are 'user' and 'model'.
-        gemini_messages = []
-        for msg in messages:
-            role = msg["role"]
-            if role == "system":
-                # Gemini doesn't have a 'system' role in the same way. We prepend it to the first user message.
-                # This is a common workaround.
-                if gemini_messages:
-                     gemini_messages[0]['parts'].insert(0, msg["content"])
-                else: # if the system prompt is the very first message
-                    gemini_messages.append({'role': 'user', 'parts': [msg["content"]]})
-            elif role == "user":
-                if gemini_messages and gemini_messages[-1]['role'] == 'user':
-                     gemini_messages[-1]['parts'].append(msg["content"])
-                else:
-                    gemini_messages.append({'role': 'user', 'parts': [msg["content"]]})
-            elif role == "assistant":
-                gemini_messages.append({'role': 'model', 'parts': [msg["content"]]})
-        
-        gemini_model = genai.GenerativeModel(model)
-        response = gemini_model.generate_content(
-            gemini_messages,
-            tools=tools
-        )
-
-        # Extract content from the response
-        # This part might need adjustment based on the exact response structure for your model version
-        if response.candidates and response.candidates[0].content.parts:
-            # For now, we assume the content is text and return it.
-            # If the model returns a tool call, you would handle it here.
-            # Gemini tool call handling is different from OpenAI's.
-            
-            # Simple text extraction
-            first_part = response.candidates[0].content.parts[0]
-            if hasattr(first_part, 'text'):
-                return {"content": first_part.text}
-            # TODO: Add proper handling for Gemini tool calls if needed
-            
-        return {"content": "Sorry, I could not process the response from Gemini."}
-
+        return gemini_llm.chat(messages, model, tools, options)
     except Exception as e:
         logger.exception("Error calling Gemini API")
+        raise
+
+# --- Latency-simulating stub (load testing) ---
+# With the defaults the stub answers instantly, as before. For load tests set e.g.
+#   STUB_LLM_LATENCY_DIST=lognormal STUB_LLM_TTFT_MS=400 STUB_LLM_TOKENS_PER_SEC=60 STUB_LLM_ERROR_RATE=0.01
+
+class StubLLMError(RuntimeError):
+    """Error injected by the latency-simulating stub provider"""
+
+
+_stub_rng = random.Random(int(os.environ["STUB_LLM_SEED"])) if os.getenv("STUB_LLM_SEED") else random.Random()
+
+def _stub_settings() -> Dict:
+    # Read on every call so a load-test runner can retune the stub between runs
+    return {
+        "dist": os.getenv("STUB_LLM_LATENCY_DIST", "none").lower(),
+        "ttft_ms": float(os.getenv("STUB_LLM_TTFT_MS", "300")),
+        "jitter_ms": float(os.getenv("STUB_LLM_TTFT_JITTER_MS", "100")),
+        "tokens_per_sec": float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "0")),
+        "error_rate": float(os.getenv("STUB_LLM_ERROR_RATE", "0")),
+    }
+
+def _sample_ttft(settings: Dict) -> float:
+    """Time to first token in seconds for the configured distribution"""
+    dist, mean, jitter = settings["dist"], settings["ttft_ms"], settings["jitter_ms"]
+    if dist == "fixed":
+        ms = mean
+    elif dist == "uniform":
+        ms = _stub_rng.uniform(mean - jitter, mean + jitter)
+    elif dist == "normal":
+        ms = _stub_rng.gauss(mean, jitter)
+    elif dist == "lognormal":
+        # Long right tail like real providers; jitter is the standard deviation
+        variance = (jitter / mean) ** 2 if mean > 0 else 0.0
+        sigma = math.sqrt(math.log1p(variance))
+        mu = math.log(max(mean, 1e-3)) - sigma ** 2 / 2
+        ms = _stub_rng.lognormvariate(mu, sigma)
+    else:
+        ms = 0.0
+    return max(ms, 0.0) / 1000
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def _maybe_inject_error(settings: Dict) -> None:
+    if settings["error_rate"] > 0 and _stub_rng.random() < settings["error_rate"]:
+        raise StubLLMError("Injected stub LLM failure")
+
+def simulated_stub_chat(messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
+    """
+    stub_chat with simulated provider latency (TTFT + token generation) and
+    error injection. Blocks the calling thread like the synchronous SDK calls do.
+    """
+    settings = _stub_settings()
+    if settings["dist"] == "none" and settings["tokens_per_sec"] <= 0 and settings["error_rate"] <= 0:
         return stub_chat(messages, tools)
 
+    _maybe_inject_error(settings)
+    result = stub_chat(messages, tools)
+    delay = _sample_ttft(settings)
+    if settings["tokens_per_sec"] > 0:
+        delay += _estimate_tokens(result.get("content") or "") / settings["tokens_per_sec"]
+    time.sleep(delay)
+    return result
+
+def stub_chat_stream(messages: List[Dict], tools: Optional[List[Dict]] = None) -> Iterator[str]:
+    """Streams the stub reply word by word at STUB_LLM_TOKENS_PER_SEC after the first-token delay"""
+    settings = _stub_settings()
+    _maybe_inject_error(settings)
+    content = stub_chat(messages, tools).get("content") or ""
+    time.sleep(_sample_ttft(settings))
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        chunk = word if i == 0 else " " + word
+        if settings["tokens_per_sec"] > 0:
+            time.sleep(_estimate_tokens(chunk) / settings["tokens_per_sec"])
+        yield chunk
+
 def stub_chat(messages: List[Dict], tools: Optional[List[Dict]] = None) -> Dict:
     """
     A simple rule-based stub for the chat function that works with multi-agent system.
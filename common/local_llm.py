@@ -0,0 +1,274 @@
+"""
+Self-hosted LLM providers (vLLM, Ollama) through their OpenAI-compatible HTTP API.
+
+- One pooled httpx.Client per provider (keep-alive connections are reused
+  across calls and threads) plus an httpx.AsyncClient for async streaming.
+- Short prompts without tools (routing / classification decisions) go through
+  a micro-batcher: calls arriving within LOCAL_LLM_BATCH_WINDOW_MS are sent
+  together in one wave from a single event loop, so the server's continuous
+  batching schedules them as one batch, and identical prompts in the same
+  wave are sent once.
+
+Settings:
+    VLLM_BASE_URL / OLLAMA_BASE_URL   e.g. http://vllm:8000/v1, http://ollama:11434/v1
+    VLLM_API_KEY / OLLAMA_API_KEY     optional bearer token
+    LOCAL_LLM_TIMEOUT_SECONDS         per request (default 60)
+    LOCAL_LLM_MAX_CONNECTIONS         connection pool size per provider (default 32)
+    LOCAL_LLM_BATCH_WINDOW_MS         0 disables micro-batching (default 5)
+    LOCAL_LLM_BATCH_MAX               flush early at this many prompts (default 32)
+    LOCAL_LLM_BATCH_MAX_CHARS         prompts longer than this are sent directly (default 4000)
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LOCAL_LLM_TIMEOUT_SECONDS = float(os.getenv("LOCAL_LLM_TIMEOUT_SECONDS", "60"))
+LOCAL_LLM_MAX_CONNECTIONS = int(os.getenv("LOCAL_LLM_MAX_CONNECTIONS", "32"))
+LOCAL_LLM_BATCH_WINDOW_MS = float(os.getenv("LOCAL_LLM_BATCH_WINDOW_MS", "5"))
+LOCAL_LLM_BATCH_MAX = int(os.getenv("LOCAL_LLM_BATCH_MAX", "32"))
+LOCAL_LLM_BATCH_MAX_CHARS = int(os.getenv("LOCAL_LLM_BATCH_MAX_CHARS", "4000"))
+
+DEFAULT_BASE_URLS = {
+    "vllm": "http://localhost:8000/v1",
+    "ollama": "http://localhost:11434/v1",
+}
+
+
+def _parse_completion(data: Dict) -> Dict:
+    """OpenAI chat.completion JSON -> the dict shape common.llm.chat returns"""
+    message = (data.get("choices") or [{}])[0].get("message") or {}
+    result = {"tool_calls": message["tool_calls"]} if message.get("tool_calls") else {"content": message.get("content") or ""}
+    if data.get("usage"):
+        usage = dict(data["usage"])
+        # vLLM reports prefix-cache hits here (--enable-prompt-tokens-details); Ollama does not
+        usage["cached_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        result["usage"] = usage
+    return result
+
+
+class OpenAICompatibleProvider:
+    """Chat completions against one OpenAI-compatible server"""
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str] = None,
+                 timeout: float = LOCAL_LLM_TIMEOUT_SECONDS, max_connections: int = LOCAL_LLM_MAX_CONNECTIONS):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._timeout = timeout
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.client = httpx.Client(base_url=self.base_url, headers=self._headers,
+                                   timeout=timeout, limits=self._limits)
+
+    def async_client(self) -> httpx.AsyncClient:
+        # An AsyncClient is bound to the event loop that first uses it, so callers own theirs
+        return httpx.AsyncClient(base_url=self.base_url, headers=self._headers,
+                                 timeout=self._timeout, limits=self._limits)
+
+    @staticmethod
+    def payload(messages: List[Dict], model: str, tools: Optional[List[Dict]] = None, stream: bool = False,
+                options: Optional[Dict] = None) -> Dict:
+        options = options or {}
+        body = {"model": model, "messages": messages, "temperature": options.get("temperature", 0.7)}
+        if options.get("max_tokens"):
+            body["max_tokens"] = options["max_tokens"]
+        if tools:
+            body["tools"] = tools
+            body["tool_choice"] = "auto"
+        if stream:
+            body["stream"] = True
+        return body
+
+    def chat(self, messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+             options: Optional[Dict] = None) -> Dict:
+        response = self.client.post("/chat/completions", json=self.payload(messages, model, tools, options=options),
+                                    timeout=(options or {}).get("timeout") or self._timeout)
+        response.raise_for_status()
+        return _parse_completion(response.json())
+
+    async def achat(self, client: httpx.AsyncClient, messages: List[Dict], model: str,
+                    options: Optional[Dict] = None) -> Dict:
+        response = await client.post("/chat/completions", json=self.payload(messages, model, options=options),
+                                     timeout=(options or {}).get("timeout") or self._timeout)
+        response.raise_for_status()
+        return _parse_completion(response.json())
+
+    async def astream(self, messages: List[Dict], model: str, client: Optional[httpx.AsyncClient] = None,
+                      options: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Yields content deltas as the server streams them (server-sent events)"""
+        owned = client is None
+        client = client or self.async_client()
+        try:
+            async with client.stream("POST", "/chat/completions",
+                                     json=self.payload(messages, model, stream=True, options=options),
+                                     timeout=(options or {}).get("timeout") or self._timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = (json.loads(data).get("choices") or [{}])[0].get("delta") or {}
+                    if delta.get("content"):
+                        yield delta["content"]
+        finally:
+            if owned:
+                await client.aclose()
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class MicroBatcher:
+    """
+    Collects short chat prompts from any thread for `window` seconds (or until
+    `max_batch` are queued) and sends them together from one background event
+    loop. Callers block on a concurrent.futures.Future, like the sync SDKs.
+    """
+
+    def __init__(self, provider: OpenAICompatibleProvider, window: float, max_batch: int):
+        self.provider = provider
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Tuple, Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        self.stats = {"batches": 0, "prompts": 0, "requests": 0, "deduplicated": 0, "max_batch": 0}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=f"{self.provider.name}-batcher", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, messages: List[Dict], model: str, options: Optional[Dict] = None) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._enqueue(messages, model, options), self._ensure_loop())
+
+    def chat(self, messages: List[Dict], model: str, options: Optional[Dict] = None) -> Dict:
+        return self.submit(messages, model, options).result()
+
+    async def _enqueue(self, messages: List[Dict], model: str, options: Optional[Dict] = None) -> Dict:
+        key = (model, json.dumps([messages, options], ensure_ascii=False, sort_keys=True))
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((key, {"messages": messages, "model": model, "options": options}, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return dict(await future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[Tuple, Dict, asyncio.Future]]) -> None:
+        if self._client is None:
+            self._client = self.provider.async_client()
+        waiting: Dict[Tuple, List[asyncio.Future]] = {}
+        requests: Dict[Tuple, Dict] = {}
+        for key, request, future in batch:
+            waiting.setdefault(key, []).append(future)
+            requests.setdefault(key, request)
+
+        keys = list(requests)
+        results = await asyncio.gather(
+            *(self.provider.achat(self._client, **requests[k]) for k in keys),
+            return_exceptions=True,
+        )
+        for key, result in zip(keys, results):
+            for future in waiting[key]:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+        self.stats["batches"] += 1
+        self.stats["prompts"] += len(batch)
+        self.stats["requests"] += len(keys)
+        self.stats["deduplicated"] += len(batch) - len(keys)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+            self._client = None
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_providers: Dict[str, OpenAICompatibleProvider] = {}
+_batchers: Dict[str, MicroBatcher] = {}
+_registry_lock = threading.Lock()
+
+
+def get_provider(name: str) -> OpenAICompatibleProvider:
+    with _registry_lock:
+        if name not in _providers:
+            prefix = name.upper()
+            _providers[name] = OpenAICompatibleProvider(
+                name,
+                os.getenv(f"{prefix}_BASE_URL", DEFAULT_BASE_URLS[name]),
+                os.getenv(f"{prefix}_API_KEY"),
+            )
+        return _providers[name]
+
+
+def _batcher(name: str) -> MicroBatcher:
+    provider = get_provider(name)
+    with _registry_lock:
+        if name not in _batchers:
+            _batchers[name] = MicroBatcher(provider, LOCAL_LLM_BATCH_WINDOW_MS / 1000, LOCAL_LLM_BATCH_MAX)
+        return _batchers[name]
+
+
+def is_batchable(messages: List[Dict], tools: Optional[List[Dict]]) -> bool:
+    if tools or LOCAL_LLM_BATCH_WINDOW_MS <= 0:
+        return False
+    return sum(len(m.get("content") or "") for m in messages) <= LOCAL_LLM_BATCH_MAX_CHARS
+
+
+def chat(name: str, messages: List[Dict], model: str, tools: Optional[List[Dict]] = None,
+         options: Optional[Dict] = None) -> Dict:
+    """Blocking chat call used by common.llm's provider table"""
+    if is_batchable(messages, tools):
+        return _batcher(name).chat(messages, model, options)
+    return get_provider(name).chat(messages, model, tools, options)
+
+
+def stats() -> Dict:
+    with _registry_lock:
+        batchers = dict(_batchers)
+    return {name: dict(b.stats) for name, b in batchers.items()}
+
+
+def reset() -> None:
+    """Drop cached clients (tests / after changing *_BASE_URL)"""
+    with _registry_lock:
+        batchers, providers = list(_batchers.values()), list(_providers.values())
+        _batchers.clear()
+        _providers.clear()
+    for batcher in batchers:
+        batcher.close()
+    for provider in providers:
+        provider.close()
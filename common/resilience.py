@@ -0,0 +1,309 @@
+"""
+Resilience primitives shared by the services: circuit breakers, rolling
+latency windows and the `Upstream` wrapper for inter-service HTTP calls
+(adaptive timeouts, bounded retries with jitter, fail-fast when a breaker is open).
+
+Breakers and windows are thread-safe because the LLM providers are called from
+worker threads as well as from the event loop.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_TIMEOUT_MIN_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_MIN_SECONDS", "1.0"))
+UPSTREAM_TIMEOUT_MAX_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_MAX_SECONDS", "30"))
+UPSTREAM_TIMEOUT_PERCENTILE = float(os.getenv("UPSTREAM_TIMEOUT_PERCENTILE", "99"))
+UPSTREAM_TIMEOUT_MULTIPLIER = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BASE_MS = float(os.getenv("UPSTREAM_RETRY_BASE_MS", "100"))
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "15"))
+UPSTREAM_MAX_ROUTES = int(os.getenv("UPSTREAM_MAX_ROUTES", "32"))
+
+RETRYABLE_STATUS = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Path segments that are ids (123, uuids, hashes) do not make a new route
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,})$")
+OTHER_ROUTE = "other"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the breaker opens and refuses
+    calls for `reset_timeout` seconds; then a single trial call is let through
+    (half-open). Its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def available(self) -> bool:
+        """Whether a call would currently be allowed (does not reserve the half-open trial)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._trial_in_flight:
+                return False
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._state = HALF_OPEN
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """The call neither succeeded nor failed (e.g. cancelled); free the half-open trial"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._times_opened += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self._times_opened,
+        }
+
+
+class LatencyWindow:
+    """Rolling window of the last `size` call durations (seconds)"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None until `min_samples` calls were seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+        return ordered[rank]
+
+    def stats(self) -> Dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "samples": len(self._samples),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class UpstreamUnavailableError(httpx.RequestError, CircuitOpenError):
+    """
+    Raised instead of calling an upstream whose breaker is open. It is an
+    httpx.RequestError so existing `except httpx.RequestError` handlers
+    (503 / fallback answers) apply without waiting for a timeout.
+    """
+
+
+def route_of(method: str, url: str) -> str:
+    """Latency window name of a request: method and path, with id segments collapsed"""
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment
+                for segment in urlsplit(url).path.split("/")]
+    return f"{method.upper()} {'/'.join(segments) or '/'}"
+
+
+class Upstream:
+    """
+    One downstream dependency (policy, action, ticket, Whisper, ElevenLabs...).
+
+    The timeout adapts to observed latency: UPSTREAM_TIMEOUT_MULTIPLIER x the
+    rolling p99, clamped to [min_timeout, max_timeout]; until enough samples
+    exist max_timeout is used. Latency is tracked per route (request() uses
+    method + path, call() sites name theirs) so a cheap endpoint cannot pull
+    the timeout of a slow one down; at most UPSTREAM_MAX_ROUTES windows, later
+    routes share one. Idempotent calls are retried on connection errors,
+    timeouts and 502/503/504 with exponential backoff and full jitter. Server
+    errors and timeouts count against the circuit breaker (one per upstream).
+    """
+
+    def __init__(self, name: str, *, min_timeout: float = None, max_timeout: float = None,
+                 retries: int = None, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.min_timeout = UPSTREAM_TIMEOUT_MIN_SECONDS if min_timeout is None else min_timeout
+        self.max_timeout = UPSTREAM_TIMEOUT_MAX_SECONDS if max_timeout is None else max_timeout
+        self.retries = UPSTREAM_RETRIES if retries is None else retries
+        self.breaker = CircuitBreaker(
+            name,
+            UPSTREAM_BREAKER_FAILURES if failure_threshold is None else failure_threshold,
+            UPSTREAM_BREAKER_RESET_SECONDS if reset_timeout is None else reset_timeout,
+        )
+        # Window of call() sites that do not name a route
+        self.latency = LatencyWindow()
+        self._windows: Dict[str, LatencyWindow] = {"": self.latency}
+        self._windows_lock = threading.Lock()
+        self._calls = 0
+        self._retries = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    def window(self, route: str = "", create: bool = True) -> Optional[LatencyWindow]:
+        with self._windows_lock:
+            window = self._windows.get(route)
+            if window is None and len(self._windows) >= UPSTREAM_MAX_ROUTES:
+                route = OTHER_ROUTE
+                window = self._windows.get(route)
+            if window is None and create:
+                window = self._windows[route] = LatencyWindow()
+            return window
+
+    def timeout(self, route: str = "") -> float:
+        window = self.window(route, create=False)
+        p = window.percentile(UPSTREAM_TIMEOUT_PERCENTILE) if window is not None else None
+        if p is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p * UPSTREAM_TIMEOUT_MULTIPLIER))
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, UPSTREAM_RETRY_BASE_MS / 1000 * (2 ** attempt))
+
+    async def call(self, func: Callable[[float], Awaitable], *, retries: int = 0, route: str = ""):
+        """
+        Run `func(timeout)` under the breaker. `func` must honour the timeout it
+        is given (e.g. pass it to httpx). If it returns an httpx.Response, 5xx
+        statuses count as failures and 502/503/504 are retried. `route` names
+        the latency window the timeout comes from and the duration goes to.
+        """
+        window = self.window(route)
+        attempt = 0
+        while True:
+            if not self.breaker.allow_request():
+                self._rejected += 1
+                raise UpstreamUnavailableError(f"{self.name} circuit breaker is open")
+            self._calls += 1
+            started = time.perf_counter()
+            try:
+                result = await func(self.timeout(route))
+            except (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)):
+                    self._timeouts += 1
+                if attempt >= retries:
+                    raise
+                logger.warning("%s call failed (%s), retrying", self.name, e)
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            else:
+                status = getattr(result, "status_code", None)
+                if status is None or status < 500:
+                    self.breaker.record_success()
+                    window.add(time.perf_counter() - started)
+                    return result
+                self.breaker.record_failure()
+                if status not in RETRYABLE_STATUS or attempt >= retries:
+                    return result
+                await result.aclose()
+                logger.warning("%s returned %s, retrying", self.name, status)
+            attempt += 1
+            self._retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, *,
+                      idempotent: Optional[bool] = None, route: Optional[str] = None,
+                      **kwargs) -> httpx.Response:
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        return await self.call(
+            lambda timeout: client.request(method, url, timeout=timeout, **kwargs),
+            retries=self.retries if idempotent else 0,
+            route=route_of(method, url) if route is None else route,
+        )
+
+    def stats(self) -> Dict:
+        with self._windows_lock:
+            windows = [(route, window) for route, window in self._windows.items() if route or len(window)]
+        return {
+            "breaker": self.breaker.stats(),
+            "latency": {route or "default": window.stats() for route, window in windows},
+            "timeout_s": {route or "default": round(self.timeout(route), 3) for route, _window in windows},
+            "calls": self._calls,
+            "retries": self._retries,
+            "rejected": self._rejected,
+            "timeouts": self._timeouts,
+        }
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name: str, **settings) -> Upstream:
+    """Process-wide Upstream for `name`; settings only apply on first use"""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(name, **settings)
+        return _upstreams[name]
+
+
+def upstream_stats() -> Dict:
+    with _upstreams_lock:
+        items = list(_upstreams.items())
+    return {name: u.stats() for name, u in items}
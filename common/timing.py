@@ -0,0 +1,102 @@
+"""
+Per-request stage timing reported through the Server-Timing header.
+
+Code on the request path wraps its stages with `stage("name")` (or calls
+`record`); ServerTimingMiddleware collects them per request and emits
+
+    Server-Timing: history_load;dur=0.8, llm;dur=412.3, agents;dur=430.1
+
+Stages recorded more than once (e.g. several LLM calls) are summed. Outside
+of a request (scripts, tests) recording is a no-op.
+
+`observe(listener)` additionally reports each stage as it starts and ends
+(used by the WebSocket chat to push progress to the client).
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+_listener: contextvars.ContextVar[Optional[Callable]] = contextvars.ContextVar("stage_listener", default=None)
+_open: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("open_stages", default=())
+
+
+def record(name: str, seconds: float) -> None:
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    listener = _listener.get()
+    if listener is not None:
+        listener("start", name, None)
+    token = _open.set(_open.get() + (name,))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _open.reset(token)
+        record(name, seconds)
+        if listener is not None:
+            listener("end", name, seconds)
+
+
+@contextmanager
+def observe(listener: Callable[[str, str, Optional[float]], None]):
+    """
+    Call `listener(event, name, seconds)` with event "start"/"end" for every
+    stage entered in this context. The listener may raise to abort the work.
+    """
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def open_stages() -> Tuple[str, ...]:
+    """Stages enclosing the current point (outermost first), per task/thread context"""
+    return _open.get()
+
+
+def current() -> Dict[str, float]:
+    """Stage durations (seconds) recorded so far for the current request"""
+    return dict(_stages.get() or {})
+
+
+def format_server_timing(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items())
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware exposing recorded stages as a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: Dict[str, float] = {}
+        token = _stages.set(stages)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                stages["total"] = time.perf_counter() - started
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", format_server_timing(stages))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stages.reset(token)
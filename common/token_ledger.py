@@ -0,0 +1,200 @@
+"""
+Per-request LLM token accounting and budgets.
+
+The gateway opens a ledger for each /ask with `track(...)`; every
+common.llm.chat call made in that context (lead agent, specialists, RAG
+optimize / rerank / answer, synthesis...) adds its prompt/completion tokens
+(provider usage, else common.llm.count_tokens: tiktoken or ~4 chars/token) and estimated cost to it.
+Once the request budget is used up, or the student is over their daily
+budget, `budget_exceeded()` turns true and agents take their rule-based fast
+paths instead of optional LLM calls. Outside of a tracked request recording
+is a no-op.
+
+Settings:
+    TOKEN_BUDGET_PER_REQUEST         prompt + completion tokens per request (0 = unlimited)
+    TOKEN_BUDGET_PER_STUDENT_DAILY   tokens per student per UTC day, kept in Redis (0 = unlimited)
+"""
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+TOKEN_BUDGET_PER_REQUEST = int(os.getenv("TOKEN_BUDGET_PER_REQUEST", "0"))
+TOKEN_BUDGET_PER_STUDENT_DAILY = int(os.getenv("TOKEN_BUDGET_PER_STUDENT_DAILY", "0"))
+STUDENT_USAGE_KEY = "tokens:student:{student_id}:{day}"
+
+
+class TokenLedger:
+    """LLM calls of one request; shared by the tasks/threads that copy its context"""
+
+    def __init__(self, budget: int = 0, exhausted_reason: Optional[str] = None):
+        self.budget = budget
+        self.reason = exhausted_reason
+        self.calls: List[Dict] = []
+        self.fast_paths: List[str] = []
+        self._lock = threading.Lock()
+
+    def add(self, agent: str, profile: str, prompt_tokens: int, completion_tokens: int,
+            cost_usd: float = 0.0, estimated: bool = False) -> None:
+        with self._lock:
+            self.calls.append({
+                "agent": agent,
+                "profile": profile,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": cost_usd,
+                "estimated": estimated,
+            })
+            if self.reason is None and self.budget and self.total_tokens >= self.budget:
+                self.reason = "request_budget"
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(c["prompt_tokens"] for c in self.calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(c["completion_tokens"] for c in self.calls)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def exceeded(self) -> bool:
+        return self.reason is not None
+
+    def summary(self) -> Dict:
+        with self._lock:
+            calls = list(self.calls)
+            fast_paths = list(self.fast_paths)
+        by_agent: Dict[str, Dict] = {}
+        for call in calls:
+            row = by_agent.setdefault(call["agent"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            row["calls"] += 1
+            row["prompt_tokens"] += call["prompt_tokens"]
+            row["completion_tokens"] += call["completion_tokens"]
+        return {
+            "calls": len(calls),
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in calls),
+            "total_tokens": sum(c["prompt_tokens"] + c["completion_tokens"] for c in calls),
+            "est_cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+            "estimated": any(c["estimated"] for c in calls),
+            "budget": self.budget or None,
+            "budget_exceeded": self.reason,
+            "fast_paths": fast_paths,
+            "by_agent": by_agent,
+        }
+
+
+class LedgerStats:
+    """Process-wide totals of the ledgers closed so far (for /metrics)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.max_request_tokens = 0
+        self.exceeded: Dict[str, int] = {}
+        self.fast_paths: Dict[str, int] = {}
+        self.agents: Dict[str, Dict] = {}
+
+    def add(self, ledger: TokenLedger) -> None:
+        summary = ledger.summary()
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += summary["prompt_tokens"]
+            self.completion_tokens += summary["completion_tokens"]
+            self.cost_usd += summary["est_cost_usd"]
+            self.max_request_tokens = max(self.max_request_tokens, summary["total_tokens"])
+            if summary["budget_exceeded"]:
+                self.exceeded[summary["budget_exceeded"]] = self.exceeded.get(summary["budget_exceeded"], 0) + 1
+            for name in summary["fast_paths"]:
+                self.fast_paths[name] = self.fast_paths.get(name, 0) + 1
+            for agent, row in summary["by_agent"].items():
+                total = self.agents.setdefault(agent, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+                for key in total:
+                    total[key] += row[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_tokens_per_request": round((self.prompt_tokens + self.completion_tokens) / requests, 1) if requests else 0.0,
+                "max_request_tokens": self.max_request_tokens,
+                "est_cost_usd": round(self.cost_usd, 6),
+                "budget_per_request": TOKEN_BUDGET_PER_REQUEST or None,
+                "budget_per_student_daily": TOKEN_BUDGET_PER_STUDENT_DAILY or None,
+                "budget_exceeded": dict(self.exceeded),
+                "fast_paths": dict(self.fast_paths),
+                "agents": {agent: dict(row) for agent, row in sorted(self.agents.items())},
+            }
+
+
+stats = LedgerStats()
+_current: contextvars.ContextVar[Optional[TokenLedger]] = contextvars.ContextVar("token_ledger", default=None)
+
+
+@contextmanager
+def track(budget: Optional[int] = None, exhausted_reason: Optional[str] = None):
+    """Open a ledger for the current request; its totals go to `stats` on exit"""
+    ledger = TokenLedger(TOKEN_BUDGET_PER_REQUEST if budget is None else budget, exhausted_reason)
+    token = _current.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current.reset(token)
+        stats.add(ledger)
+
+
+def current() -> Optional[TokenLedger]:
+    return _current.get()
+
+
+def record(agent: str, profile: str, prompt_tokens: int, completion_tokens: int,
+           cost_usd: float = 0.0, estimated: bool = False) -> None:
+    ledger = _current.get()
+    if ledger is not None:
+        ledger.add(agent, profile, prompt_tokens, completion_tokens, cost_usd, estimated)
+
+
+def budget_exceeded() -> bool:
+    ledger = _current.get()
+    return ledger is not None and ledger.exceeded()
+
+
+def note_fast_path(name: str) -> None:
+    """An agent skipped an LLM call because the budget is used up"""
+    ledger = _current.get()
+    if ledger is not None:
+        with ledger._lock:
+            ledger.fast_paths.append(name)
+
+
+# --- Per-student daily budget (Redis) ---
+
+def _student_key(student_id: str) -> str:
+    return STUDENT_USAGE_KEY.format(student_id=student_id, day=time.strftime("%Y%m%d", time.gmtime()))
+
+
+def student_over_budget(redis, student_id: Optional[str]) -> bool:
+    if not student_id or TOKEN_BUDGET_PER_STUDENT_DAILY <= 0:
+        return False
+    return int(redis.get(_student_key(student_id)) or 0) >= TOKEN_BUDGET_PER_STUDENT_DAILY
+
+
+def charge_student(redis, student_id: Optional[str], tokens: int) -> None:
+    if not student_id or tokens <= 0 or TOKEN_BUDGET_PER_STUDENT_DAILY <= 0:
+        return
+    key = _student_key(student_id)
+    pipe = redis.pipeline()
+    pipe.incrby(key, tokens)
+    pipe.expire(key, 2 * 86400)
+    pipe.execute()
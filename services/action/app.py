@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, Optional
@@ -8,10 +8,11 @@ import logging
 import json
 import time
 from datetime import datetime
-from jsonschema import validate, ValidationError
 sys.path.append('/app')
 
-from toolspec import TOOL_SCHEMAS
+from toolspec import registry, ToolTimeoutError
+import tools  # noqa: F401  (registers the tools)
+from common.web import DefaultJSONResponse, CompressionMiddleware
 from models import ActionRequest, get_db, create_tables
 
 # Configure structured logging
@@ -24,7 +25,8 @@ logger = logging.getLogger("action_service")
 app = FastAPI(
     title="Action Service",
     description="Service for executing student self-service actions",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse
 )
 
 @app.on_event("startup")
@@ -53,26 +55,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (e.g. /admin/action-requests)
+app.add_middleware(CompressionMiddleware)
+
 class ToolCallBody(BaseModel):
     tool_name: str
     tool_args: Dict[str, Any]
 
 def validate_tool_args(tool_name: str, tool_args: Dict[str, Any]) -> None:
     """
-    Validate tool arguments against JSON schema
+    Validate tool arguments with the tool's validator (built once at registration)
     Raises HTTPException with detailed error messages
     """
-    if tool_name not in TOOL_SCHEMAS:
+    if tool_name not in registry:
         raise HTTPException(
             status_code=404, 
-            detail=f"Tool '{tool_name}' not found. Available tools: {list(TOOL_SCHEMAS.keys())}"
+            detail=f"Tool '{tool_name}' not found. Available tools: {registry.names()}"
         )
     
-    schema = TOOL_SCHEMAS[tool_name]
-    
-    try:
-        validate(instance=tool_args, schema=schema)
-    except ValidationError as e:
+    tool = registry.get(tool_name)
+    e = tool.validation_error(tool_args)
+    if e is not None:
         # Create detailed error message
         error_path = " -> ".join(str(p) for p in e.absolute_path) if e.absolute_path else "root"
         error_detail = {
@@ -80,7 +83,7 @@ def validate_tool_args(tool_name: str, tool_args: Dict[str, Any]) -> None:
             "field": error_path,
             "message": e.message,
             "invalid_value": e.instance if hasattr(e, 'instance') else None,
-            "schema_requirement": schema
+            "schema_requirement": tool.schema
         }
         
         logger.warning(
@@ -120,6 +123,23 @@ def log_tool_call(tool_name: str, tool_args: Dict[str, Any], result: Dict[str, A
         extra=log_data
     )
 
+@app.get("/tools")
+async def list_tools(request: Request):
+    """
+    Tool catalog (name, description, JSON schema, limits) for the gateway.
+    The body is rendered once; clients revalidate with If-None-Match.
+    """
+    etag = registry.etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=registry.catalog(), media_type="application/json", headers=headers)
+
+@app.get("/tools/stats")
+async def tool_stats():
+    """Calls, timeouts and in-flight calls per tool"""
+    return registry.stats()
+
 @app.post("/call_tool")
 async def call_tool(b: ToolCallBody, request: Request, db: Session = Depends(get_db)):
     """
@@ -161,19 +181,8 @@ async def call_tool(b: ToolCallBody, request: Request, db: Session = Depends(get
     db.refresh(action_request)
     
     try:
-        # Route to appropriate stub function
-        if b.tool_name == "reset_password":
-            result = reset_password_stub(b.tool_args)
-        elif b.tool_name == "renew_library_card":
-            result = renew_library_card_stub(b.tool_args)
-        elif b.tool_name == "create_glpi_ticket":
-            result = create_glpi_ticket_stub(b.tool_args)
-        elif b.tool_name == "request_dorm_fix":
-            result = request_dorm_fix_stub(b.tool_args)
-        elif b.tool_name == "book_room":
-            result = book_room_stub(b.tool_args)
-        else:
-            raise HTTPException(status_code=404, detail=f"Tool '{b.tool_name}' implementation not found")
+        # O(1) dispatch qua registry; timeout/concurrency theo từng tool
+        result = await registry.get(b.tool_name)(b.tool_args)
         
         # Update database with result
         action_request.status = "completed"
@@ -188,6 +197,14 @@ async def call_tool(b: ToolCallBody, request: Request, db: Session = Depends(get
         
         return result
         
+    except ToolTimeoutError as e:
+        action_request.status = "failed"
+        action_request.result_data = {"status": "failed", "error": str(e)}
+        action_request.processed_at = datetime.utcnow()
+        db.commit()
+        logger.warning(str(e), extra={"event": "tool_call_timeout", "tool_name": b.tool_name,
+                                      "request_id": action_request.id})
+        raise HTTPException(status_code=504, detail=str(e))
     except HTTPException:
         # Update database with failure
         action_request.status = "failed"
@@ -374,25 +391,3 @@ async def update_action_request(
     )
     
     return {"message": "Action request updated successfully"}
-
-# Stub functions
-def reset_password_stub(args: Dict):
-    logger.info("Called reset_password with args=%s", args)
-    return {"status": "success", "message": "Password reset link sent."}
-
-def renew_library_card_stub(args: Dict):
-    logger.info("Called renew_library_card with args=%s", args)
-    duration = args.get("duration", "6_months")
-    return {"status": "success", "message": f"Library card renewed for {duration}.", "new_expiry": "2026-02-28"}
-
-def create_glpi_ticket_stub(args: Dict):
-    logger.info("Called create_glpi_ticket with args=%s", args)
-    return {"status": "success", "ticket_id": "12345"}
-
-def request_dorm_fix_stub(args: Dict):
-    logger.info("Called request_dorm_fix with args=%s", args)
-    return {"status": "success", "request_id": "abcde"}
-
-def book_room_stub(args: Dict):
-    logger.info("Called book_room with args=%s", args)
-    return {"status": "success", "booking_id": "xyz-789"}
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Tool implementations of the action service.
+
+Each tool is registered in toolspec.registry with its JSON schema; that schema
+is what /call_tool validates against and what GET /tools publishes to the
+gateway (ActionExecutorAgent), so a new tool only needs to be added here.
+"""
+import logging
+from typing import Dict
+
+from toolspec import tool
+
+logger = logging.getLogger("action_service")
+
+
+@tool("reset_password", "Đặt lại mật khẩu cho sinh viên", {
+    "type": "object",
+    "properties": {
+        "student_id": {"type": "string"},
+    },
+    "required": ["student_id"],
+}, timeout=5)
+async def reset_password(args: Dict):
+    logger.info("Called reset_password with args=%s", args)
+    return {"status": "success", "message": "Password reset link sent."}
+
+
+@tool("renew_library_card", "Gia hạn thẻ thư viện", {
+    "type": "object",
+    "properties": {
+        "student_id": {"type": "string"},
+        "card_number": {"type": "string"},
+        "duration": {"type": "string"},
+    },
+    "required": ["student_id", "card_number", "duration"],
+}, timeout=5)
+async def renew_library_card(args: Dict):
+    logger.info("Called renew_library_card with args=%s", args)
+    duration = args.get("duration", "6_months")
+    return {"status": "success", "message": f"Library card renewed for {duration}.", "new_expiry": "2026-02-28"}
+
+
+@tool("create_glpi_ticket", "Tạo ticket trong hệ thống GLPI", {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "category": {"type": "string"},
+    },
+    "required": ["title", "description", "category"],
+}, timeout=15, concurrency=4)
+async def create_glpi_ticket(args: Dict):
+    logger.info("Called create_glpi_ticket with args=%s", args)
+    return {"status": "success", "ticket_id": "12345"}
+
+
+@tool("request_dorm_fix", "Yêu cầu sửa chữa ký túc xá", {
+    "type": "object",
+    "properties": {
+        "room_number": {"type": "string"},
+        "issue_type": {"type": "string"},
+        "description": {"type": "string"},
+        "urgency": {"type": "string"},
+    },
+    "required": ["room_number", "issue_type", "description"],
+})
+async def request_dorm_fix(args: Dict):
+    logger.info("Called request_dorm_fix with args=%s", args)
+    return {"status": "success", "request_id": "abcde"}
+
+
+@tool("book_room", "Đặt phòng học/họp", {
+    "type": "object",
+    "properties": {
+        "room_id": {"type": "string"},
+        "start_time": {"type": "string", "format": "date-time"},
+        "end_time": {"type": "string", "format": "date-time"},
+    },
+    "required": ["room_id", "start_time", "end_time"],
+}, concurrency=1)
+async def book_room(args: Dict):
+    # concurrency=1: hai yêu cầu đặt cùng lúc không được tranh nhau một phòng
+    logger.info("Called book_room with args=%s", args)
+    return {"status": "success", "booking_id": "xyz-789"}
@@ -7,23 +7,80 @@ from typing import Dict, List, Optional, Any
 import json
 import logging
 import asyncio
+import os
+import re
 import sys
+import threading
+import time
 
 # Add path for imports
 sys.path.append('/app')
 
-from .base import BaseAgent
+from .base import BaseAgent, strip_json_fence
 
 logger = logging.getLogger(__name__)
 
 # Import httpx with fallback
 try:
     import httpx
+    from common.resilience import upstream, UpstreamUnavailableError
     HTTPX_AVAILABLE = True
 except ImportError:
     HTTPX_AVAILABLE = False
     logger.warning("httpx not available, tool execution will be disabled")
 
+# Catalog tools lấy từ GET {action}/tools (nguồn duy nhất: services/action/tools.py), được cache
+# và kiểm tra lại bằng ETag sau mỗi khoảng này; lỗi thì thử lại sau ACTION_TOOLS_RETRY_SECONDS
+ACTION_TOOLS_REFRESH_SECONDS = float(os.getenv("ACTION_TOOLS_REFRESH_SECONDS", "300"))
+ACTION_TOOLS_RETRY_SECONDS = float(os.getenv("ACTION_TOOLS_RETRY_SECONDS", "30"))
+
+# Prompt tĩnh đứng đầu messages để provider cache được prefix (xem BaseAgent._assemble_messages)
+FUNCTION_CALLING_INSTRUCTIONS = """
+Bạn là Action Executor của Campus Helpdesk. Chọn đúng MỘT tool phù hợp với yêu cầu của sinh viên
+và điền tham số lấy từ yêu cầu hoặc THÔNG TIN ĐÃ BIẾT. Không tự bịa giá trị tham số; tham số nào
+không có thì bỏ trống. Nếu không có tool nào phù hợp, trả lời ngắn gọn và không gọi tool.
+
+Quy tắc tham số:
+- student_id: mã số sinh viên (thường dạng 2021xxxx)
+- room_number / room_id: số phòng (ví dụ: A101, B205)
+- date-time: định dạng ISO (2024-01-15T10:00:00)
+- duration: thời gian (ví dụ: "1 year", "6 months")
+"""
+
+# Fast path không cần LLM: yêu cầu thực hiện khớp mẫu và đủ tham số lấy được bằng regex / context
+FAST_PATH_PATTERNS = {
+    "reset_password": re.compile(r"(đặt lại|quên|reset|khôi phục|cấp lại)\s.{0,20}(mật khẩu|password|pass)", re.IGNORECASE),
+}
+# Câu hỏi ("làm sao để...", "...?") và phủ định ("không quên") không phải yêu cầu thực hiện: để LLM quyết định
+FAST_PATH_EXCLUDE = re.compile(
+    r"\?|\b(làm sao|làm thế nào|thế nào|cách|hướng dẫn|có thể|không|chưa|chẳng|đừng|ko|how)\b",
+    re.IGNORECASE,
+)
+# Tham số chỉ lấy từ người gọi đã xác thực (context["student_id"] = subject JWT), không từ tin nhắn
+FAST_PATH_AUTH_PARAMS = ("student_id",)
+SLOT_PATTERNS = {
+    "student_id": re.compile(r"\b(\d{8,10})\b"),
+    "room_number": re.compile(r"\b([A-Z]\d{3})\b"),
+}
+
+PARAMETER_EXTRACTION_INSTRUCTIONS = """
+Trích xuất tham số cho TOOL từ yêu cầu người dùng, theo SCHEMA và danh sách CẦN TRÍCH XUẤT.
+
+Quy tắc:
+- student_id: mã số sinh viên (thường dạng 2021xxxx)
+- room_number: số phòng (ví dụ: A101, B205)
+- date-time: định dạng ISO (2024-01-15T10:00:00)
+- duration: thời gian (ví dụ: "1 year", "6 months")
+
+Trả về JSON:
+{
+    "param1": "value1",
+    "param2": "value2"
+}
+
+Nếu không tìm thấy tham số nào, trả về null cho tham số đó.
+"""
+
 
 class ActionExecutorAgent(BaseAgent):
     """Agent chuyên trách thực hiện các tools và actions"""
@@ -31,91 +88,104 @@ class ActionExecutorAgent(BaseAgent):
     def __init__(self):
         super().__init__("ActionExecutor", "action_executor.md")
         self.action_service_url = "http://action:8000"
-        self.available_tools = {
-            "reset_password": {
-                "description": "Đặt lại mật khẩu cho sinh viên",
-                "required_params": ["student_id"],
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "student_id": {"type": "string"}
-                    },
-                    "required": ["student_id"]
-                }
-            },
-            "renew_library_card": {
-                "description": "Gia hạn thẻ thư viện",
-                "required_params": ["student_id", "card_number", "duration"],
-                "schema": {
-                    "type": "object", 
-                    "properties": {
-                        "student_id": {"type": "string"},
-                        "card_number": {"type": "string"},
-                        "duration": {"type": "string"}
-                    },
-                    "required": ["student_id", "card_number", "duration"]
-                }
-            },
-            "book_room": {
-                "description": "Đặt phòng học/họp",
-                "required_params": ["room_id", "start_time", "end_time"],
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "room_id": {"type": "string"},
-                        "start_time": {"type": "string", "format": "date-time"},
-                        "end_time": {"type": "string", "format": "date-time"}
-                    },
-                    "required": ["room_id", "start_time", "end_time"]
-                }
-            },
-            "create_glpi_ticket": {
-                "description": "Tạo ticket trong hệ thống GLPI",
-                "required_params": ["title", "description", "category"],
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "title": {"type": "string"},
-                        "description": {"type": "string"},
-                        "category": {"type": "string"}
-                    },
-                    "required": ["title", "description", "category"]
-                }
-            },
-            "request_dorm_fix": {
-                "description": "Yêu cầu sửa chữa ký túc xá",
-                "required_params": ["room_number", "issue_type", "description"],
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "room_number": {"type": "string"},
-                        "issue_type": {"type": "string"},
-                        "description": {"type": "string"},
-                        "urgency": {"type": "string"}
-                    },
-                    "required": ["room_number", "issue_type", "description"]
-                }
+        # Catalog từ GET {action}/tools (_load_tools); rỗng cho tới lần tải đầu tiên
+        self.available_tools: Dict[str, Dict] = {}
+        self._build_tool_definitions()
+        self._tools_etag: Optional[str] = None
+        self._tools_next_check = 0.0
+        # threading.Lock, không phải asyncio.Lock: /ask/batch và /ws/chat chạy agent
+        # trong event loop riêng của từng worker thread
+        self._tools_refresh = threading.Lock()
+    
+    def _build_tool_definitions(self) -> None:
+        # Schema function calling cho provider (OpenAI format, Gemini được chuyển đổi trong common.gemini_llm)
+        self.tool_definitions = [
+            {
+                "type": "function",
+                "function": {"name": name, "description": info["description"], "parameters": info["schema"]},
             }
-        }
+            for name, info in self.available_tools.items()
+        ]
+    
+    def _apply_catalog(self, catalog: Dict) -> None:
+        """Thay danh sách tools bằng catalog của Action service"""
+        tools = {}
+        for entry in catalog["tools"]:
+            schema = entry.get("parameters") or {"type": "object", "properties": {}}
+            tools[entry["name"]] = {
+                "description": entry.get("description", ""),
+                "required_params": list(schema.get("required", [])),
+                "schema": schema,
+            }
+        self.available_tools = tools
+        self._build_tool_definitions()
+    
+    async def _load_tools(self) -> None:
+        """
+        Lấy catalog GET /tools một lần rồi cache; sau ACTION_TOOLS_REFRESH_SECONDS chỉ
+        revalidate bằng If-None-Match (304 khi không đổi). Lỗi thì giữ danh sách hiện tại.
+        """
+        if not HTTPX_AVAILABLE or time.monotonic() < self._tools_next_check:
+            return
+        if not self._tools_refresh.acquire(blocking=False):
+            # Thread/loop khác đang tải: chỉ chờ khi chưa có catalog nào
+            while not self.available_tools and self._tools_refresh.locked():
+                await asyncio.sleep(0.05)
+            return
+        try:
+            if time.monotonic() < self._tools_next_check:
+                return
+            retry_after = ACTION_TOOLS_RETRY_SECONDS
+            try:
+                headers = {"If-None-Match": self._tools_etag} if self._tools_etag else {}
+                async with httpx.AsyncClient() as client:
+                    response = await upstream("action").request(
+                        client, "GET", f"{self.action_service_url}/tools", headers=headers
+                    )
+                if response.status_code == 200:
+                    self._apply_catalog(response.json())
+                    self._tools_etag = response.headers.get("etag")
+                    logger.info("Loaded %d tools from action service", len(self.available_tools))
+                    retry_after = ACTION_TOOLS_REFRESH_SECONDS
+                elif response.status_code == 304:
+                    retry_after = ACTION_TOOLS_REFRESH_SECONDS
+                else:
+                    logger.warning("Action service /tools returned %s", response.status_code)
+            except Exception as e:
+                logger.warning("Could not load tool catalog from action service: %s", e)
+            self._tools_next_check = time.monotonic() + retry_after
+        finally:
+            self._tools_refresh.release()
     
     async def process(self, user_message: str, chat_history: List[Dict], context: Dict = None) -> Dict:
         """
         Xử lý yêu cầu thực hiện action/tool
         """
         try:
-            # 1. Phân tích yêu cầu để xác định tool cần dùng
-            tool_analysis = self._analyze_tool_request(user_message, context)
+            await self._load_tools()
+            if not self.available_tools:
+                return self._create_tools_unavailable_response()
+            
+            # 1. Chọn tool + trích xuất tham số: regex fast path, nếu không thì một lần
+            #    gọi LLM với function calling
+            selection = self._match_simple_request(user_message, context)
+            if selection is None:
+                selection = self._select_tool(user_message, context)
             
-            if not tool_analysis["tool_name"]:
+            tool_name = selection["tool_name"]
+            if not tool_name:
                 return self._create_guidance_response()
             
             # 2. Kiểm tra tool có tồn tại không
-            tool_name = tool_analysis["tool_name"]
             if tool_name not in self.available_tools:
                 return self._create_tool_not_found_response(tool_name)
             
-            # 3. Trích xuất tham số
-            tool_params = self._extract_tool_parameters(tool_name, user_message, context, tool_analysis)
+            # 3. Tham số: từ function call, bổ sung từ context; provider không hỗ trợ
+            #    function calling thì trích xuất thêm như trước
+            if selection["method"] == "json":
+                tool_params = self._extract_tool_parameters(tool_name, user_message, context, selection["analysis"])
+            else:
+                tool_params = self._fill_from_context(tool_name, selection["params"], context)
             
             # 4. Validate tham số
             validation_result = self._validate_parameters(tool_name, tool_params)
@@ -126,55 +196,84 @@ class ActionExecutorAgent(BaseAgent):
             execution_result = await self._execute_tool(tool_name, tool_params, context)
             
             # 6. Tạo response
-            return self._create_success_response(tool_name, execution_result)
+            response = self._create_success_response(tool_name, execution_result)
+            response["tool_selection"] = selection["method"]
+            return response
             
         except Exception as e:
             logger.exception("Error in ActionExecutorAgent.process")
             return self._create_error_response(str(e))
     
-    def _analyze_tool_request(self, user_message: str, context: Dict = None) -> Dict:
-        """Phân tích yêu cầu để xác định tool cần sử dụng"""
-        
-        # Sử dụng LLM để phân tích intent
-        analysis_prompt = f"""
-        Phân tích yêu cầu và xác định tool cần sử dụng:
-        
-        YÊU CẦU: {user_message}
-        
-        TOOLS CÓ SẴN:
-        {json.dumps(list(self.available_tools.keys()), ensure_ascii=False)}
-        
-        CHI TIẾT TOOLS:
-        {self._get_tools_description()}
-        
-        Context từ workflow: {json.dumps(context or {}, ensure_ascii=False)}
-        
-        Trả về JSON:
-        {{
-            "tool_name": "tên_tool_hoặc_null",
-            "confidence": 0.95,
-            "reasoning": "lý do chọn tool này",
-            "extracted_entities": {{
-                "student_id": "value_nếu_có",
-                "room_number": "value_nếu_có",
-                ...
-            }}
-        }}
-        """
-        
-        messages = [{"role": "user", "content": analysis_prompt}]
-        response = self._call_llm(messages)
-        
+    def _known_values(self, context: Dict = None) -> Dict:
+        """Tham số đã biết từ context (workflow, session, student_id của request)"""
+        context = context or {}
+        known = {}
+        for source in (context.get("session_context") or {}, context.get("workflow_context") or {}):
+            known.update({k: v for k, v in source.items() if v})
+        if context.get("student_id"):
+            known["student_id"] = context["student_id"]
+        return known
+    
+    def _match_simple_request(self, user_message: str, context: Dict = None) -> Optional[Dict]:
+        """Fast path rule-based: chỉ dùng khi khớp mẫu và đủ mọi tham số bắt buộc"""
+        for tool_name, pattern in FAST_PATH_PATTERNS.items():
+            # Tool không còn trong catalog của Action service thì bỏ qua fast path
+            if tool_name not in self.available_tools or not pattern.search(user_message):
+                continue
+            if FAST_PATH_EXCLUDE.search(user_message):
+                continue
+            required = self.available_tools[tool_name]["required_params"]
+            params = {}
+            for param in required:
+                slot = None if param in FAST_PATH_AUTH_PARAMS else SLOT_PATTERNS.get(param)
+                match = slot.search(user_message) if slot else None
+                if match:
+                    params[param] = match.group(1)
+            params = self._fill_from_context(tool_name, params, context)
+            for param in FAST_PATH_AUTH_PARAMS:
+                if param in params:
+                    params[param] = (context or {}).get(param)
+            if all(params.get(p) for p in required):
+                return {"tool_name": tool_name, "params": params, "method": "fast_path"}
+        return None
+    
+    def _fill_from_context(self, tool_name: str, params: Dict, context: Dict = None) -> Dict:
+        params = {k: v for k, v in params.items() if v not in (None, "")}
+        schema = self.available_tools[tool_name]["schema"]
+        for param, value in self._known_values(context).items():
+            if param in schema.get("properties", {}) and param not in params:
+                params[param] = value
+        return params
+    
+    def _select_tool(self, user_message: str, context: Dict = None) -> Dict:
+        """Một lần gọi LLM với function calling: chọn tool và điền tham số cùng lúc"""
+        known = self._known_values(context)
+        messages = self._assemble_messages(
+            FUNCTION_CALLING_INSTRUCTIONS,
+            f"YÊU CẦU: {user_message}",
+            dynamic_context=f"THÔNG TIN ĐÃ BIẾT: {json.dumps(known, ensure_ascii=False)}" if known else "",
+        )
+        response = self._call_llm_with_tools(messages, self.tool_definitions, profile="classify")
+        
+        tool_calls = response.get("tool_calls") or []
+        if tool_calls:
+            function = tool_calls[0].get("function", {})
+            try:
+                arguments = json.loads(function.get("arguments") or "{}")
+            except json.JSONDecodeError:
+                logger.warning("Failed to parse tool call arguments for %s", function.get("name"))
+                arguments = {}
+            return {"tool_name": function.get("name"), "params": arguments, "method": "function_call"}
+        
+        # Provider trả về text (stub / model không hỗ trợ tools): thử format JSON cũ
+        content = response.get("content") or ""
         try:
-            return json.loads(response)
+            analysis = json.loads(strip_json_fence(content))
         except json.JSONDecodeError:
-            logger.warning("Failed to parse tool analysis")
-            return {
-                "tool_name": None,
-                "confidence": 0.0,
-                "reasoning": "Parse error",
-                "extracted_entities": {}
-            }
+            analysis = None
+        if isinstance(analysis, dict) and analysis.get("tool_name"):
+            return {"tool_name": analysis["tool_name"], "params": {}, "method": "json", "analysis": analysis}
+        return {"tool_name": None, "params": {}, "method": "function_call"}
     
     def _get_tools_description(self) -> str:
         """Lấy mô tả chi tiết các tools"""
@@ -192,7 +291,7 @@ class ActionExecutorAgent(BaseAgent):
         
         # Bước 1: Lấy tham số từ extracted_entities
         params = {}
-        for param in tool_schema["required"]:
+        for param in tool_schema.get("required", []):
             if param in extracted_entities and extracted_entities[param]:
                 params[param] = extracted_entities[param]
         
@@ -200,18 +299,18 @@ class ActionExecutorAgent(BaseAgent):
         if context:
             # Từ workflow context
             workflow_context = context.get("workflow_context", {})
-            for param in tool_schema["required"]:
+            for param in tool_schema.get("required", []):
                 if param not in params and param in workflow_context:
                     params[param] = workflow_context[param]
             
             # Từ session context (student_id, etc.)
             session_context = context.get("session_context", {})
-            for param in tool_schema["required"]:
+            for param in tool_schema.get("required", []):
                 if param not in params and param in session_context:
                     params[param] = session_context[param]
         
         # Bước 3: Sử dụng LLM để trích xuất tham số còn thiếu
-        missing_params = [p for p in tool_schema["required"] if p not in params]
+        missing_params = [p for p in tool_schema.get("required", []) if p not in params]
         if missing_params:
             params.update(self._extract_missing_parameters(
                 tool_name, user_message, missing_params, tool_schema
@@ -223,32 +322,16 @@ class ActionExecutorAgent(BaseAgent):
                                    missing_params: List[str], schema: Dict) -> Dict:
         """Sử dụng LLM để trích xuất tham số còn thiếu"""
         
-        extraction_prompt = f"""
-        Trích xuất tham số cho tool '{tool_name}' từ yêu cầu người dùng:
-        
-        YÊU CẦU: {user_message}
-        
-        CẦN TRÍCH XUẤT: {missing_params}
-        
-        SCHEMA: {json.dumps(schema, ensure_ascii=False)}
-        
-        Quy tắc:
-        - student_id: mã số sinh viên (thường dạng 2021xxxx)
-        - room_number: số phòng (ví dụ: A101, B205)
-        - date-time: định dạng ISO (2024-01-15T10:00:00)
-        - duration: thời gian (ví dụ: "1 year", "6 months")
-        
-        Trả về JSON:
-        {{
-            "param1": "value1",
-            "param2": "value2"
-        }}
-        
-        Nếu không tìm thấy tham số nào, trả về null cho tham số đó.
-        """
-        
-        messages = [{"role": "user", "content": extraction_prompt}]
-        response = self._call_llm(messages)
+        messages = self._assemble_messages(
+            PARAMETER_EXTRACTION_INSTRUCTIONS,
+            f"YÊU CẦU: {user_message}",
+            dynamic_context=(
+                f"TOOL: {tool_name}\n"
+                f"CẦN TRÍCH XUẤT: {missing_params}\n"
+                f"SCHEMA: {json.dumps(schema, ensure_ascii=False)}"
+            ),
+        )
+        response = self._call_llm(messages, profile="classify")
         
         try:
             return json.loads(response)
@@ -260,7 +343,7 @@ class ActionExecutorAgent(BaseAgent):
         """Validate tham số tool"""
         
         schema = self.available_tools[tool_name]["schema"]
-        required_params = schema["required"]
+        required_params = schema.get("required", [])
         
         # Kiểm tra tham số bắt buộc
         missing_params = []
@@ -281,7 +364,7 @@ class ActionExecutorAgent(BaseAgent):
         
         # Validate student_id format
         if "student_id" in params:
-            student_id = params["student_id"]
+            student_id = str(params["student_id"])
             if not (student_id.isdigit() and len(student_id) >= 8):
                 validation_errors.append("student_id phải là số có ít nhất 8 chữ số")
         
@@ -327,12 +410,14 @@ class ActionExecutorAgent(BaseAgent):
                 if context and "student_id" in context:
                     headers["X-Student-ID"] = context["student_id"]
                 
-                # Gọi Action service
-                response = await client.post(
+                # Gọi Action service (không retry: tool call có side effect); mỗi tool có
+                # timeout riêng ở Action service nên cũng có latency window riêng
+                response = await upstream("action").request(
+                    client, "POST",
                     f"{self.action_service_url}/call_tool",
+                    route=f"POST /call_tool:{tool_name}",
                     json=request_data,
-                    headers=headers,
-                    timeout=30.0
+                    headers=headers
                 )
                 
                 response.raise_for_status()
@@ -345,6 +430,13 @@ class ActionExecutorAgent(BaseAgent):
                     "status_code": response.status_code
                 }
                 
+        except UpstreamUnavailableError:
+            logger.warning("Action service circuit open, not calling %s", tool_name)
+            return {
+                "success": False,
+                "error": "service_unavailable",
+                "message": "Dịch vụ thực hiện đang tạm thời gián đoạn, bạn vui lòng thử lại sau ít phút"
+            }
         except Exception as e:
             if "httpx" in str(type(e)):
                 if "HTTPStatusError" in str(type(e)):
@@ -406,6 +498,17 @@ class ActionExecutorAgent(BaseAgent):
             "reason": "tool_not_identified"
         }
     
+    def _create_tools_unavailable_response(self) -> Dict:
+        """Tạo response khi chưa lấy được danh sách tools từ Action service"""
+        
+        return {
+            "reply": "Xin lỗi, dịch vụ thực hiện yêu cầu đang tạm thời gián đoạn, bạn vui lòng thử lại sau ít phút.",
+            "agent": "action_executor",
+            "available_tools": [],
+            "success": False,
+            "reason": "tools_unavailable"
+        }
+    
     def _create_tool_not_found_response(self, tool_name: str) -> Dict:
         """Tạo response khi tool không tồn tại"""
         
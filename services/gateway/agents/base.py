@@ -11,14 +11,46 @@ try:
     from common.llm import chat
 except ImportError:
     # Fallback if common module not found
-    def chat(messages):
+    def chat(messages, tools=None, profile=None, agent=None):
         """Fallback chat function"""
         return {"content": "I'm sorry, I cannot process this request right now."}
 
+try:
+    from common.token_ledger import budget_exceeded, note_fast_path
+except ImportError:
+    def budget_exceeded() -> bool:
+        """Fallback: không giới hạn token khi thiếu module common"""
+        return False
+
+    def note_fast_path(name: str) -> None:
+        pass
+
+try:
+    from common.timing import stage
+except ImportError:
+    from contextlib import nullcontext
+
+    def stage(name: str):
+        """Fallback: không đo thời gian khi thiếu module common"""
+        return nullcontext()
+
+
+def strip_json_fence(text: str) -> str:
+    """Lấy phần JSON bên trong khối ```json ... ``` mà LLM hay bọc quanh kết quả"""
+    start = text.find("```json")
+    if start == -1:
+        return text.strip()
+    start += 7
+    end = text.find("```", start)
+    return (text[start:end] if end != -1 else text[start:]).strip()
+
 
 class BaseAgent(ABC):
     """Base class cho tất cả các agent trong hệ thống"""
     
+    # Model profile mặc định cho các lời gọi LLM của agent (xem common.llm.PROFILE_DEFAULTS)
+    llm_profile = "generate"
+    
     def __init__(self, name: str, prompt_file: str):
         self.name = name
         self.prompt_file = prompt_file
@@ -47,11 +79,53 @@ class BaseAgent(ABC):
         """
         pass
     
-    def _call_llm(self, messages: List[Dict]) -> str:
-        """Gọi LLM với messages và trả về content"""
-        response = chat(messages)
+    def _call_llm(self, messages: List[Dict], profile: str = None) -> str:
+        """
+        Gọi LLM với messages và trả về content.
+        profile: "classify" cho các quyết định JSON ngắn (model nhỏ, temperature 0),
+        mặc định là llm_profile của agent.
+        """
+        response = chat(messages, profile=profile or self.llm_profile, agent=self.name)
         return response.get("content", "Xin lỗi, tôi không thể xử lý yêu cầu này.")
     
+    def _call_llm_with_tools(self, messages: List[Dict], tools: List[Dict], profile: str = None) -> Dict:
+        """
+        Gọi LLM với function calling (tools theo format OpenAI).
+        Trả về nguyên kết quả: {"tool_calls": [...]} hoặc {"content": "..."}.
+        """
+        return chat(messages, tools=tools, profile=profile or self.llm_profile, agent=self.name)
+    
+    def _use_fast_path(self, name: str) -> bool:
+        """
+        True khi request đã dùng hết token budget (theo request hoặc theo sinh viên):
+        agent nên bỏ qua lời gọi LLM không bắt buộc và dùng logic rule-based.
+        """
+        if budget_exceeded():
+            note_fast_path(name)
+            return True
+        return False
+    
+    def _assemble_messages(self, instructions: str, user_content: str, catalog: str = "",
+                           history: List[Dict] = None, dynamic_context: str = "") -> List[Dict]:
+        """
+        Ghép prompt theo thứ tự tĩnh -> động để provider cache được phần đầu:
+        system (instructions + catalog, giống hệt nhau giữa các lần gọi)
+        -> lịch sử chat -> tin nhắn user (dynamic_context + user_content).
+        instructions / catalog không được chứa dữ liệu của từng request.
+        """
+        system = instructions.strip()
+        if catalog:
+            system += "\n\n" + catalog.strip()
+        messages = [{"role": "system", "content": system}]
+        
+        for turn in history or []:
+            messages.append({"role": "user", "content": turn.get("user")})
+            messages.append({"role": "assistant", "content": turn.get("bot")})
+        
+        content = f"{dynamic_context.strip()}\n\n{user_content}" if dynamic_context else user_content
+        messages.append({"role": "user", "content": content})
+        return messages
+    
     def _build_messages(self, user_message: str, chat_history: List[Dict]) -> List[Dict]:
         """Xây dựng messages cho LLM"""
         messages = [{"role": "system", "content": self.system_prompt}]
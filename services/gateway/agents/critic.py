@@ -6,14 +6,33 @@ Phản biện và đề xuất cải thiện cho các response từ agents khác
 from typing import Dict, List, Optional, Any
 import json
 import logging
-from .base import BaseAgent
+from .base import BaseAgent, strip_json_fence
 
 logger = logging.getLogger(__name__)
 
+# Prompt tĩnh đứng đầu messages để provider cache được prefix (xem BaseAgent._assemble_messages)
+BATCH_EVALUATION_INSTRUCTIONS = """
+Đánh giá lần lượt từng cặp câu hỏi / câu trả lời trong DANH SÁCH theo các tiêu chí chất lượng.
+
+Trả về một JSON array, mỗi phần tử ứng với một index:
+[
+    {
+        "index": 0,
+        "scores": {"accuracy": 8.5, "completeness": 7.0, "relevance": 9.0, "clarity": 8.0, "actionability": 6.5, "safety": 9.5},
+        "overall_score": 8.1,
+        "critical_issues": []
+    }
+]
+
+Thang điểm: 0-10 (10 là tốt nhất)
+"""
+
 
 class CriticAgent(BaseAgent):
     """Agent chuyên trách đánh giá và phản biện kết quả từ các agents khác"""
     
+    llm_profile = "evaluate"
+    
     def __init__(self):
         super().__init__("Critic", "critic.md")
         self.evaluation_criteria = {
@@ -24,6 +43,9 @@ class CriticAgent(BaseAgent):
             "actionability": "Khả năng thực hiện/hành động",
             "safety": "Tính an toàn và tuân thủ quy định"
         }
+        self._criteria_catalog = (
+            f"TIÊU CHÍ ĐÁNH GIÁ:\n{json.dumps(self.evaluation_criteria, ensure_ascii=False, indent=2)}"
+        )
     
     def process(self, user_message: str, chat_history: List[Dict], context: Dict = None) -> Dict:
         """
@@ -144,9 +166,45 @@ class CriticAgent(BaseAgent):
             "overall_score": round(overall_score, 1),
             "strengths": ["Response có cấu trúc cơ bản"],
             "weaknesses": ["Không thể đánh giá chi tiết do lỗi parse"],
-            "critical_issues": []
+            "critical_issues": [],
+            "fallback": True
         }
     
+    def evaluate_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        Đánh giá nhiều cặp (request, response) trong một lần gọi LLM.
+        items: [{"original_request": str, "response": Dict}, ...]
+        Trả về danh sách evaluation cùng thứ tự; item nào LLM không chấm được
+        thì dùng đánh giá fallback.
+        """
+        if not items:
+            return []
+        
+        pairs = [
+            {"index": i, "request": item["original_request"], "reply": item["response"].get("reply", "")}
+            for i, item in enumerate(items)
+        ]
+        messages = self._assemble_messages(
+            BATCH_EVALUATION_INSTRUCTIONS,
+            f"DANH SÁCH:\n{json.dumps(pairs, ensure_ascii=False, indent=2)}",
+            catalog=self._criteria_catalog,
+        )
+        response_text = self._call_llm(messages)
+        
+        by_index = {}
+        try:
+            parsed = json.loads(strip_json_fence(response_text))
+            for evaluation in parsed if isinstance(parsed, list) else []:
+                if isinstance(evaluation, dict) and "overall_score" in evaluation:
+                    by_index[evaluation.get("index")] = evaluation
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse batch evaluation result")
+        
+        return [
+            by_index.get(i) or self._create_fallback_evaluation(item["response"])
+            for i, item in enumerate(items)
+        ]
+    
     def _generate_improvement_suggestions(self, evaluation: Dict, response: Dict, original_request: str) -> List[Dict]:
         """Tạo đề xuất cải thiện dựa trên kết quả đánh giá"""
         
@@ -3,7 +3,7 @@ Enhanced RAG Agent - Tích hợp nâng cao với Policy service
 Hỗ trợ semantic search, reranking và answer generation
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import json
 import logging
 import asyncio
@@ -13,18 +13,66 @@ import re
 # Add path for imports
 sys.path.append('/app')
 
-from .base import BaseAgent
+from .base import BaseAgent, stage
 
 logger = logging.getLogger(__name__)
 
 # Try to import httpx, fallback if not available
 try:
     import httpx
+    from common.resilience import upstream
     HTTPX_AVAILABLE = True
 except ImportError:
     HTTPX_AVAILABLE = False
     logger.warning("httpx not available, some features will be disabled")
 
+# Prompt tĩnh đứng đầu messages để provider cache được prefix (xem BaseAgent._assemble_messages)
+QUERY_OPTIMIZATION_INSTRUCTIONS = """
+Tối ưu hóa query cho tìm kiếm tài liệu. Trả về CHÍNH XÁC format JSON:
+
+{
+    "optimized_query": "query đã tối ưu",
+    "key_terms": ["term1", "term2"],
+    "search_strategy": "broad",
+    "reasoning": "lý do tối ưu hóa"
+}
+
+CHỈ trả về JSON, không thêm text nào khác!
+"""
+
+RERANK_INSTRUCTIONS = """
+Rerank và đánh giá độ liên quan của các tài liệu tìm được với QUERY của người dùng.
+
+Hãy đánh giá và sắp xếp lại theo độ liên quan, trả về JSON:
+{{
+    "ranked_documents": [
+        {{
+            "document_id": "id_hoặc_index",
+            "relevance_score": 0.95,
+            "relevance_reason": "lý do liên quan",
+            "original_doc": {{...}}
+        }}
+    ],
+    "filtering_reason": "lý do filter"
+}}
+
+Chỉ giữ lại tài liệu có relevance_score >= {search_threshold}
+Tối đa {max_citations} tài liệu
+"""
+
+ANSWER_INSTRUCTIONS = """
+Dựa trên các tài liệu tham khảo, hãy trả lời câu hỏi của sinh viên một cách chính xác và hữu ích.
+
+YÊU CẦU:
+- Trả lời chính xác dựa trên tài liệu
+- Ngôn ngữ thân thiện, dễ hiểu
+- Trích dẫn nguồn khi cần thiết
+- Nếu tài liệu không đủ thông tin, hãy nói rõ
+- Đưa ra hướng dẫn cụ thể nếu có thể
+
+KHÔNG được tự bịa thông tin không có trong tài liệu tham khảo.
+"""
+
 
 class EnhancedRAGAgent(BaseAgent):
     """Agent RAG nâng cao với khả năng search và answer generation"""
@@ -34,17 +82,36 @@ class EnhancedRAGAgent(BaseAgent):
         self.policy_service_url = "http://policy:8000"
         self.search_threshold = 0.7  # Threshold cho độ tương tự
         self.max_citations = 5  # Số citation tối đa
+        self._rerank_instructions = RERANK_INSTRUCTIONS.format(
+            search_threshold=self.search_threshold, max_citations=self.max_citations
+        )
         
     async def process(self, user_message: str, chat_history: List[Dict], context: Dict = None) -> Dict:
         """
         Xử lý yêu cầu bằng RAG với search và generation
         """
         try:
-            # 1. Phân tích query và tối ưu hóa search
-            optimized_query = await self._optimize_search_query(user_message, chat_history, context)
+            # Policy service đang lỗi (breaker mở): trả lời ngay thay vì chờ timeout
+            if HTTPX_AVAILABLE and not upstream("policy").breaker.available():
+                logger.warning("Policy service circuit open, skipping document search")
+                return self._create_no_results_response(user_message, user_message)
+            
+            # Manager có thể đã tìm kiếm trước trong lúc Smart Lead đang routing
+            prefetch = (context or {}).get("retrieval_prefetch")
+            search_results = None
+            if prefetch is not None:
+                try:
+                    optimized_query, search_results = await prefetch
+                except Exception as e:
+                    logger.warning(f"Speculative retrieval failed, searching again: {e}")
             
-            # 2. Tìm kiếm tài liệu liên quan
-            search_results = await self._search_documents(optimized_query)
+            if search_results is None:
+                # 1. Phân tích query và tối ưu hóa search
+                optimized_query = await self._optimize_search_query(user_message, chat_history, context)
+                
+                # 2. Tìm kiếm tài liệu liên quan
+                with stage("retrieval"):
+                    search_results = await self._search_documents(optimized_query)
             
             # 3. Rerank và filter kết quả
             relevant_docs = await self._rerank_and_filter(search_results, user_message, context)
@@ -60,27 +127,22 @@ class EnhancedRAGAgent(BaseAgent):
             logger.exception("Error in EnhancedRAGAgent.process")
             return self._create_error_response(str(e))
     
+    async def prefetch_documents(self, user_message: str, chat_history: List[Dict],
+                                 context: Dict = None) -> Tuple[str, List[Dict]]:
+        """Bước 1 + 2 của process (tối ưu query và tìm kiếm), chạy trước khi routing xong"""
+        with stage("retrieval"):
+            optimized_query = await self._optimize_search_query(user_message, chat_history, context)
+            return optimized_query, await self._search_documents(optimized_query)
+    
     async def _optimize_search_query(self, user_message: str, chat_history: List[Dict], 
                                    context: Dict = None) -> str:
         """Tối ưu hóa query để search hiệu quả hơn"""
         
-        optimization_prompt = f"""
-        Tối ưu hóa query cho tìm kiếm tài liệu. Trả về CHÍNH XÁC format JSON:
-
-        QUERY GỐC: {user_message}
-
-        {{
-            "optimized_query": "query đã tối ưu",
-            "key_terms": ["term1", "term2"],
-            "search_strategy": "broad",
-            "reasoning": "lý do tối ưu hóa"
-        }}
-
-        CHỈ trả về JSON, không thêm text nào khác!
-        """
+        if self._use_fast_path("rag_query_optimization"):
+            return self._rule_based_query_optimization(user_message)
         
-        messages = [{"role": "user", "content": optimization_prompt}]
-        response = self._call_llm(messages)
+        messages = self._assemble_messages(QUERY_OPTIMIZATION_INSTRUCTIONS, f"QUERY GỐC: {user_message}")
+        response = self._call_llm(messages, profile="classify")
         
         try:
             # Thử parse JSON
@@ -130,11 +192,12 @@ class EnhancedRAGAgent(BaseAgent):
         
         try:
             async with httpx.AsyncClient() as client:
-                # Gọi policy service để tìm kiếm
-                response = await client.post(
+                # Gọi policy service để tìm kiếm (chỉ đọc nên được retry)
+                response = await upstream("policy").request(
+                    client, "POST",
                     f"{self.policy_service_url}/rag_answer",
                     json={"text": query},
-                    timeout=30.0
+                    idempotent=True
                 )
                 
                 response.raise_for_status()
@@ -154,33 +217,16 @@ class EnhancedRAGAgent(BaseAgent):
         if not search_results:
             return []
         
-        # Sử dụng LLM để rerank based on relevance
-        rerank_prompt = f"""
-        Rerank và đánh giá độ liên quan của các tài liệu tìm được:
-        
-        QUERY: {user_message}
-        
-        TÀI LIỆU TÌM ĐƯỢC:
-        {json.dumps(search_results, ensure_ascii=False, indent=2)}
-        
-        Hãy đánh giá và sắp xếp lại theo độ liên quan, trả về JSON:
-        {{
-            "ranked_documents": [
-                {{
-                    "document_id": "id_hoặc_index", 
-                    "relevance_score": 0.95,
-                    "relevance_reason": "lý do liên quan",
-                    "original_doc": {{...}}
-                }}
-            ],
-            "filtering_reason": "lý do filter"
-        }}
-        
-        Chỉ giữ lại tài liệu có relevance_score >= {self.search_threshold}
-        Tối đa {self.max_citations} tài liệu
-        """
+        # Hết token budget: giữ thứ tự của policy service thay vì rerank bằng LLM
+        if self._use_fast_path("rag_rerank"):
+            return search_results[:self.max_citations]
         
-        messages = [{"role": "user", "content": rerank_prompt}]
+        # Sử dụng LLM để rerank based on relevance; tài liệu (động) đi sau hướng dẫn (tĩnh)
+        messages = self._assemble_messages(
+            self._rerank_instructions,
+            f"QUERY: {user_message}",
+            dynamic_context=f"TÀI LIỆU TÌM ĐƯỢC:\n{json.dumps(search_results, ensure_ascii=False, indent=2)}",
+        )
         response = self._call_llm(messages)
         
         try:
@@ -211,28 +257,12 @@ class EnhancedRAGAgent(BaseAgent):
             source = doc.get("source", f"Document {i+1}")
             doc_context += f"\n[{source}]: {doc_text}\n"
         
-        generation_prompt = f"""
-        Dựa trên các tài liệu tham khảo, hãy trả lời câu hỏi của sinh viên một cách chính xác và hữu ích.
-        
-        CÂU HỎI: {user_message}
-        
-        TÀI LIỆU THAM KHẢO:
-        {doc_context}
-        
-        LỊCH SỬ CHAT:
-        {json.dumps(chat_history[-3:] if chat_history else [], ensure_ascii=False)}
-        
-        YÊU CẦU:
-        - Trả lời chính xác dựa trên tài liệu
-        - Ngôn ngữ thân thiện, dễ hiểu
-        - Trích dẫn nguồn khi cần thiết
-        - Nếu tài liệu không đủ thông tin, hãy nói rõ
-        - Đưa ra hướng dẫn cụ thể nếu có thể
-        
-        KHÔNG được tự bịa thông tin không có trong tài liệu tham khảo.
-        """
-        
-        messages = [{"role": "user", "content": generation_prompt}]
+        messages = self._assemble_messages(
+            ANSWER_INSTRUCTIONS,
+            f"CÂU HỎI: {user_message}",
+            history=chat_history[-3:] if chat_history else None,
+            dynamic_context=f"TÀI LIỆU THAM KHẢO:\n{doc_context}",
+        )
         return self._call_llm(messages)
     
     def _create_success_response(self, answer: str, relevant_docs: List[Dict], 
@@ -308,10 +338,14 @@ class EnhancedRAGAgent(BaseAgent):
         
         try:
             async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.policy_service_url}/ingest_policies",
-                    json={"documents": documents},
-                    timeout=60.0
+                # Ingest chạy lâu theo kích thước batch nên giữ timeout cố định
+                response = await upstream("policy").call(
+                    lambda timeout: client.post(
+                        f"{self.policy_service_url}/ingest_policies",
+                        json={"documents": documents},
+                        timeout=60.0
+                    ),
+                    route="POST /ingest_policies"
                 )
                 
                 response.raise_for_status()
@@ -329,10 +363,11 @@ class EnhancedRAGAgent(BaseAgent):
         
         try:
             async with httpx.AsyncClient() as client:
-                response = await client.post(
+                response = await upstream("policy").request(
+                    client, "POST",
                     f"{self.policy_service_url}/check",
                     json={"text": query},
-                    timeout=30.0
+                    idempotent=True
                 )
                 
                 response.raise_for_status()
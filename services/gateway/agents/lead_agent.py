@@ -141,6 +141,9 @@ class LeadAgent(BaseAgent):
                     "reasoning": "Simple greeting message detected"
                 }
         
+        if self._use_fast_path("lead_complexity_analysis"):
+            return self._rule_based_complexity_analysis(user_message)
+        
         # Sử dụng LLM để phân tích chi tiết hơn
         analysis_prompt = f"""
         Phân tích yêu cầu sau và xác định độ phức tạp. Trả về CHÍNH XÁC format JSON sau:
@@ -165,7 +168,7 @@ class LeadAgent(BaseAgent):
         """
         
         messages = [{"role": "user", "content": analysis_prompt}]
-        response = self._call_llm(messages)
+        response = self._call_llm(messages, profile="classify")
         
         # Cải thiện parsing với nhiều cách thử
         try:
@@ -7,11 +7,60 @@ from .lead_agent import LeadAgent
 from .smart_lead_agent import SmartLeadAgent
 from .action_executor import ActionExecutorAgent
 from .critic import CriticAgent
+from .base import stage
 import logging
 import asyncio
+import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# Tìm kiếm tài liệu song song với bước routing của Smart Lead:
+#   off    - tắt
+#   auto   - chỉ khi câu hỏi có vẻ cần tra cứu (từ khoá, không tốn lời gọi LLM)
+#   always - mọi tin nhắn
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "auto").lower()
+# Các chuyên gia dùng được kết quả tìm kiếm trước
+SPECULATIVE_TARGETS = {"faq", "enhanced_rag"}
+
+
+class SpeculationStats:
+    """Đếm số lần tìm kiếm trước được dùng / bị huỷ và thời gian tiết kiệm được"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def record_launch(self) -> None:
+        with self._lock:
+            self.launched += 1
+
+    def record_hit(self, saved_seconds: float) -> None:
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += saved_seconds
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decided = self.hits + self.misses
+            return {
+                "mode": SPECULATIVE_RETRIEVAL,
+                "launched": self.launched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / decided, 3) if decided else None,
+                "latency_saved_ms_total": round(self.saved_seconds * 1000, 1),
+                "latency_saved_ms_avg": round(self.saved_seconds * 1000 / self.hits, 1) if self.hits else None,
+            }
+
 
 class SmartAgentManager:
     """
@@ -31,15 +80,20 @@ class SmartAgentManager:
             "greeting": GreetingAgent(),
             "critic": CriticAgent()
         }
+        # Smart Lead có thể chọn enhanced_rag trực tiếp; dùng chung RAG agent với FAQ
+        self.rag_agent = self.specialists["faq"].rag_agent
+        self.specialists["enhanced_rag"] = self.rag_agent
         
         # Session memory
         self.session_memory: Dict[str, Dict] = {}
+        self.speculation = SpeculationStats()
     
     async def process_message(self, user_message: str, chat_history: List[Dict], 
                             session_id: str = None, student_id: str = None) -> Dict:
         """
         Xử lý tin nhắn thông minh với SmartLeadAgent
         """
+        prefetch = None
         try:
             # Chuẩn bị context
             context = {
@@ -49,8 +103,24 @@ class SmartAgentManager:
                 "chat_history": chat_history
             }
             
-            # Gọi Smart Lead Agent
-            response = self.smart_lead.process(user_message, chat_history, context)
+            # Gọi Smart Lead Agent (trong thread nếu đang tìm kiếm trước song song)
+            prefetch, clock = self._start_speculative_retrieval(user_message, chat_history, context)
+            with stage("routing"):
+                if prefetch is not None:
+                    response = await asyncio.to_thread(self.smart_lead.process, user_message, chat_history, context)
+                else:
+                    response = self.smart_lead.process(user_message, chat_history, context)
+            
+            if prefetch is not None:
+                target = response.get("target_agent") if response.get("requires_specialist") else None
+                if target in SPECULATIVE_TARGETS:
+                    # Thời gian tiết kiệm = phần tìm kiếm đã chạy xong trong lúc routing
+                    finished = clock["finished"] or time.perf_counter()
+                    self.speculation.record_hit(finished - clock["started"])
+                    context["retrieval_prefetch"] = prefetch
+                    prefetch = None
+                else:
+                    self.speculation.record_miss()
             
             # Xử lý theo quyết định của Smart Lead
             if response.get("requires_specialist"):
@@ -69,6 +139,31 @@ class SmartAgentManager:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            # Kết quả tìm kiếm trước không được dùng thì huỷ
+            if prefetch is not None:
+                prefetch.cancel()
+    
+    def _start_speculative_retrieval(self, user_message: str, chat_history: List[Dict], context: Dict):
+        """Bắt đầu tối ưu query + tìm kiếm tài liệu trước khi Smart Lead quyết định xong"""
+        if SPECULATIVE_RETRIEVAL == "off":
+            return None, None
+        if SPECULATIVE_RETRIEVAL == "auto" and not self.smart_lead.likely_needs_documents(user_message):
+            return None, None
+        
+        clock = {"started": time.perf_counter(), "finished": None}
+        
+        async def run():
+            try:
+                return await self.rag_agent.prefetch_documents(user_message, chat_history, context)
+            finally:
+                clock["finished"] = time.perf_counter()
+        
+        task = asyncio.create_task(run())
+        # Không log "exception was never retrieved" cho các lần đoán sai bị bỏ qua
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.speculation.record_launch()
+        return task, clock
     
     async def _delegate_to_specialist(self, smart_lead_response: Dict, user_message: str, 
                                    chat_history: List[Dict], context: Dict) -> Dict:
@@ -163,7 +258,8 @@ class EnhancedAgentManager:
             context = self._prepare_context(session_id, student_id, chat_history)
             
             # 2. Gọi Lead Agent để xử lý
-            response = self.lead_agent.process(user_message, chat_history, context)
+            with stage("routing"):
+                response = self.lead_agent.process(user_message, chat_history, context)
             
             # 3. Xử lý theo loại workflow
             if response.get("workflow_type") == "simple_routing":
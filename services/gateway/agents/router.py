@@ -1,6 +1,6 @@
 from typing import Dict, List
 import json
-from .base import BaseAgent
+from .base import BaseAgent, strip_json_fence
 import logging
 
 logger = logging.getLogger("gateway.router_agent")
@@ -8,6 +8,8 @@ logger = logging.getLogger("gateway.router_agent")
 class RouterAgent(BaseAgent):
     """Agent chịu trách nhiệm phân tích và định tuyến yêu cầu đến agent phù hợp"""
     
+    llm_profile = "classify"
+    
     def __init__(self):
         super().__init__("Router", "router.md")
     
@@ -28,13 +30,7 @@ class RouterAgent(BaseAgent):
         
 
         # Strip markdown wrapper if present
-        if response_content.strip().startswith("```json"):
-            response_content = response_content.strip()
-            # Extract JSON between ```json and ```
-            start = response_content.find("```json") + 7
-            end = response_content.rfind("```")
-            if end > start:
-                response_content = response_content[start:end].strip()
+        response_content = strip_json_fence(response_content)
         
         try:
             return json.loads(response_content)
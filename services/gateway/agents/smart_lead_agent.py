@@ -8,10 +8,53 @@ import json
 import logging
 import re
 
-from .base import BaseAgent
+from .base import BaseAgent, strip_json_fence
 
 logger = logging.getLogger(__name__)
 
+# Prompt tĩnh: không chèn dữ liệu của request vào đây (xem BaseAgent._assemble_messages)
+DECISION_INSTRUCTIONS = """
+Bạn là Smart Lead Agent của Campus Helpdesk. Hãy phân tích yêu cầu hiện tại của sinh viên (tin nhắn cuối cùng, có xét lịch sử trước đó) và quyết định cách xử lý tốt nhất.
+"""
+
+DECISION_OPTIONS = """
+CÁC LỰA CHỌN XỬ LÝ:
+
+1. **direct_response**: Tự trả lời trực tiếp
+- Khi: Câu hỏi tổng quát, thông tin về dịch vụ, hướng dẫn cơ bản
+- Ví dụ: "Campus Helpdesk có những dịch vụ gì?"
+
+2. **delegate_to_specialist**: Chuyển cho chuyên gia cụ thể
+- technical: Vấn đề IT, mật khẩu, hệ thống
+- faq: Quy định, chính sách chi tiết của trường
+- action_executor: Thực hiện công việc cụ thể (đặt phòng, gia hạn...)
+- enhanced_rag: Tìm kiếm tài liệu chính thức
+
+3. **multi_step_coordination**: Nhiều bước phức tạp
+- Khi: Cần nhiều chuyên gia hoặc nhiều công việc
+
+Trả về JSON:
+{
+    "action": "direct_response|delegate_to_specialist|multi_step_coordination",
+    "reasoning": "Lý do quyết định này",
+    "target_specialist": "tên_chuyên_gia_nếu_cần",
+    "confidence": 0.9,
+    "user_intent": "Ý định của user",
+    "context_understanding": "Hiểu biết về ngữ cảnh"
+}
+"""
+
+DIRECT_RESPONSE_INSTRUCTIONS = """
+Bạn là Smart Lead Agent của Campus Helpdesk. Hãy trả lời trực tiếp câu hỏi của sinh viên một cách tự nhiên, thân thiện và hữu ích.
+
+HƯỚNG DẪN TRẢ LỜI:
+- Trả lời tự nhiên, không theo template
+- Cung cấp thông tin hữu ích và cụ thể
+- Đề xuất thêm sự hỗ trợ nếu cần
+- Sử dụng ngôn ngữ thân thiện, gần gũi
+- Độ dài: 2-4 câu, vừa đủ thông tin
+"""
+
 
 class SmartLeadAgent(BaseAgent):
     """
@@ -28,6 +71,12 @@ class SmartLeadAgent(BaseAgent):
             "enhanced_rag": "Chuyên gia tìm kiếm - tìm kiếm tài liệu chính thức",
             "greeting": "Trợ lý chào hỏi - tạo không khí thân thiện"
         }
+        # Chủ đề thường cần tra cứu tài liệu của trường
+        self.policy_keywords = [
+            "học phí", "học bổng", "quy định", "quy chế", "chính sách", "lịch thi", "kỳ thi",
+            "đăng ký", "ký túc xá", "thư viện", "tốt nghiệp", "chuyển ngành", "thời khóa biểu",
+            "điểm", "tín chỉ", "bảo lưu", "miễn giảm"
+        ]
     
     def process(self, user_message: str, chat_history: List[Dict], context: Dict = None) -> Dict:
         """
@@ -73,53 +122,21 @@ class SmartLeadAgent(BaseAgent):
         Phân tích thông minh để quyết định cách xử lý
         """
         
-        # Chuẩn bị prompt thông minh
-        analysis_prompt = f"""
-        Bạn là Smart Lead Agent của Campus Helpdesk. Hãy phân tích yêu cầu sau và quyết định cách xử lý tốt nhất.
-
-        YÊU CẦU HIỆN TẠI: {user_message}
-        
-        LỊCH SỬ TRƯỚC ĐÓ: {self._format_chat_history(chat_history[-3:]) if chat_history else "Không có"}
-        
-        CÁC LỰA CHỌN XỬ LÝ:
-        
-        1. **direct_response**: Tự trả lời trực tiếp
-        - Khi: Câu hỏi tổng quát, thông tin về dịch vụ, hướng dẫn cơ bản
-        - Ví dụ: "Campus Helpdesk có những dịch vụ gì?"
-        
-        2. **delegate_to_specialist**: Chuyển cho chuyên gia cụ thể
-        - technical: Vấn đề IT, mật khẩu, hệ thống
-        - faq: Quy định, chính sách chi tiết của trường
-        - action_executor: Thực hiện công việc cụ thể (đặt phòng, gia hạn...)
-        - enhanced_rag: Tìm kiếm tài liệu chính thức
-        
-        3. **multi_step_coordination**: Nhiều bước phức tạp
-        - Khi: Cần nhiều chuyên gia hoặc nhiều công việc
-        
-        Trả về JSON:
-        {{
-            "action": "direct_response|delegate_to_specialist|multi_step_coordination",
-            "reasoning": "Lý do quyết định này",
-            "target_specialist": "tên_chuyên_gia_nếu_cần",
-            "confidence": 0.9,
-            "user_intent": "Ý định của user",
-            "context_understanding": "Hiểu biết về ngữ cảnh"
-        }}
-        
-        HÃY PHÂN TÍCH THÔNG MINH VÀ TRẢ VỀ JSON:
-        """
+        if self._use_fast_path("smart_lead_decision"):
+            return self._fallback_decision(user_message)
         
-        messages = [{"role": "user", "content": analysis_prompt}]
-        response = self._call_llm(messages)
+        # Phần tĩnh (hướng dẫn + danh mục lựa chọn) đứng trước để provider cache được prefix
+        messages = self._assemble_messages(
+            DECISION_INSTRUCTIONS,
+            f"YÊU CẦU HIỆN TẠI: {user_message}\n\nHÃY PHÂN TÍCH THÔNG MINH VÀ TRẢ VỀ JSON:",
+            catalog=DECISION_OPTIONS,
+            history=chat_history[-3:] if chat_history else None,
+        )
+        response = self._call_llm(messages, profile="classify")
         
         try:
             # Parse JSON response
-            if "```json" in response:
-                json_content = response.split("```json")[1].split("```")[0].strip()
-            else:
-                json_content = response.strip()
-            
-            return json.loads(json_content)
+            return json.loads(strip_json_fence(response))
             
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse decision JSON: {e}")
@@ -131,26 +148,14 @@ class SmartLeadAgent(BaseAgent):
         Tạo câu trả lời trực tiếp thông minh và tự nhiên
         """
         
-        response_prompt = f"""
-        Bạn là Smart Lead Agent của Campus Helpdesk. Hãy trả lời trực tiếp câu hỏi sau một cách tự nhiên, thân thiện và hữu ích.
-
-        CÂU HỎI: {user_message}
-        
-        NGỮ CẢNH: {decision.get('context_understanding', '')}
-        
-        Ý ĐỊNH CỦA USER: {decision.get('user_intent', '')}
-        
-        HƯỚNG DẪN TRẢ LỜI:
-        - Trả lời tự nhiên, không theo template
-        - Cung cấp thông tin hữu ích và cụ thể
-        - Đề xuất thêm sự hỗ trợ nếu cần
-        - Sử dụng ngôn ngữ thân thiện, gần gũi
-        - Độ dài: 2-4 câu, vừa đủ thông tin
-        
-        TRẢ LỜI:
-        """
-        
-        messages = [{"role": "user", "content": response_prompt}]
+        messages = self._assemble_messages(
+            DIRECT_RESPONSE_INSTRUCTIONS,
+            f"CÂU HỎI: {user_message}\n\nTRẢ LỜI:",
+            dynamic_context=(
+                f"NGỮ CẢNH: {decision.get('context_understanding', '')}\n"
+                f"Ý ĐỊNH CỦA USER: {decision.get('user_intent', '')}"
+            ),
+        )
         response_content = self._call_llm(messages)
         
         return {
@@ -267,6 +272,14 @@ class SmartLeadAgent(BaseAgent):
             "confidence": 0.6
         }
     
+    def likely_needs_documents(self, user_message: str) -> bool:
+        """
+        Đoán nhanh (không gọi LLM) câu hỏi có cần tra cứu quy định/tài liệu không,
+        dùng để quyết định có tìm kiếm trước song song với bước routing hay không
+        """
+        message_lower = user_message.lower()
+        return any(keyword in message_lower for keyword in self.policy_keywords)
+    
     def _format_chat_history(self, history: List[Dict]) -> str:
         """Format chat history for context"""
         if not history:
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, Response, Request, Depends, Header, UploadFile, File
+from fastapi import FastAPI, HTTPException, Response, Request, Depends, Header, UploadFile, File, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
@@ -12,6 +12,11 @@ import httpx
 import sys
 import logging
 import time
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from jose import JWTError, jwt
 sys.path.append('/app')
@@ -20,6 +25,15 @@ from routers import auth as auth_router
 from routers import users as user_router
 from routers import tickets as ticket_router
 from voice_services import VoiceManager
+import security
+import chat_history_codec
+import chat_archiver
+import quality_monitor
+from common.web import DefaultJSONResponse, CompressionMiddleware
+from common import timing
+from common import llm
+from common import token_ledger
+from common.resilience import upstream, upstream_stats
 
 # --- Setup ---
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -42,8 +56,10 @@ logging.getLogger("routers.tickets").setLevel(logging.DEBUG)
 logging.getLogger("gateway.security").setLevel(logging.DEBUG)
 
 r = Redis.from_url(REDIS_URL, decode_responses=True)
+# Chat turns are stored in a compact binary encoding, so they need a bytes client
+r_history = Redis.from_url(REDIS_URL, decode_responses=False)
 
-app = FastAPI(title="Campus Helpdesk Gateway")
+app = FastAPI(title="Campus Helpdesk Gateway", default_response_class=DefaultJSONResponse)
 
 # Mount static files for serving audio
 os.makedirs(STATIC_AUDIO_DIR, exist_ok=True)
@@ -63,12 +79,30 @@ async def _startup():
     if SECRET_KEY_ENV == DEFAULT_SECRET:
         logger.warning("Using default SECRET_KEY. Set a strong SECRET_KEY in environment for production.")
     app.state.http_client = httpx.AsyncClient(timeout=10.0)
+    security.hash_pool.start()
+    # SDK của LLM provider được import lazy; nạp trước trong nền để request đầu tiên không phải chờ
+    app.state.llm_preload = asyncio.get_running_loop().run_in_executor(None, llm.preload_providers)
+    app.state.archiver_task = None
+    if chat_archiver.ARCHIVER_INTERVAL_SECONDS > 0:
+        try:
+            chat_archiver.create_archive_tables()
+            archiver = chat_archiver.ChatArchiver(r_history)
+            app.state.archiver = archiver
+            app.state.archiver_task = asyncio.create_task(archiver.run_forever())
+        except Exception as e:
+            logger.error("Chat archiver not started: %s", e)
 
 @app.on_event("shutdown")
 async def _shutdown():
     client: httpx.AsyncClient = getattr(app.state, "http_client", None)  # type: ignore
     if client:
         await client.aclose()
+    security.hash_pool.shutdown()
+    _batch_executor.shutdown(wait=False)
+    _ws_executor.shutdown(wait=False)
+    task = getattr(app.state, "archiver_task", None)
+    if task:
+        task.cancel()
 
 # --- CORS ---
 app.add_middleware(
@@ -79,6 +113,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Compression (gzip/brotli above COMPRESSION_MIN_SIZE) ---
+app.add_middleware(CompressionMiddleware)
+
+# --- Per-stage latency breakdown (Server-Timing header) ---
+app.add_middleware(timing.ServerTimingMiddleware)
+
 # --- Routers ---
 app.include_router(auth_router.router)
 app.include_router(user_router.router)
@@ -98,16 +138,68 @@ async def legacy_my_tickets(request: Request):
 agent_manager = AgentManager()
 
 # --- Chat History Management ---
+# Per-student index of sessions (sorted set scored by last activity) and the owner of each
+# session (session_owner:{id}, claimed by the first authenticated write)
+STUDENT_SESSIONS_MAX = int(os.getenv("STUDENT_SESSIONS_MAX", "200"))
+STUDENT_SESSIONS_TTL = int(os.getenv("STUDENT_SESSIONS_TTL", str(30 * 86400)))
+
+def _student_sessions_key(student_id: str) -> str:
+    return f"student_sessions:{student_id}"
+
+def _session_owner_key(session_id: str) -> str:
+    return f"session_owner:{session_id}"
+
+def student_owns_session(student_id: str, session_id: str) -> bool:
+    return bool(student_id) and r.get(_session_owner_key(session_id)) == student_id
+
+def session_open_to(student_id: Optional[str], session_id: str) -> bool:
+    """Phiên chưa có chủ (phiên mới) hoặc thuộc về student_id"""
+    owner = r.get(_session_owner_key(session_id))
+    return owner is None or owner == student_id
+
 def get_chat_history(session_id: str, limit: int = 10) -> List[Dict]:
     if not session_id:
         return []
     key = f"chat_history:{session_id}"
-    history = r.lrange(key, 0, limit - 1)
-    return [json.loads(h) for h in reversed(history)]
+    history = r_history.lrange(key, 0, limit - 1)
+    return [chat_history_codec.decode_turn(h) for h in reversed(history)]
 
-def add_to_chat_history(session_id: str, user_message: str, bot_message: str, agent_info: Dict = None, student_id: str = None):
+async def get_full_chat_history(session_id: str, limit: int = 100) -> List[Dict]:
+    """
+    get_chat_history, completed with older turns from cold storage when Redis
+    has fewer than `limit` (the key expired or was trimmed by the archiver;
+    the session index outlives it)
+    """
+    history = get_chat_history(session_id, limit)
+    if len(history) >= limit or (history and not r.hexists(f"session_meta:{session_id}", "archived_at")):
+        return history
+    try:
+        archived = await asyncio.to_thread(chat_archiver.load_archived_history, session_id, limit)
+    except Exception as e:
+        logger.error("Error reading archived chat history for %s: %s", session_id, e)
+        return history
+    if history:
+        # Turns still in Redis may already have been copied to the archive
+        oldest = history[0].get("timestamp") or 0
+        archived = [turn for turn in archived if (turn.get("timestamp") or 0) < oldest]
+    return (archived + history)[-limit:]
+
+def add_to_chat_history(session_id: str, user_message: str, bot_message: str, agent_info: Dict = None, student_id: str = None) -> bool:
+    """
+    Ghi một lượt chat. student_id là người gọi đã xác thực (get_student_id), không
+    phải trường trong body: lượt đầu tiên gán phiên cho sinh viên đó, và phiên đã
+    thuộc về sinh viên khác thì không được ghi thêm (trả về False).
+    """
     if not session_id:
-        return
+        return False
+    if student_id:
+        claimed = r.set(_session_owner_key(session_id), student_id, nx=True, ex=STUDENT_SESSIONS_TTL)
+        if not claimed and not student_owns_session(student_id, session_id):
+            logger.warning("Refusing to write session %s owned by another student", session_id)
+            return False
+    elif not session_open_to(None, session_id):
+        logger.warning("Refusing anonymous write to owned session %s", session_id)
+        return False
     key = f"chat_history:{session_id}"
     turn = {
         "user": user_message,
@@ -116,10 +208,12 @@ def add_to_chat_history(session_id: str, user_message: str, bot_message: str, ag
         "agent": agent_info.get("agent", "unknown") if agent_info else "unknown",
         "student_id": student_id
     }
-    r.lpush(key, json.dumps(turn))
-    r.ltrim(key, 0, 99)
+    pipe = r_history.pipeline(transaction=False)
+    pipe.lpush(key, chat_history_codec.encode_turn(turn))
+    pipe.ltrim(key, 0, 99)
     # Set/refresh TTL for chat history key to align with session metadata
-    r.expire(key, 86400)
+    pipe.expire(key, 86400)
+    pipe.execute()
     
     # Kiểm tra từ khóa kết thúc cuộc hội thoại
     ending_keywords = ["tạm biệt", "bye", "cảm ơn", "thanks", "xong rồi", "hết rồi", "ok cảm ơn", "được rồi", "đã hiểu"]
@@ -141,6 +235,17 @@ def add_to_chat_history(session_id: str, user_message: str, bot_message: str, ag
     r.hset(session_key, mapping=session_data)
     r.expire(session_key, 86400)  # Expire after 24 hours
 
+    # Cập nhật index phiên theo sinh viên
+    if student_id:
+        index_key = _student_sessions_key(student_id)
+        pipe = r.pipeline(transaction=False)
+        pipe.zadd(index_key, {session_id: session_data["last_activity"]})
+        pipe.zremrangebyrank(index_key, 0, -(STUDENT_SESSIONS_MAX + 1))
+        pipe.expire(index_key, STUDENT_SESSIONS_TTL)
+        pipe.expire(_session_owner_key(session_id), STUDENT_SESSIONS_TTL)
+        pipe.execute()
+    return True
+
 # --- Student ID Extraction ---
 def extract_student_id_from_jwt(token: str) -> Optional[str]:
     """Extract student_id from JWT token"""
@@ -174,6 +279,15 @@ def get_student_id(
     # Fallback to x-student-id header for development
     return x_student_id or "DEV001"
 
+def get_authenticated_student_id(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    Chỉ subject của JWT hợp lệ (không có fallback x-student-id / DEV001): dùng cho
+    budget token và student_id trong context của agents (tool tác động lên tài khoản)
+    """
+    if authorization and authorization.startswith("Bearer "):
+        return extract_student_id_from_jwt(authorization.split(" ", 1)[1])
+    return None
+
 # --- New Pydantic Models ---
 class UserProfile(BaseModel):
     student_id: str
@@ -188,6 +302,17 @@ class TicketSummary(BaseModel):
     status: str
     created_at: str
 
+class SessionSummary(BaseModel):
+    session_id: str
+    last_activity: float
+    status: str
+
+class PaginatedSessions(BaseModel):
+    sessions: List[SessionSummary]
+    total: int
+    page: int
+    per_page: int
+
 class ChatMessage(BaseModel):
     user: str
     bot: str
@@ -201,6 +326,7 @@ class AskBody(BaseModel):
     text: str
     student_id: str | None = None
     session_id: str | None = None
+    debug: bool = False  # thêm token ledger của request vào response
 
 class TtsBody(BaseModel):
     text: str
@@ -210,30 +336,58 @@ class TtsBody(BaseModel):
     similarity_boost: float | None = 0.7
     format: str | None = "mp3"
 
+# --- Token budget ---
+@contextmanager
+def _token_budget(student_id: Optional[str]):
+    """
+    Token ledger of one answer (every entry point: /ask, /ask/batch, /ws/chat,
+    /voice-chat). student_id is the JWT subject (get_authenticated_student_id),
+    never a header or body field: over the daily budget the agents take their
+    fast paths from the start, and the tokens spent are charged to the student
+    afterwards. Without a verified student only TOKEN_BUDGET_PER_REQUEST applies.
+    """
+    over_budget = token_ledger.student_over_budget(r, student_id)
+    with token_ledger.track(exhausted_reason="student_budget" if over_budget else None) as ledger:
+        try:
+            yield ledger
+        finally:
+            token_ledger.charge_student(r, student_id, ledger.total_tokens)
+
 # --- Main Endpoint ---
 @app.post("/ask")
-async def ask(body: AskBody):
+async def ask(body: AskBody, caller_id: Optional[str] = Depends(get_student_id),
+              verified_id: Optional[str] = Depends(get_authenticated_student_id)):
     """
     Endpoint chính để xử lý yêu cầu từ sinh viên thông qua hệ thống multi-agent
     """
     req_id = str(uuid.uuid4())
-    chat_history = get_chat_history(body.session_id)
+    # Phiên của sinh viên khác: không nạp lịch sử của họ vào prompt, không ghi tiếp
+    if body.session_id and not session_open_to(caller_id, body.session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    with timing.stage("history_load"):
+        chat_history = get_chat_history(body.session_id)
     
     try:
-        # Xử lý tin nhắn thông qua Agent Manager
-        response = await agent_manager.process_message(
-            user_message=body.text,
-            chat_history=chat_history,
-            session_id=body.session_id
-        )
+        with _token_budget(verified_id) as ledger:
+            # Xử lý tin nhắn thông qua Agent Manager
+            with timing.stage("agents"):
+                response = await agent_manager.process_message(
+                    user_message=body.text,
+                    chat_history=chat_history,
+                    session_id=body.session_id,
+                    student_id=verified_id
+                )
         
         final_reply = response.get("reply", "Xin lỗi, tôi không thể xử lý yêu cầu này.")
         
         # Cập nhật lịch sử chat
-        add_to_chat_history(body.session_id, body.text, final_reply, response, body.student_id)
+        with timing.stage("history_save"):
+            add_to_chat_history(body.session_id, body.text, final_reply, response, caller_id)
+        # Lấy mẫu để CriticAgent chấm điểm ở worker nền (không gọi LLM ở đây)
+        quality_monitor.enqueue_turn(r, body.session_id, body.text, response)
         
         # Trả về response
-        return {
+        result = {
             "request_id": req_id,
             "answer": {
                 "reply": final_reply,
@@ -245,6 +399,9 @@ async def ask(body: AskBody):
                 }
             }
         }
+        if body.debug:
+            result["debug"] = {"tokens": ledger.summary()}
+        return result
         
     except Exception as e:
         logger.exception("Error in /ask endpoint: %s", e)
@@ -259,6 +416,284 @@ async def ask(body: AskBody):
             }
         }
 
+# --- Batch Endpoint ---
+ASK_BATCH_MAX_ITEMS = int(os.getenv("ASK_BATCH_MAX_ITEMS", "1000"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+
+# Agents gọi LLM đồng bộ, nên batch chạy mỗi câu hỏi trên một worker thread riêng
+# để concurrency thật sự song song thay vì chặn event loop
+_batch_executor = ThreadPoolExecutor(max_workers=ASK_BATCH_CONCURRENCY, thread_name_prefix="ask-batch")
+
+class BatchAskItem(BaseModel):
+    id: str | None = None
+    text: str
+    session_id: str | None = None
+
+class BatchAskBody(BaseModel):
+    channel: str = "batch"
+    items: List[BatchAskItem]
+    concurrency: int | None = None
+    save_history: bool = False
+
+def _batch_dedupe_key(item: BatchAskItem) -> tuple:
+    # Cùng câu hỏi trong cùng ngữ cảnh (session) thì chỉ xử lý một lần
+    text = re.sub(r"\s+", " ", item.text.strip().lower())
+    return (item.session_id or "", text)
+
+def _process_message_blocking(text: str, chat_history: List[Dict], session_id: Optional[str], student_id: Optional[str]) -> Dict:
+    """process_message on a worker thread; student_id is the JWT subject (budget and agent context)"""
+    with _token_budget(student_id):
+        return asyncio.run(agent_manager.process_message(
+            user_message=text,
+            chat_history=chat_history,
+            session_id=session_id,
+            student_id=student_id
+        ))
+
+@app.post("/ask/batch")
+async def ask_batch(body: BatchAskBody, caller_id: Optional[str] = Depends(get_student_id),
+                    verified_id: Optional[str] = Depends(get_authenticated_student_id)):
+    """
+    Xử lý nhiều câu hỏi trong một request (triage backfill, FAQ regression).
+    Câu hỏi trùng lặp chỉ chạy một lần; kết quả được stream về dạng NDJSON
+    theo thứ tự hoàn thành, dòng cuối là summary.
+    """
+    if not body.items:
+        raise HTTPException(400, "items is required")
+    if len(body.items) > ASK_BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"At most {ASK_BATCH_MAX_ITEMS} items per batch")
+
+    batch_id = str(uuid.uuid4())
+    concurrency = max(1, min(body.concurrency or ASK_BATCH_CONCURRENCY, ASK_BATCH_CONCURRENCY))
+
+    # Gom nhóm các item trùng nhau
+    groups: Dict[tuple, List[int]] = {}
+    for index, item in enumerate(body.items):
+        groups.setdefault(_batch_dedupe_key(item), []).append(index)
+
+    async def run_group(indexes: List[int], semaphore: asyncio.Semaphore) -> List[Dict]:
+        first = body.items[indexes[0]]
+        started = time.perf_counter()
+        async with semaphore:
+            # Phiên của sinh viên khác: không nạp lịch sử của họ vào prompt
+            if first.session_id and not session_open_to(caller_id, first.session_id):
+                response, error = {}, "Session not found"
+            else:
+                try:
+                    chat_history = get_chat_history(first.session_id) if first.session_id else []
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        _batch_executor, _process_message_blocking,
+                        first.text, chat_history, first.session_id, verified_id
+                    )
+                    if body.save_history and first.session_id:
+                        add_to_chat_history(first.session_id, first.text, response.get("reply", ""), response, caller_id)
+                    error = response.get("error") if response.get("success") is False else None
+                except Exception as e:
+                    logger.exception("Error in /ask/batch item: %s", e)
+                    response, error = {}, str(e)
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        lines = []
+        for index in indexes:
+            item = body.items[index]
+            line = {
+                "type": "result",
+                "index": index,
+                "id": item.id if item.id is not None else str(index),
+                "reply": response.get("reply"),
+                "agent": response.get("agent", "error" if error else "unknown"),
+                "latency_ms": latency_ms,
+            }
+            if index != indexes[0]:
+                line["duplicate_of"] = indexes[0]
+            if error:
+                line["error"] = error
+            lines.append(line)
+        return lines
+
+    async def stream():
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [asyncio.create_task(run_group(indexes, semaphore)) for indexes in groups.values()]
+        started = time.perf_counter()
+        errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for line in await next_done:
+                    errors += 1 if "error" in line else 0
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({
+            "type": "summary",
+            "batch_id": batch_id,
+            "items": len(body.items),
+            "unique": len(groups),
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# --- WebSocket Chat ---
+WS_CHAT_WORKERS = int(os.getenv("WS_CHAT_WORKERS", "16"))
+WS_CHAT_HISTORY_TURNS = int(os.getenv("WS_CHAT_HISTORY_TURNS", "10"))
+
+# Như /ask/batch: câu trả lời chạy trên worker thread để event loop vẫn nhận được
+# tin nhắn mới (và lệnh huỷ) trong khi agent đang gọi LLM
+_ws_executor = ThreadPoolExecutor(max_workers=WS_CHAT_WORKERS, thread_name_prefix="ws-chat")
+_ws_stats = {"connections": 0, "active": 0, "answers": 0, "cancelled": 0, "errors": 0}
+
+# Tên stage hiển thị cho client; chỉ stage ngoài cùng (vd. không phải lời gọi LLM
+# bên trong routing) được gửi đi
+_WS_STAGE_LABELS = {"llm": "generation"}
+
+def _process_message_observed(text: str, chat_history: List[Dict], session_id: str, student_id: Optional[str],
+                              on_stage, on_delta, loop: asyncio.AbstractEventLoop,
+                              cancelled: threading.Event) -> Dict:
+    def listener(event: str, name: str, seconds: Optional[float]) -> None:
+        # Bị huỷ: dừng ở ranh giới stage kế tiếp thay vì gọi thêm LLM
+        if cancelled.is_set():
+            raise asyncio.CancelledError()
+        if not timing.open_stages():
+            on_stage(event, _WS_STAGE_LABELS.get(name, name), seconds)
+
+    # Lời gọi LLM sinh câu trả lời (profile generate) stream từng delta qua event loop chính
+    with timing.observe(listener), llm.stream_to(on_delta, loop):
+        return _process_message_blocking(text, chat_history, session_id, student_id)
+
+@app.websocket("/ws/chat")
+async def ws_chat(websocket: WebSocket, token: Optional[str] = None, session_id: Optional[str] = None):
+    """
+    Kênh chat qua WebSocket: xác thực JWT một lần khi kết nối (header Authorization
+    hoặc ?token=; thiếu/sai thì đóng với mã 1008), giữ lịch sử phiên trong bộ nhớ
+    suốt kết nối (ghi xuyên xuống Redis). ?session_id= chỉ được dùng khi phiên thuộc
+    về sinh viên này, nếu không server cấp session mới (xem "ready").
+
+    Client gửi:  {"type": "message", "text": "...", "id": "..."} | {"type": "cancel"} | {"type": "ping"}
+    Server gửi:  ready, stage (routing/retrieval/generation start|end), delta, done,
+                 cancelled, error, pong. Tin nhắn mới huỷ câu trả lời đang chạy.
+                 delta là token của lời gọi LLM sinh câu trả lời khi provider stream được
+                 (vllm/ollama/gemini), nếu không thì cả câu trả lời; một stage generation
+                 mới bắt đầu lại nội dung, done mang câu trả lời cuối cùng.
+    """
+    authorization = websocket.headers.get("authorization")
+    if not authorization and token:
+        authorization = f"Bearer {token}"
+    student_id = None
+    if authorization and authorization.startswith("Bearer "):
+        student_id = extract_student_id_from_jwt(authorization.split(" ", 1)[1])
+    if not student_id:
+        await websocket.close(code=1008)  # policy violation
+        return
+    if not session_id or not student_owns_session(student_id, session_id):
+        session_id = str(uuid.uuid4())
+    await websocket.accept()
+
+    loop = asyncio.get_running_loop()
+    outbox: asyncio.Queue = asyncio.Queue()
+    history = get_chat_history(session_id, WS_CHAT_HISTORY_TURNS)
+    current: Optional[asyncio.Task] = None
+    _ws_stats["connections"] += 1
+    _ws_stats["active"] += 1
+
+    async def send_loop():
+        while True:
+            await websocket.send_json(await outbox.get())
+
+    async def answer(message_id: str, text: str):
+        cancelled = threading.Event()
+
+        streamed = []
+
+        def on_stage(event: str, name: str, seconds: Optional[float]) -> None:
+            data = {"type": "stage", "id": message_id, "stage": name, "status": event}
+            if seconds is not None:
+                data["duration_ms"] = round(seconds * 1000, 1)
+            loop.call_soon_threadsafe(outbox.put_nowait, data)
+
+        def on_delta(delta: str) -> None:
+            # Chạy trên event loop chính
+            if cancelled.is_set():
+                raise asyncio.CancelledError()
+            streamed.append(delta)
+            outbox.put_nowait({"type": "delta", "id": message_id, "text": delta})
+
+        started = time.perf_counter()
+        try:
+            response = await loop.run_in_executor(
+                _ws_executor, _process_message_observed,
+                text, list(history), session_id, student_id, on_stage, on_delta, loop, cancelled
+            )
+        except asyncio.CancelledError:
+            cancelled.set()
+            _ws_stats["cancelled"] += 1
+            outbox.put_nowait({"type": "cancelled", "id": message_id})
+            raise
+        except Exception as e:
+            logger.exception("Error in /ws/chat: %s", e)
+            _ws_stats["errors"] += 1
+            outbox.put_nowait({"type": "error", "id": message_id,
+                               "detail": "Xin lỗi, hệ thống đang gặp sự cố. Bạn vui lòng thử lại sau."})
+            return
+
+        final_reply = response.get("reply", "Xin lỗi, tôi không thể xử lý yêu cầu này.")
+        if not streamed:
+            # Câu trả lời không qua LLM (rule-based, action...): gửi một delta
+            outbox.put_nowait({"type": "delta", "id": message_id, "text": final_reply})
+
+        history.append({"user": text, "bot": final_reply, "timestamp": time.time(),
+                        "agent": response.get("agent", "unknown"), "student_id": student_id})
+        del history[:-WS_CHAT_HISTORY_TURNS]
+        add_to_chat_history(session_id, text, final_reply, response, student_id)
+        quality_monitor.enqueue_turn(r, session_id, text, response)
+        _ws_stats["answers"] += 1
+
+        outbox.put_nowait({
+            "type": "done",
+            "id": message_id,
+            "reply": final_reply,
+            "agent_info": {
+                "agent": response.get("agent", "unknown"),
+                "routing_info": response.get("routing_info", {}),
+                "suggested_action": response.get("suggested_action"),
+                "sources": response.get("sources", [])
+            },
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    sender = asyncio.create_task(send_loop())
+    outbox.put_nowait({"type": "ready", "session_id": session_id, "student_id": student_id})
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                outbox.put_nowait({"type": "error", "detail": "Invalid JSON"})
+                continue
+            kind = data.get("type", "message") if isinstance(data, dict) else None
+
+            if kind == "ping":
+                outbox.put_nowait({"type": "pong"})
+            elif kind in ("message", "cancel"):
+                if current and not current.done():
+                    current.cancel()
+                if kind == "message":
+                    text = (data.get("text") or "").strip()
+                    if not text:
+                        outbox.put_nowait({"type": "error", "id": data.get("id"), "detail": "text is required"})
+                        continue
+                    current = asyncio.create_task(answer(str(data.get("id") or uuid.uuid4()), text))
+            else:
+                outbox.put_nowait({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _ws_stats["active"] -= 1
+        if current and not current.done():
+            current.cancel()
+        sender.cancel()
+
 @app.post("/tts")
 async def text_to_speech(body: TtsBody):
     """
@@ -317,11 +752,13 @@ async def text_to_speech(body: TtsBody):
             "xi-api-key": voice_service.api_key
         }
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
+        async with httpx.AsyncClient() as client:
+            response = await upstream("elevenlabs", max_timeout=60.0).request(
+                client, "POST",
                 f"{voice_service.base_url}/text-to-speech/{voice_id}",
                 headers=headers,
-                json=data
+                json=data,
+                idempotent=True
             )
             
             if response.status_code != 200:
@@ -357,6 +794,29 @@ async def health_check():
         "total_agents": len(available_agents)
     }
 
+# --- Metrics ---
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics của gateway"""
+    archiver = getattr(app.state, "archiver", None)
+    return {
+        "password_hashing": security.hash_pool.stats(),
+        "chat_archiver": archiver.stats if archiver else None,
+        "llm": llm.stats(),
+        "upstreams": upstream_stats(),
+        "ws_chat": dict(_ws_stats),
+        "speculation": agent_manager.speculation.stats() if hasattr(agent_manager, "speculation") else None,
+    }
+
+# --- Answer Quality ---
+@app.get("/quality")
+async def get_quality(days: int = Query(7, ge=1, le=quality_monitor.QUALITY_RETENTION_DAYS), agent: Optional[str] = None):
+    """Điểm chất lượng trung bình (CriticAgent, chấm nền trên các lượt được lấy mẫu) theo agent và ngày"""
+    return {
+        "sample_rate": quality_monitor.QUALITY_SAMPLE_RATE,
+        "days": quality_monitor.quality_report(r, days, agent),
+    }
+
 # --- Agent Info ---
 @app.get("/agents")
 async def get_agents():
@@ -375,11 +835,11 @@ async def get_chat_logs():
         # Use scan_iter to avoid blocking Redis
         for key in r.scan_iter(match="chat_history:*", count=100):
             session_id = key.replace("chat_history:", "")
-            history_raw = r.lrange(key, 0, -1)  # newest -> oldest
+            history_raw = r_history.lrange(key, 0, -1)  # newest -> oldest
             if not history_raw:
                 continue
             # Convert and reverse once for chronological order oldest -> newest
-            messages = [json.loads(h) for h in reversed(history_raw)]
+            messages = [chat_history_codec.decode_turn(h) for h in reversed(history_raw)]
             first_msg = messages[0]
             last_msg = messages[-1]
             session_key = f"session_meta:{session_id}"
@@ -417,7 +877,7 @@ async def get_chat_logs():
 async def get_chat_log_detail(session_id: str):
     """Lấy chi tiết một phiên chat"""
     try:
-        history = get_chat_history(session_id, limit=100)
+        history = await get_full_chat_history(session_id, limit=100)
         return {"session_id": session_id, "messages": history, "total_messages": len(history)}
     except Exception as e:
         logger.exception("Error getting chat log detail: %s", e)
@@ -491,7 +951,7 @@ async def get_my_tickets(
         if request.headers.get("authorization"):
             headers["authorization"] = request.headers.get("authorization")
         
-        response = await client.get(target_url, headers=headers)
+        response = await upstream("ticket").request(client, "GET", target_url, headers=headers)
         
         if response.status_code == 404:
             return []  # Return empty list if no tickets found
@@ -538,6 +998,40 @@ async def get_my_tickets(
             detail="Internal server error"
         )
 
+@app.get("/me/sessions", response_model=PaginatedSessions)
+async def get_my_sessions(
+    student_id: Optional[str] = Depends(get_student_id),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(20, ge=1, le=100)
+):
+    """List the current student's chat sessions, most recently active first"""
+    if not student_id:
+        raise HTTPException(
+            status_code=401,
+            detail="Student ID not found in JWT or x-student-id header"
+        )
+
+    index_key = _student_sessions_key(student_id)
+    start = (page - 1) * per_page
+    entries = r.zrevrange(index_key, start, start + per_page - 1, withscores=True)
+    total = r.zcard(index_key)
+
+    pipe = r.pipeline(transaction=False)
+    for session_id, _ in entries:
+        pipe.hget(f"session_meta:{session_id}", "status")
+    statuses = pipe.execute() if entries else []
+
+    return PaginatedSessions(
+        sessions=[
+            # Metadata expires after 24h; older sessions are finished by definition
+            SessionSummary(session_id=session_id, last_activity=score, status=status or "completed")
+            for (session_id, score), status in zip(entries, statuses)
+        ],
+        total=total,
+        page=page,
+        per_page=per_page
+    )
+
 @app.get("/sessions/{session_id}/history", response_model=List[ChatMessage])
 async def get_session_history(
     session_id: str,
@@ -551,25 +1045,23 @@ async def get_session_history(
             detail="Student ID not found in JWT or x-student-id header"
         )
     
+    # Ownership is checked once against the per-student session index
+    # (404 rather than 403 so session IDs of other students are not confirmed)
+    if not student_owns_session(student_id, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
     try:
-        # Get chat history from Redis
-        history = get_chat_history(session_id, limit)
-        
-        # Filter by student_id for security (users should only see their own sessions)
-        filtered_history = []
-        for message in history:
-            msg_student_id = message.get("student_id")
-            # Allow if no student_id in message (legacy) or if it matches
-            if not msg_student_id or msg_student_id == student_id:
-                filtered_history.append(ChatMessage(
-                    user=message.get("user", ""),
-                    bot=message.get("bot", ""),
-                    timestamp=message.get("timestamp", 0),
-                    agent=message.get("agent", "unknown"),
-                    student_id=message.get("student_id")
-                ))
-        
-        return filtered_history
+        history = await get_full_chat_history(session_id, limit)
+        return [
+            ChatMessage(
+                user=message.get("user", ""),
+                bot=message.get("bot", ""),
+                timestamp=message.get("timestamp", 0),
+                agent=message.get("agent", "unknown"),
+                student_id=message.get("student_id")
+            )
+            for message in history
+        ]
         
     except Exception as e:
         logger.error("Error getting session history: %s", e)
@@ -611,14 +1103,15 @@ async def call_tool(
         
         # Forward request to action service
         client: httpx.AsyncClient = app.state.http_client
-        response = await client.post(
-            f"{ACTION_URL}/call_tool",
-            json={
-                "tool_name": request.tool_name,
-                "tool_args": request.tool_args
-            },
-            timeout=30.0
-        )
+        with timing.stage("action"):
+            response = await upstream("action").request(
+                client, "POST",
+                f"{ACTION_URL}/call_tool",
+                json={
+                    "tool_name": request.tool_name,
+                    "tool_args": request.tool_args
+                }
+            )
         
         if response.status_code == 400:
             # Forward validation errors from action service
@@ -657,7 +1150,7 @@ async def get_available_tools():
     """Get list of available tools from Action service"""
     try:
         client: httpx.AsyncClient = app.state.http_client
-        response = await client.get(f"{ACTION_URL}/tools", timeout=10.0)
+        response = await upstream("action").request(client, "GET", f"{ACTION_URL}/tools")
         
         if response.status_code == 200:
             return response.json()
@@ -725,10 +1218,10 @@ async def admin_get_action_requests(
         params["limit"] = limit
         params["offset"] = offset
         
-        response = await client.get(
+        response = await upstream("action").request(
+            client, "GET",
             f"{ACTION_URL}/admin/action-requests",
-            params=params,
-            timeout=30.0
+            params=params
         )
         response.raise_for_status()
         return response.json()
@@ -746,9 +1239,9 @@ async def admin_get_action_request(request_id: int, request: Request):
     """Proxy admin action request details to action service"""
     try:
         client = app.state.http_client
-        response = await client.get(
-            f"{ACTION_URL}/admin/action-requests/{request_id}",
-            timeout=30.0
+        response = await upstream("action").request(
+            client, "GET",
+            f"{ACTION_URL}/admin/action-requests/{request_id}"
         )
         response.raise_for_status()
         return response.json()
@@ -766,9 +1259,9 @@ async def admin_get_action_requests_stats(request: Request):
     """Proxy admin action requests stats to action service"""
     try:
         client = app.state.http_client
-        response = await client.get(
-            f"{ACTION_URL}/admin/action-requests/stats",
-            timeout=30.0
+        response = await upstream("action").request(
+            client, "GET",
+            f"{ACTION_URL}/admin/action-requests/stats"
         )
         response.raise_for_status()
         return response.json()
@@ -788,11 +1281,11 @@ async def admin_update_action_request(request_id: int, request: Request):
         client = app.state.http_client
         body = await request.body()
         
-        response = await client.patch(
+        response = await upstream("action").request(
+            client, "PATCH",
             f"{ACTION_URL}/admin/action-requests/{request_id}",
             content=body,
-            headers={"Content-Type": "application/json"},
-            timeout=30.0
+            headers={"Content-Type": "application/json"}
         )
         response.raise_for_status()
         return response.json()
@@ -809,7 +1302,8 @@ async def admin_update_action_request(request_id: int, request: Request):
 async def voice_chat(
     audio_file: UploadFile = File(...),
     session_id: Optional[str] = None,
-    student_id: str = Depends(get_student_id)
+    student_id: str = Depends(get_student_id),
+    verified_id: Optional[str] = Depends(get_authenticated_student_id)
 ):
     """
     Voice chat endpoint: receive audio, transcribe, process, and return text + audio response
@@ -829,6 +1323,8 @@ async def voice_chat(
     # Generate session ID if not provided
     if not session_id:
         session_id = str(uuid.uuid4())
+    elif not session_open_to(student_id, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
     
     try:
         # Read audio file
@@ -836,13 +1332,15 @@ async def voice_chat(
         
         # Create a wrapper function for agent processing
         async def ask_agent_func(text: str) -> dict:
-            chat_history = get_chat_history(session_id)
-            response = await agent_manager.process_message(
-                user_message=text,
-                chat_history=chat_history,
-                session_id=session_id,
-                student_id=student_id
-            )
+            with timing.stage("history_load"):
+                chat_history = get_chat_history(session_id)
+            with timing.stage("agents"), _token_budget(verified_id):
+                response = await agent_manager.process_message(
+                    user_message=text,
+                    chat_history=chat_history,
+                    session_id=session_id,
+                    student_id=verified_id
+                )
             return response
         
         # Process voice chat through VoiceManager
@@ -859,13 +1357,14 @@ async def voice_chat(
         
         # Update chat history if successful
         if result.get("transcript") and result.get("text"):
-            add_to_chat_history(
-                session_id, 
-                result["transcript"], 
-                result["text"], 
-                {"agent": "voice_chat"}, 
-                student_id
-            )
+            with timing.stage("history_save"):
+                add_to_chat_history(
+                    session_id, 
+                    result["transcript"], 
+                    result["text"], 
+                    {"agent": "voice_chat"}, 
+                    student_id
+                )
         
         return {
             "session_id": session_id,
@@ -0,0 +1,112 @@
+"""
+Command-line client for POST /ask/batch.
+
+Reads questions from a JSONL file (or stdin), sends them to the gateway in
+chunks of at most ASK_BATCH_MAX_ITEMS, and writes the NDJSON result lines as
+they stream back. Input lines may be
+    {"id": "...", "text": "...", "session_id": "..."}
+    {"title": "...", "body": "..."}          # ticket exports / backlog style
+    plain text (one question per line)
+
+Usage:
+    python ask_batch.py questions.jsonl --url http://localhost:8000 -o results.ndjson
+    cat faq_regression.jsonl | python ask_batch.py - --concurrency 4
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+
+def read_items(path: str) -> Iterator[Dict]:
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                data = line
+            if isinstance(data, str):
+                yield {"id": str(number), "text": data}
+                continue
+            text = data.get("text") or " ".join(p for p in (data.get("title"), data.get("body")) if p)
+            if not text:
+                continue
+            item = {"id": str(data.get("id") or data.get("request_id") or number), "text": text}
+            # Không gửi student_id: gateway dùng sinh viên của JWT (--token)
+            if data.get("session_id"):
+                item["session_id"] = data["session_id"]
+            yield item
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def chunked(items: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk: List[Dict] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(args) -> Dict:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    totals = {"items": 0, "unique": 0, "errors": 0, "elapsed_ms": 0.0}
+    try:
+        with httpx.Client(base_url=args.url.rstrip("/"), headers=headers, timeout=None) as client:
+            for chunk in chunked(read_items(args.input), args.chunk_size):
+                payload = {"items": chunk, "save_history": args.save_history}
+                if args.concurrency:
+                    payload["concurrency"] = args.concurrency
+                with client.stream("POST", "/ask/batch", json=payload) as response:
+                    if response.status_code != 200:
+                        response.read()
+                        raise SystemExit(f"/ask/batch failed: {response.status_code} {response.text}")
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        if data.get("type") == "summary":
+                            for key in totals:
+                                totals[key] += data.get(key, 0)
+                            continue
+                        out.write(line + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Send questions through the gateway /ask/batch endpoint")
+    parser.add_argument("input", help="JSONL/text file with one question per line, or - for stdin")
+    parser.add_argument("--url", default=os.getenv("GATEWAY_URL", "http://localhost:8000"))
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default stdout)")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("ASK_BATCH_MAX_ITEMS", "1000")))
+    parser.add_argument("--concurrency", type=int, help="Per-batch concurrency (capped by the server)")
+    parser.add_argument("--token", default=os.getenv("GATEWAY_TOKEN"), help="Bearer token")
+    parser.add_argument("--save-history", action="store_true", help="Store turns for items with a session_id")
+    args = parser.parse_args(argv)
+
+    totals = run(args)
+    print(
+        f"{totals['items']} items ({totals['unique']} unique), {totals['errors']} errors, "
+        f"{totals['elapsed_ms'] / 1000:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Cold-storage archiver for chat sessions.
+
+Chat history lives in Redis (chat_history:{session_id}) with a 24h TTL. This
+module moves sessions that are done with out of Redis into an append-only
+store so that Redis only holds the hot working set:
+
+- MySQL table chat_turn_archive (bulk executemany inserts), always on
+- partitioned Parquet files (dt=YYYY-MM-DD/part-*.parquet) when
+  ARCHIVE_PARQUET_DIR is set and pyarrow is installed
+
+A session is copied to the archive when its session_meta:{session_id} status
+is "completed" or it has been idle for ARCHIVE_IDLE_SECONDS; its turns stay in
+Redis so /ask, /ws/chat and the history endpoints keep the conversation (a
+"cảm ơn" followed by another question is common). Only turns newer than the
+last copy (session_meta archived_until) are inserted.
+
+Archived turns leave Redis in two steps, always after a copy and only from
+the tail that was read, so turns added while a pass runs are never lost:
+
+- completed or idle for ARCHIVE_TRIM_AFTER_SECONDS: all but the newest
+  ARCHIVE_KEEP_TURNS (the context /ask and /ws/chat load) are trimmed; the
+  history endpoints read older turns from the archive (get_full_chat_history)
+- chat_history key about to expire (TTL below ARCHIVE_TTL_MARGIN_SECONDS):
+  every archived turn is trimmed
+
+Run inside the gateway (ARCHIVER_INTERVAL_SECONDS > 0) or as a one-off:
+    python chat_archiver.py --once
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from redis import Redis
+from sqlalchemy import func, insert, select
+
+sys.path.append('/app')
+import chat_history_codec
+import models
+from database import SessionLocal, engine
+
+logger = logging.getLogger("gateway.chat_archiver")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+ARCHIVER_INTERVAL_SECONDS = float(os.getenv("ARCHIVER_INTERVAL_SECONDS", "300"))
+ARCHIVE_IDLE_SECONDS = float(os.getenv("ARCHIVE_IDLE_SECONDS", "7200"))
+ARCHIVE_TTL_MARGIN_SECONDS = int(os.getenv("ARCHIVE_TTL_MARGIN_SECONDS", "3600"))
+ARCHIVE_TRIM_AFTER_SECONDS = float(os.getenv("ARCHIVE_TRIM_AFTER_SECONDS", "21600"))
+ARCHIVE_KEEP_TURNS = int(os.getenv("ARCHIVE_KEEP_TURNS", "10"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_PARQUET_DIR = os.getenv("ARCHIVE_PARQUET_DIR", "")
+ARCHIVER_LOCK_KEY = "chat_archiver:lock"
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+def create_archive_tables() -> None:
+    models.Base.metadata.create_all(bind=engine, tables=[models.ChatTurnArchive.__table__])
+
+
+class ParquetArchiveSink:
+    """Writes archived turns as date-partitioned Parquet files"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def write(self, rows: List[Dict]) -> None:
+        by_day: Dict[str, List[Dict]] = {}
+        for row in rows:
+            day = datetime.fromtimestamp(row["timestamp"], tz=timezone.utc).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append(row)
+        for day, day_rows in by_day.items():
+            partition = os.path.join(self.base_dir, f"dt={day}")
+            os.makedirs(partition, exist_ok=True)
+            table = pyarrow.Table.from_pylist(day_rows)
+            pq.write_table(table, os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet"), compression="zstd")
+
+
+class ChatArchiver:
+    """Copies completed / idle chat sessions to cold storage and trims archived turns from Redis"""
+
+    def __init__(self, redis_client: Redis, session_factory=SessionLocal, parquet_dir: str = ARCHIVE_PARQUET_DIR):
+        # Needs a bytes client: chat turns are binary encoded
+        self.redis = redis_client
+        self.session_factory = session_factory
+        self.parquet_sink = None
+        if parquet_dir:
+            if PYARROW_AVAILABLE:
+                self.parquet_sink = ParquetArchiveSink(parquet_dir)
+            else:
+                logger.warning("ARCHIVE_PARQUET_DIR set but pyarrow is not installed; Parquet sink disabled")
+        self.stats = {"passes": 0, "sessions_archived": 0, "turns_archived": 0, "last_pass_seconds": 0.0}
+
+    def _should_archive(self, session_id: str, meta: Dict[bytes, bytes], now: float) -> bool:
+        """Completed or idle with turns newer than the last copy"""
+        last_activity = float(meta.get(b"last_activity", now))
+        if float(meta.get(b"archived_at", 0)) >= last_activity:
+            return False
+        status = meta.get(b"status", b"active").decode()
+        if status == "completed":
+            return True
+        return now - last_activity >= ARCHIVE_IDLE_SECONDS
+
+    def _trim_due(self, session_id: str, meta: Dict[bytes, bytes], now: float) -> bool:
+        """No activity for ARCHIVE_TRIM_AFTER_SECONDS and more than ARCHIVE_KEEP_TURNS turns in Redis"""
+        last_activity = float(meta.get(b"last_activity", now))
+        if now - last_activity < ARCHIVE_TRIM_AFTER_SECONDS:
+            return False
+        return self.redis.llen(f"chat_history:{session_id}") > ARCHIVE_KEEP_TURNS
+
+    def _is_expiring(self, session_id: str) -> bool:
+        ttl = self.redis.ttl(f"chat_history:{session_id}")
+        return 0 <= ttl < ARCHIVE_TTL_MARGIN_SECONDS
+
+    def archive_session(self, session_id: str, keep: Optional[int] = None) -> int:
+        """
+        Copy the turns of a session not archived yet; returns number of turns copied.
+        With keep=N the archived turns except the newest N are removed from Redis.
+        """
+        key = f"chat_history:{session_id}"
+        meta_key = f"session_meta:{session_id}"
+        raw_turns = self.redis.lrange(key, 0, -1)  # newest -> oldest
+        if not raw_turns:
+            return 0
+        turns = [chat_history_codec.decode_turn(raw) for raw in reversed(raw_turns)]
+        archived_until = float(self.redis.hget(meta_key, "archived_until") or 0)
+        new_turns = [t for t in turns if float(t.get("timestamp") or 0.0) > archived_until]
+
+        rows = []
+        if new_turns:
+            db = self.session_factory()
+            try:
+                last_index = db.execute(
+                    select(func.max(models.ChatTurnArchive.turn_index))
+                    .where(models.ChatTurnArchive.session_id == session_id)
+                ).scalar()
+                start_index = 0 if last_index is None else last_index + 1
+                rows = [
+                    {
+                        "session_id": session_id,
+                        "turn_index": start_index + i,
+                        "student_id": turn.get("student_id"),
+                        "agent": turn.get("agent"),
+                        "user_message": turn.get("user"),
+                        "bot_message": turn.get("bot"),
+                        "timestamp": float(turn.get("timestamp") or 0.0),
+                    }
+                    for i, turn in enumerate(new_turns)
+                ]
+                for offset in range(0, len(rows), ARCHIVE_BATCH_SIZE):
+                    db.execute(insert(models.ChatTurnArchive), rows[offset:offset + ARCHIVE_BATCH_SIZE])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            if self.parquet_sink:
+                try:
+                    self.parquet_sink.write(rows)
+                except Exception:
+                    logger.exception("Parquet archive write failed for session %s", session_id)
+
+        meta = {"archived_at": time.time()}
+        if rows:
+            meta["archived_until"] = max(row["timestamp"] for row in rows)
+        self.redis.hset(meta_key, mapping=meta)
+        if keep is not None and len(raw_turns) > keep:
+            # Drop only the oldest turns we read; newer pushes stay hot
+            self.redis.ltrim(key, 0, -(len(raw_turns) - keep + 1))
+        return len(rows)
+
+    def run_once(self) -> Dict:
+        """Run a single archival pass across all sessions"""
+        started = time.time()
+        sessions = turns = 0
+        for meta_key in self.redis.scan_iter(match="session_meta:*", count=200):
+            session_id = meta_key.decode().split(":", 1)[1]
+            try:
+                meta = self.redis.hgetall(meta_key)
+                if self._is_expiring(session_id):
+                    keep = 0
+                elif self._trim_due(session_id, meta, started):
+                    keep = ARCHIVE_KEEP_TURNS
+                elif self._should_archive(session_id, meta, started):
+                    keep = None
+                else:
+                    continue
+                archived = self.archive_session(session_id, keep=keep)
+            except Exception:
+                logger.exception("Failed to archive session %s", session_id)
+                continue
+            if archived:
+                sessions += 1
+                turns += archived
+        self.stats["passes"] += 1
+        self.stats["sessions_archived"] += sessions
+        self.stats["turns_archived"] += turns
+        self.stats["last_pass_seconds"] = round(time.time() - started, 3)
+        logger.info("Archive pass done: sessions=%d turns=%d in %.2fs", sessions, turns, time.time() - started)
+        return {"sessions": sessions, "turns": turns}
+
+    async def run_forever(self, interval: float = ARCHIVER_INTERVAL_SECONDS) -> None:
+        """Periodic archival loop; only one gateway replica runs a pass at a time"""
+        while True:
+            try:
+                if self.redis.set(ARCHIVER_LOCK_KEY, b"1", nx=True, ex=max(int(interval), 60)):
+                    await asyncio.to_thread(self.run_once)
+            except Exception:
+                logger.exception("Chat archiver pass failed")
+            await asyncio.sleep(interval)
+
+
+def load_archived_history(session_id: str, limit: int = 100) -> List[Dict]:
+    """Read the most recent archived turns of a session (chronological order)"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.ChatTurnArchive)
+            .where(models.ChatTurnArchive.session_id == session_id)
+            .order_by(models.ChatTurnArchive.turn_index.desc())
+            .limit(limit)
+        ).scalars().all()
+    finally:
+        db.close()
+    return [
+        {
+            "user": row.user_message,
+            "bot": row.bot_message,
+            "timestamp": row.timestamp,
+            "agent": row.agent,
+            "student_id": row.student_id,
+        }
+        for row in reversed(rows)
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    parser = argparse.ArgumentParser(description="Archive chat sessions from Redis to cold storage")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = parser.parse_args()
+
+    create_archive_tables()
+    archiver = ChatArchiver(Redis.from_url(REDIS_URL, decode_responses=False))
+    if args.once:
+        print(archiver.run_once())
+    else:
+        asyncio.run(archiver.run_forever())
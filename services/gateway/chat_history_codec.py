@@ -0,0 +1,107 @@
+"""
+Compact encoding for chat turns stored in Redis (chat_history:{session_id}).
+
+Version 1 layout: a 0x01 version byte followed by a msgpack array with
+positional fields, so keys are never repeated per turn:
+
+    [user, bot, timestamp, agent, student_id, flags]
+
+- agent is interned to a small int when it is one of KNOWN_AGENTS
+- bot is zstd-compressed when longer than CHAT_HISTORY_ZSTD_MIN_BYTES
+  (flags & FLAG_BOT_ZSTD)
+
+Legacy entries are plain JSON objects (first byte '{') and are still read
+transparently, so existing sessions keep working after a deploy.
+"""
+import os
+import json
+import logging
+from typing import Dict, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    logger.warning("msgpack not available, chat history will be stored as JSON")
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+CHAT_HISTORY_ENCODING = os.getenv("CHAT_HISTORY_ENCODING", "msgpack").lower()
+CHAT_HISTORY_ZSTD_MIN_BYTES = int(os.getenv("CHAT_HISTORY_ZSTD_MIN_BYTES", "512"))
+
+VERSION_1 = 0x01
+FLAG_BOT_ZSTD = 0x01
+
+# Append-only: codes are persisted in Redis, never reorder or remove entries
+KNOWN_AGENTS = [
+    "unknown",
+    "smart_lead",
+    "faq",
+    "technical",
+    "action_executor",
+    "greeting",
+    "critic",
+    "enhanced_rag",
+    "voice_chat",
+    "smart_agent_manager",
+    "error",
+]
+_AGENT_CODES = {name: code for code, name in enumerate(KNOWN_AGENTS)}
+
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if ZSTD_AVAILABLE else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if ZSTD_AVAILABLE else None
+
+
+def encode_turn(turn: Dict) -> bytes:
+    """Encode a chat turn for storage"""
+    if CHAT_HISTORY_ENCODING != "msgpack" or not MSGPACK_AVAILABLE:
+        return json.dumps(turn, ensure_ascii=False).encode("utf-8")
+
+    flags = 0
+    bot = turn.get("bot") or ""
+    bot_bytes = bot.encode("utf-8")
+    if ZSTD_AVAILABLE and len(bot_bytes) >= CHAT_HISTORY_ZSTD_MIN_BYTES:
+        bot = _zstd_compressor.compress(bot_bytes)
+        flags |= FLAG_BOT_ZSTD
+
+    agent = turn.get("agent") or "unknown"
+    fields = [
+        turn.get("user") or "",
+        bot,
+        turn.get("timestamp") or 0.0,
+        _AGENT_CODES.get(agent, agent),
+        turn.get("student_id"),
+        flags,
+    ]
+    return bytes([VERSION_1]) + msgpack.packb(fields, use_bin_type=True)
+
+
+def decode_turn(raw: Union[bytes, str]) -> Dict:
+    """Decode a stored chat turn (compact or legacy JSON)"""
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if raw[:1] == b"{":
+        return json.loads(raw)
+
+    version = raw[0]
+    if version != VERSION_1:
+        raise ValueError(f"Unknown chat history encoding version: {version}")
+    user, bot, timestamp, agent, student_id, flags = msgpack.unpackb(raw[1:], raw=False)
+    if flags & FLAG_BOT_ZSTD:
+        bot = _zstd_decompressor.decompress(bot).decode("utf-8")
+    if isinstance(agent, int):
+        agent = KNOWN_AGENTS[agent] if agent < len(KNOWN_AGENTS) else "unknown"
+    return {
+        "user": user,
+        "bot": bot,
+        "timestamp": timestamp,
+        "agent": agent,
+        "student_id": student_id,
+    }
@@ -7,9 +7,10 @@ def get_user_by_username(db: Session, username: str):
     """Fetches a user by their username."""
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
     """Creates a new user in the database."""
-    hashed_password = security.get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = security.get_password_hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -20,4 +21,10 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user 
\ No newline at end of file
+    return db_user 
+
+def update_user_password_hash(db: Session, user: models.User, hashed_password: str):
+    """Replaces a user's stored password hash (e.g. after a bcrypt cost change)."""
+    user.hashed_password = hashed_password
+    db.commit()
+    return user
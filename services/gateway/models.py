@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum as SAEnum, TIMESTAMP
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, Enum as SAEnum, TIMESTAMP, Index
 from sqlalchemy.sql.expression import text
 import sys
 sys.path.append('/app')
@@ -19,4 +19,23 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     role = Column(SAEnum(UserRole), nullable=False, default=UserRole.student)
     created_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP'))
-    updated_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP')) 
\ No newline at end of file
+    updated_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'))
+
+
+class ChatTurnArchive(Base):
+    """Append-only cold storage for chat turns evicted from Redis"""
+    __tablename__ = "chat_turn_archive"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    session_id = Column(String(64), nullable=False)
+    turn_index = Column(Integer, nullable=False)
+    student_id = Column(String(64), nullable=True, index=True)
+    agent = Column(String(64), nullable=True)
+    user_message = Column(Text, nullable=True)
+    bot_message = Column(Text, nullable=True)
+    timestamp = Column(Float, nullable=False)
+    archived_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP'))
+
+    __table_args__ = (
+        Index("ix_chat_turn_archive_session_turn", "session_id", "turn_index"),
+    )
@@ -0,0 +1,271 @@
+"""
+Background answer-quality monitoring with CriticAgent.
+
+/ask and /ws/chat sample QUALITY_SAMPLE_RATE of the answered turns into the
+Redis stream QUALITY_STREAM_KEY (one XADD, no LLM call on the request path).
+Quality workers read the stream through a consumer group, score the turns
+with CriticAgent.evaluate_batch (QUALITY_BATCH_SIZE turns per LLM call, at
+most QUALITY_CONCURRENCY calls in flight per worker) and fold the scores into
+per-day aggregates:
+
+    quality:daily:{YYYY-MM-DD}  hash  {agent}:count, {agent}:overall_sum,
+                                      {agent}:{criterion}_sum, {agent}:fallback,
+                                      {agent}:failed
+
+Entries are acknowledged only after their scores are stored; entries left
+pending by a crashed worker or a failed critic call are reclaimed after
+QUALITY_CLAIM_IDLE_MS. An entry whose batch still fails after
+QUALITY_MAX_DELIVERIES deliveries (e.g. a turn too long for the critic) is
+acknowledged and counted as failed instead of re-billing the LLM forever.
+
+Run one or more workers next to the gateway:
+    python quality_monitor.py
+    python quality_monitor.py --once      # drain what is queued and exit
+"""
+import os
+import sys
+import time
+import socket
+import random
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import ResponseError
+
+sys.path.append('/app')
+
+logger = logging.getLogger("gateway.quality_monitor")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+QUALITY_SAMPLE_RATE = float(os.getenv("QUALITY_SAMPLE_RATE", "0.05"))
+QUALITY_STREAM_KEY = os.getenv("QUALITY_STREAM_KEY", "quality:turns")
+QUALITY_STREAM_MAXLEN = int(os.getenv("QUALITY_STREAM_MAXLEN", "10000"))
+QUALITY_GROUP = os.getenv("QUALITY_GROUP", "critic")
+QUALITY_BATCH_SIZE = int(os.getenv("QUALITY_BATCH_SIZE", "10"))
+QUALITY_CONCURRENCY = int(os.getenv("QUALITY_CONCURRENCY", "2"))
+QUALITY_CLAIM_IDLE_MS = int(os.getenv("QUALITY_CLAIM_IDLE_MS", "300000"))
+QUALITY_MAX_DELIVERIES = int(os.getenv("QUALITY_MAX_DELIVERIES", "3"))
+QUALITY_RETENTION_DAYS = int(os.getenv("QUALITY_RETENTION_DAYS", "90"))
+
+CRITERIA = ("accuracy", "completeness", "relevance", "clarity", "actionability", "safety")
+
+
+def _daily_key(day: str) -> str:
+    return f"quality:daily:{day}"
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def enqueue_turn(redis_client: Redis, session_id: Optional[str], user_message: str, response: Dict,
+                 sample_rate: Optional[float] = None) -> bool:
+    """Queue an answered turn for evaluation with probability `sample_rate`; never raises"""
+    rate = QUALITY_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        return False
+    try:
+        redis_client.xadd(QUALITY_STREAM_KEY, {
+            "session_id": session_id or "",
+            "agent": response.get("agent", "unknown"),
+            "question": user_message,
+            "reply": response.get("reply", ""),
+            "timestamp": time.time(),
+        }, maxlen=QUALITY_STREAM_MAXLEN, approximate=True)
+        return True
+    except Exception as e:
+        logger.warning("Could not queue turn for quality evaluation: %s", e)
+        return False
+
+
+class QualityWorker:
+    """Consumes sampled turns from the stream and aggregates CriticAgent scores"""
+
+    def __init__(self, redis_client: Redis, critic=None, consumer: Optional[str] = None,
+                 batch_size: int = QUALITY_BATCH_SIZE, concurrency: int = QUALITY_CONCURRENCY):
+        # Needs a str client (decode_responses=True)
+        self.redis = redis_client
+        if critic is None:
+            from agents import CriticAgent
+            critic = CriticAgent()
+        self.critic = critic
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        # LLM calls của critic có ngân sách thread riêng, không dùng chung với gateway
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="quality-critic")
+        self.stats = {"turns_scored": 0, "batches": 0, "failed_batches": 0, "turns_failed": 0,
+                      "last_pass_seconds": 0.0}
+
+    def ensure_group(self) -> None:
+        try:
+            self.redis.xgroup_create(QUALITY_STREAM_KEY, QUALITY_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self, block_ms: Optional[int]) -> List[Tuple[str, Dict]]:
+        count = self.batch_size * self.concurrency
+        # Lấy lại các entry mà worker khác nhận nhưng chưa ack (worker chết giữa chừng)
+        claimed = self.redis.xautoclaim(QUALITY_STREAM_KEY, QUALITY_GROUP, self.consumer,
+                                        min_idle_time=QUALITY_CLAIM_IDLE_MS, start_id="0-0", count=count)
+        entries = list(claimed[1]) if claimed else []
+        if len(entries) < count:
+            response = self.redis.xreadgroup(QUALITY_GROUP, self.consumer, {QUALITY_STREAM_KEY: ">"},
+                                             count=count - len(entries), block=block_ms)
+            for _stream, stream_entries in response or []:
+                entries.extend(stream_entries)
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def _score(self, batch: List[Tuple[str, Dict]]) -> List[Dict]:
+        return self.critic.evaluate_batch([
+            {"original_request": fields.get("question", ""),
+             "response": {"reply": fields.get("reply", ""), "agent": fields.get("agent", "unknown")}}
+            for _entry_id, fields in batch
+        ])
+
+    def _store(self, batch: List[Tuple[str, Dict]], evaluations: List[Dict]) -> None:
+        totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for (_entry_id, fields), evaluation in zip(batch, evaluations):
+            day = _day(float(fields.get("timestamp") or time.time()))
+            agent = fields.get("agent", "unknown")
+            if evaluation.get("fallback"):
+                # Critic không chấm được: chỉ đếm, không đưa điểm heuristic vào trung bình
+                totals[day][f"{agent}:fallback"] += 1
+                continue
+            totals[day][f"{agent}:count"] += 1
+            totals[day][f"{agent}:overall_sum"] += float(evaluation.get("overall_score") or 0.0)
+            for criterion, value in (evaluation.get("scores") or {}).items():
+                if criterion in CRITERIA and isinstance(value, (int, float)):
+                    totals[day][f"{agent}:{criterion}_sum"] += float(value)
+
+        pipe = self.redis.pipeline(transaction=True)
+        for day, fields in totals.items():
+            for field, value in fields.items():
+                pipe.hincrbyfloat(_daily_key(day), field, value)
+            pipe.expire(_daily_key(day), QUALITY_RETENTION_DAYS * 86400)
+        pipe.xack(QUALITY_STREAM_KEY, QUALITY_GROUP, *[entry_id for entry_id, _fields in batch])
+        pipe.execute()
+
+    def _give_up(self, batch: List[Tuple[str, Dict]]) -> int:
+        """Ack the entries of a failed batch delivered QUALITY_MAX_DELIVERIES times; returns how many"""
+        pipe = self.redis.pipeline(transaction=False)
+        for entry_id, _fields in batch:
+            pipe.xpending_range(QUALITY_STREAM_KEY, QUALITY_GROUP, min=entry_id, max=entry_id, count=1)
+        deliveries = {p["message_id"]: p["times_delivered"] for pending in pipe.execute() for p in pending}
+        exhausted = [(entry_id, fields) for entry_id, fields in batch
+                     if deliveries.get(entry_id, 0) >= QUALITY_MAX_DELIVERIES]
+        if not exhausted:
+            return 0
+
+        failed: Dict[Tuple[str, str], int] = defaultdict(int)
+        for _entry_id, fields in exhausted:
+            failed[(_day(float(fields.get("timestamp") or time.time())), fields.get("agent", "unknown"))] += 1
+        pipe = self.redis.pipeline(transaction=True)
+        for (day, agent), count in failed.items():
+            pipe.hincrbyfloat(_daily_key(day), f"{agent}:failed", count)
+            pipe.expire(_daily_key(day), QUALITY_RETENTION_DAYS * 86400)
+        pipe.xack(QUALITY_STREAM_KEY, QUALITY_GROUP, *[entry_id for entry_id, _fields in exhausted])
+        pipe.execute()
+        return len(exhausted)
+
+    def run_once(self, block_ms: Optional[int] = None) -> int:
+        """Score one round of up to batch_size * concurrency turns; returns turns scored"""
+        started = time.time()
+        entries = self._read(block_ms)
+        batches = [entries[i:i + self.batch_size] for i in range(0, len(entries), self.batch_size)]
+        futures = [(batch, self._executor.submit(self._score, batch)) for batch in batches]
+        scored = 0
+        for batch, future in futures:
+            try:
+                self._store(batch, future.result())
+                scored += len(batch)
+                self.stats["batches"] += 1
+            except Exception:
+                # Không ack: entry sẽ được worker khác (hoặc lần sau) lấy lại, tối đa
+                # QUALITY_MAX_DELIVERIES lần
+                logger.exception("Quality evaluation batch failed")
+                self.stats["failed_batches"] += 1
+                try:
+                    dropped = self._give_up(batch)
+                except Exception:
+                    logger.exception("Could not check delivery count of failed quality batch")
+                    continue
+                if dropped:
+                    logger.error("Dropped %d quality turns after %d failed deliveries", dropped, QUALITY_MAX_DELIVERIES)
+                    self.stats["turns_failed"] += dropped
+        self.stats["turns_scored"] += scored
+        self.stats["last_pass_seconds"] = round(time.time() - started, 3)
+        return scored
+
+    def run_forever(self, block_ms: int = 5000) -> None:
+        self.ensure_group()
+        while True:
+            try:
+                self.run_once(block_ms)
+            except Exception:
+                logger.exception("Quality worker pass failed")
+                time.sleep(5)
+
+    def drain(self) -> int:
+        """Score everything currently queued, then return"""
+        self.ensure_group()
+        total = 0
+        while True:
+            scored = self.run_once()
+            if not scored:
+                return total
+            total += scored
+
+
+def quality_report(redis_client: Redis, days: int = 7, agent: Optional[str] = None) -> List[Dict]:
+    """Mean critic scores per agent and day (UTC), most recent day first"""
+    today = datetime.now(timezone.utc).date()
+    day_list = [(today - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(max(1, days))]
+    pipe = redis_client.pipeline(transaction=False)
+    for day in day_list:
+        pipe.hgetall(_daily_key(day))
+
+    rows = []
+    for day, raw in zip(day_list, pipe.execute()):
+        by_agent: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for field, value in raw.items():
+            name, _, metric = field.rpartition(":")
+            by_agent[name][metric] = float(value)
+        for name, metrics in sorted(by_agent.items()):
+            if agent and name != agent:
+                continue
+            count = int(metrics.get("count", 0))
+            rows.append({
+                "day": day,
+                "agent": name,
+                "count": count,
+                "fallback": int(metrics.get("fallback", 0)),
+                "failed": int(metrics.get("failed", 0)),
+                "mean_overall_score": round(metrics.get("overall_sum", 0.0) / count, 2) if count else None,
+                "criteria": {
+                    criterion: round(metrics[f"{criterion}_sum"] / count, 2)
+                    for criterion in CRITERIA if count and f"{criterion}_sum" in metrics
+                },
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    parser = argparse.ArgumentParser(description="Score sampled chat turns with CriticAgent in the background")
+    parser.add_argument("--once", action="store_true", help="drain the queued turns and exit")
+    parser.add_argument("--consumer", help="consumer name (default host-pid)")
+    args = parser.parse_args()
+
+    worker = QualityWorker(Redis.from_url(REDIS_URL, decode_responses=True), consumer=args.consumer)
+    if args.once:
+        print(worker.drain())
+    else:
+        worker.run_forever()
@@ -1,22 +1,41 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import timedelta
 import sys
+import logging
 sys.path.append('/app')
 
 import crud, schemas, security
 from database import get_db
 
+logger = logging.getLogger("gateway.auth")
+
 router = APIRouter(
     prefix="/auth",
     tags=["Authentication"],
 )
 
+_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Authentication service is busy, please retry",
+    headers={"Retry-After": "1"},
+)
+
 @router.post("/token", response_model=schemas.LoginResponse)
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await run_in_threadpool(crud.get_user_by_username, db, username=form_data.username)
+    verified = False
+    if user:
+        try:
+            verified, new_hash = await security.hash_pool.verify_and_update(form_data.password, user.hashed_password)
+        except security.HashPoolBusy:
+            raise _busy_exception
+        if verified and new_hash:
+            logger.info("Rehashing password for user id=%s to bcrypt cost %s", user.id, security.BCRYPT_ROUNDS)
+            await run_in_threadpool(crud.update_user_password_hash, db, user, new_hash)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -29,8 +48,12 @@ def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2Passw
     return {"access_token": access_token, "token_type": "bearer", "user": user}
 
 @router.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user) 
\ No newline at end of file
+    try:
+        hashed_password = await security.hash_pool.hash(user.password)
+    except security.HashPoolBusy:
+        raise _busy_exception
+    return await run_in_threadpool(crud.create_user, db=db, user=user, hashed_password=hashed_password) 
\ No newline at end of file
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Request, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import os
 from typing import Iterable
 import logging
 
+from common import timing
+from common.resilience import route_of, upstream
+
 router = APIRouter(prefix="/tickets", tags=["tickets"])
 
 logger = logging.getLogger(__name__)
@@ -23,8 +28,17 @@ _HOP_BY_HOP = {
     "host",
 }
 
-# Reusable async client (will live for process lifetime; could be improved with lifespan event)
-_http_client = httpx.AsyncClient(timeout=10.0)
+# Headers forwarded upstream, including validators for conditional requests
+_FORWARDED_REQUEST_HEADERS = {
+    "authorization",
+    "content-type",
+    "content-length",
+    "accept",
+    "accept-encoding",
+    "if-none-match",
+    "if-modified-since",
+    "if-match",
+}
 
 
 def _filter_outgoing_headers(in_headers: Iterable[tuple[str, str]]) -> dict:
@@ -35,16 +49,17 @@ def _filter_outgoing_headers(in_headers: Iterable[tuple[str, str]]) -> dict:
         if kl in _HOP_BY_HOP:
             continue
         # Minimal forward set; extend if needed
-        if kl in {"authorization", "content-type", "accept", "accept-encoding"}:
+        if kl in _FORWARDED_REQUEST_HEADERS:
             allowed[k] = v
     return allowed
 
 
 def _filter_response_headers(in_headers: httpx.Headers) -> dict:
+    # Body is relayed as raw upstream bytes, so content-length/content-encoding/etag stay valid
     filtered = {}
     for k, v in in_headers.items():
         kl = k.lower()
-        if kl in _HOP_BY_HOP or kl == "content-length":
+        if kl in _HOP_BY_HOP:
             continue
         filtered[k] = v
     return filtered
@@ -60,29 +75,56 @@ async def _proxy_request(request: Request, target_url: str) -> Response:
     else:
         logger.debug("Proxy %s %s -> %s (no auth header)", method, request.url.path, target_url)
 
+    # Shared, lifespan-managed connection pool (see app startup/shutdown)
+    client: httpx.AsyncClient = request.app.state.http_client
+
     kwargs = {}
     if method in {"POST", "PUT", "PATCH", "DELETE"}:
-        body = await request.body()
-        if body:
-            kwargs["content"] = body
+        # Stream the request body upstream instead of buffering it
+        kwargs["content"] = request.stream()
+    ticket_upstream = upstream("ticket")
+    route = route_of(method, target_url)
+    upstream_request = client.build_request(
+        method=method, url=target_url, headers=headers, timeout=ticket_upstream.timeout(route), **kwargs
+    )
     try:
-        resp = await _http_client.request(method=method, url=target_url, headers=headers, **kwargs)
+        with timing.stage("ticket"):
+            # Only bodiless GETs can be replayed; streamed bodies are consumed by the first attempt
+            resp = await ticket_upstream.call(
+                lambda timeout: client.send(upstream_request, stream=True),
+                retries=ticket_upstream.retries if method == "GET" else 0,
+                route=route,
+            )
     except httpx.RequestError as e:
         logger.error("Ticket service request error: %s", e)
         raise HTTPException(status_code=503, detail=f"Ticket service unavailable: {e}")
 
+    response_headers = _filter_response_headers(resp.headers)
+
     if resp.status_code in (401, 403):
-        # Log body for debugging auth issues (avoid logging secrets)
+        # Auth errors are small; read them so the body can be logged (avoid logging secrets)
+        try:
+            body = await resp.aread()
+        finally:
+            await resp.aclose()
         logger.warning(
             "Upstream ticket service returned %s for %s %s. Response body: %s",
-            resp.status_code, method, target_url, resp.text[:300]
+            resp.status_code, method, target_url, body[:300].decode("utf-8", "replace")
         )
+        # aread() decodes the body, so drop the upstream encoding/length headers
+        for name in [k for k in response_headers if k.lower() in {"content-encoding", "content-length"}]:
+            del response_headers[name]
+        return Response(content=body, status_code=resp.status_code, headers=response_headers)
+
+    if resp.status_code == 304:
+        await resp.aclose()
+        return Response(status_code=304, headers=response_headers)
 
-    return Response(
-        content=resp.content,
+    return StreamingResponse(
+        resp.aiter_raw(),
         status_code=resp.status_code,
-        headers=_filter_response_headers(resp.headers),
-        media_type=resp.headers.get("content-type")
+        headers=response_headers,
+        background=BackgroundTask(resp.aclose),
     )
 
 # --- Specific routes MUST be declared before the catch-all to avoid being shadowed ---
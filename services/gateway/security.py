@@ -1,6 +1,9 @@
 import os
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
@@ -24,8 +27,14 @@ logger = logging.getLogger("gateway.security")
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context. Hashes with a different cost are flagged by needs_update()
+# and transparently rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# Dedicated process pool for bcrypt so login storms don't starve the threadpool
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_POOL_MAX_QUEUE = int(os.getenv("HASH_POOL_MAX_QUEUE", "64"))
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed one."""
@@ -35,6 +44,101 @@ def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
     return pwd_context.hash(password)
 
+def _verify_and_update_job(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str], float]:
+    """Runs in a pool worker: verify and, if the cost changed, produce a new hash"""
+    started = time.perf_counter()
+    try:
+        ok, new_hash = pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        # Malformed / unknown hash in the database
+        ok, new_hash = False, None
+    return ok, new_hash, time.perf_counter() - started
+
+def _hash_job(password: str) -> Tuple[str, float]:
+    """Runs in a pool worker: hash a new password"""
+    started = time.perf_counter()
+    hashed = pwd_context.hash(password)
+    return hashed, time.perf_counter() - started
+
+
+class HashPoolBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+
+class PasswordHashPool:
+    """Bounded process pool for bcrypt work with queue metrics"""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_wait_s = 0.0
+        self.total_run_s = 0.0
+        self.max_wait_s = 0.0
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _submit(self, fn, *args):
+        # Everything beyond the busy workers is queued; refuse once the queue is full
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HashPoolBusy()
+        self.start()
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+        elapsed = time.perf_counter() - submitted
+        run_s = result[-1]
+        wait_s = max(0.0, elapsed - run_s)
+        self.completed += 1
+        self.total_run_s += run_s
+        self.total_wait_s += wait_s
+        self.max_wait_s = max(self.max_wait_s, wait_s)
+        return result
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        ok, new_hash, _ = await self._submit(_verify_and_update_job, plain_password, hashed_password)
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    async def hash(self, password: str) -> str:
+        hashed, _ = await self._submit(_hash_job, password)
+        return hashed
+
+    def stats(self) -> dict:
+        done = self.completed or 1
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_wait_ms": round(self.total_wait_s / done * 1000, 2),
+            "max_wait_ms": round(self.max_wait_s * 1000, 2),
+            "avg_run_ms": round(self.total_run_s / done * 1000, 2),
+        }
+
+
+hash_pool = PasswordHashPool(HASH_POOL_WORKERS, HASH_POOL_MAX_QUEUE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a new JWT access token."""
     to_encode = data.copy()
@@ -8,8 +8,27 @@ import logging
 from typing import Optional, BinaryIO
 from pathlib import Path
 
+from common import timing
+from common.resilience import upstream
+
 logger = logging.getLogger(__name__)
 
+# Thời gian phiên âm tăng theo độ dài clip: mỗi nhóm kích thước có latency window
+# (và timeout thích ứng) riêng trong upstream("whisper")
+WHISPER_SIZE_ROUTES = ((256 * 1024, "transcriptions:small"), (2 * 1024 * 1024, "transcriptions:medium"))
+
+def _whisper_route(audio_file: BinaryIO) -> str:
+    try:
+        position = audio_file.tell()
+        size = audio_file.seek(0, os.SEEK_END)
+        audio_file.seek(position)
+    except (AttributeError, OSError):
+        return "transcriptions"
+    for limit, route in WHISPER_SIZE_ROUTES:
+        if size - position <= limit:
+            return route
+    return "transcriptions:large"
+
 class WhisperService:
     """OpenAI Whisper Speech-to-Text service"""
     
@@ -39,9 +58,11 @@ class WhisperService:
                 "response_format": (None, "text")
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
+            async with httpx.AsyncClient() as client:
+                response = await upstream("whisper").request(
+                    client, "POST",
                     f"{self.base_url}/audio/transcriptions",
+                    route=_whisper_route(audio_file),
                     headers=self.headers,
                     files=files
                 )
@@ -95,11 +116,14 @@ class ElevenLabsService:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
+            async with httpx.AsyncClient() as client:
+                # Same text -> same audio, so TTS is safe to retry
+                response = await upstream("elevenlabs", max_timeout=60.0).request(
+                    client, "POST",
                     f"{self.base_url}/text-to-speech/{self.voice_id}",
                     headers=self.headers,
-                    json=data
+                    json=data,
+                    idempotent=True
                 )
                 
                 if response.status_code == 200:
@@ -146,7 +170,8 @@ class VoiceManager:
         """
         try:
             # Step 1: Speech to Text
-            transcript = await self.whisper.transcribe_audio(audio_file, filename)
+            with timing.stage("stt"):
+                transcript = await self.whisper.transcribe_audio(audio_file, filename)
             if not transcript:
                 return {
                     "error": "Failed to transcribe audio",
@@ -172,7 +197,8 @@ class VoiceManager:
             audio_filename = f"tts_{uuid.uuid4().hex}.mp3"
             audio_path = self.static_audio_dir / audio_filename
             
-            tts_success = await self.elevenlabs.text_to_speech(response_text, str(audio_path))
+            with timing.stage("tts"):
+                tts_success = await self.elevenlabs.text_to_speech(response_text, str(audio_path))
             
             audio_url = None
             if tts_success:
@@ -5,9 +5,11 @@ from typing import List, Dict, Optional
 from rag.ingest import ingest_policies as rag_ingest
 from rag.retriever import retrieve_documents
 from rag.rerank import rerank_documents
+from common.web import DefaultJSONResponse, CompressionMiddleware
 
 
-app = FastAPI(title="Policy Service")
+app = FastAPI(title="Policy Service", default_response_class=DefaultJSONResponse)
+app.add_middleware(CompressionMiddleware)
 
 
 class CheckBody(BaseModel):
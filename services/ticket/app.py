@@ -1,9 +1,10 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import math
 import logging
+import hashlib
 
 import database
 import models
@@ -11,6 +12,7 @@ import schemas
 import crud
 import auth
 from technical_integration import technical_agent
+from common.web import DefaultJSONResponse, CompressionMiddleware
 
 # Create tables in the database
 models.Base.metadata.create_all(bind=database.engine)
@@ -18,7 +20,8 @@ models.Base.metadata.create_all(bind=database.engine)
 app = FastAPI(
     title="Campus Helpdesk - Ticket Service",
     description="Service for managing support tickets",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse
 )
 
 # Add CORS middleware
@@ -30,10 +33,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Conditional GETs: tag JSON responses with a content ETag and answer 304 on a match,
+# so unchanged ticket lists are not re-sent through the gateway
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    response = await call_next(request)
+    if request.method != "GET" or response.status_code != 200 or "etag" in response.headers:
+        return response
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    headers["etag"] = etag
+    # Per-user data: allow the client to cache but always revalidate
+    headers.setdefault("cache-control", "private, no-cache")
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        headers.pop("content-type", None)
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, status_code=response.status_code, headers=headers)
+
+# Compress large responses (e.g. ticket lists); added last so it wraps the ETag middleware
+app.add_middleware(CompressionMiddleware)
+
 # Health check
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "ticket"}
+    return {"status": "healthy", "service": "ticket", "user_cache": auth.user_cache.stats()}
 
 # Simple test endpoint
 @app.post("/test-create")
@@ -1,5 +1,8 @@
 import os
-from typing import Optional
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -19,6 +22,10 @@ if SECRET_KEY == SECRET_KEY_DEFAULT:
 ALGORITHM = "HS256"
 GATEWAY_URL = os.getenv("GATEWAY_URL", "http://gateway:8000")
 
+# User profile cache: tokens are verified locally, the gateway is only asked on a cache miss
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
 # tokenUrl should point to gateway's token endpoint
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
@@ -31,6 +38,52 @@ async def _get_client() -> httpx.AsyncClient:
         _http_client = httpx.AsyncClient(timeout=10.0)
     return _http_client
 
+class UserProfileCache:
+    """Small in-process TTL + LRU cache of CurrentUser keyed by username"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, schemas.CurrentUser]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[schemas.CurrentUser]:
+        entry = self._entries.get(username)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return user
+
+    def set(self, user: schemas.CurrentUser) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[user.username] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        if username is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(username, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserProfileCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+# One in-flight gateway lookup per username so a burst of requests causes a single miss
+_inflight_lookups: dict[str, asyncio.Future] = {}
+
 async def get_current_user_from_gateway(token: str) -> Optional[schemas.CurrentUser]:
     """Get current user info from gateway service"""
     try:
@@ -53,7 +106,7 @@ async def get_current_user_from_gateway(token: str) -> Optional[schemas.CurrentU
         return None
 
 def verify_token_locally(token: str) -> Optional[dict]:
-    """Verify JWT token locally (fallback method)"""
+    """Verify JWT signature and expiry locally"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -71,18 +124,49 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> schemas.Curre
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    user = await get_current_user_from_gateway(token)
+    token_data = verify_token_locally(token)
+    if not token_data:
+        raise credentials_exception
+
+    username = token_data["username"]
+    user = user_cache.get(username)
+    if user and (token_data["role"] is None or user.role == token_data["role"]):
+        return user
+
+    user = await _resolve_user_on_miss(username, token)
     if user:
         return user
-    token_data = verify_token_locally(token)
-    if token_data:
-        return schemas.CurrentUser(
-            id=0,
-            username=token_data["username"],
-            email="",
-            role=token_data["role"]
-        )
-    raise credentials_exception
+    # Gateway unreachable: the token itself is valid, serve a minimal profile (not cached)
+    return schemas.CurrentUser(
+        id=0,
+        username=username,
+        email="",
+        role=token_data["role"]
+    )
+
+async def _resolve_user_on_miss(username: str, token: str) -> Optional[schemas.CurrentUser]:
+    """Fetch the profile from the gateway once per username and populate the cache"""
+    pending = _inflight_lookups.get(username)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight_lookups[username] = future
+    try:
+        user = await get_current_user_from_gateway(token)
+        if user and user.username == username:
+            user_cache.set(user)
+        elif user:
+            logger.warning("Gateway returned user %s for token sub=%s; not caching", user.username, username)
+            user = None
+        future.set_result(user)
+        return user
+    except BaseException:
+        if not future.done():
+            future.set_result(None)
+        raise
+    finally:
+        _inflight_lookups.pop(username, None)
 
 async def get_current_admin_user(current_user: schemas.CurrentUser = Depends(get_current_user)) -> schemas.CurrentUser:
     if current_user.role != "admin":
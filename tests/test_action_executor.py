@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+from agents import ActionExecutorAgent  # noqa: E402
+sys.path.pop(0)
+
+# Catalog the agent would get from GET /tools of the action service
+_FLAT_MODULES = ("toolspec", "tools")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'action')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import toolspec  # noqa: E402
+import tools  # noqa: E402,F401
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+CATALOG = json.loads(toolspec.registry.catalog())
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = ActionExecutorAgent()
+    agent._apply_catalog(CATALOG)
+    executed = []
+
+    async def execute(tool_name, params, context=None):
+        executed.append((tool_name, params))
+        return {"success": True, "tool_name": tool_name, "result": {"message": "ok"}}
+
+    async def load_tools():
+        pass
+
+    monkeypatch.setattr(agent, "_execute_tool", execute)
+    monkeypatch.setattr(agent, "_load_tools", load_tools)
+    agent.executed = executed
+    return agent
+
+
+def no_llm(*args, **kwargs):
+    pytest.fail("LLM should not be called")
+
+
+@pytest.mark.parametrize("message, context", [
+    ("Mình quên mật khẩu rồi", {"student_id": "20210001"}),
+    ("Cho mình đặt lại mật khẩu với", {"student_id": "20210001", "session_context": {"student_id": "20219999"}}),
+    # MSSV gõ trong tin nhắn không thay được sinh viên đã xác thực
+    ("Quên mật khẩu 20219999", {"student_id": "20210001"}),
+])
+def test_reset_password_fast_path_skips_llm(agent, monkeypatch, message, context):
+    monkeypatch.setattr(agent, "_call_llm_with_tools", no_llm)
+    monkeypatch.setattr(agent, "_call_llm", no_llm)
+
+    response = asyncio.run(agent.process(message, [], context))
+    assert response["success"] and response["tool_selection"] == "fast_path"
+    assert agent.executed == [("reset_password", {"student_id": "20210001"})]
+
+
+def test_tool_and_arguments_come_from_one_function_call(agent, monkeypatch):
+    calls = []
+
+    def call_with_tools(messages, tools, profile=None):
+        calls.append((messages, tools, profile))
+        args = {"room_id": "B205", "start_time": "2024-01-15T10:00:00", "end_time": "2024-01-15T12:00:00"}
+        return {"tool_calls": [{"id": "call_0", "type": "function",
+                                "function": {"name": "book_room", "arguments": json.dumps(args)}}]}
+
+    monkeypatch.setattr(agent, "_call_llm_with_tools", call_with_tools)
+    monkeypatch.setattr(agent, "_call_llm", no_llm)
+
+    response = asyncio.run(agent.process("Đặt phòng B205 từ 10h đến 12h ngày 15/1", [], None))
+    assert response["success"] and response["tool_selection"] == "function_call"
+    assert len(calls) == 1
+    messages, tools, profile = calls[0]
+    assert profile == "classify"
+    assert {t["function"]["name"] for t in tools} == set(agent.available_tools)
+    assert agent.executed[0][0] == "book_room"
+
+
+def test_missing_arguments_are_reported_without_second_llm_call(agent, monkeypatch):
+    monkeypatch.setattr(agent, "_call_llm_with_tools", lambda *a, **k: {"tool_calls": [
+        {"id": "call_0", "type": "function", "function": {"name": "renew_library_card", "arguments": "{}"}}]})
+    monkeypatch.setattr(agent, "_call_llm", no_llm)
+
+    response = asyncio.run(agent.process("Gia hạn thẻ thư viện giúp mình", [], {"student_id": "20210001"}))
+    assert response["reason"] == "parameter_validation_failed"
+    assert response["validation_error"]["missing_params"] == ["card_number", "duration"]
+    assert agent.executed == []
+
+
+def test_fast_path_skips_tools_missing_from_catalog(agent, monkeypatch):
+    catalog = {"tools": [t for t in CATALOG["tools"] if t["name"] != "reset_password"]}
+    agent._apply_catalog(catalog)
+    monkeypatch.setattr(agent, "_call_llm_with_tools", lambda *a, **kw: {"content": "Bạn cần hỗ trợ gì?"})
+
+    response = asyncio.run(agent.process("Mình quên mật khẩu, MSSV 20210001", [], None))
+    assert response.get("tool_selection") != "fast_path"
+    assert agent.executed == []
+
+
+def test_empty_catalog_returns_tools_unavailable(agent, monkeypatch):
+    agent.available_tools = {}
+    monkeypatch.setattr(agent, "_call_llm_with_tools", no_llm)
+
+    response = asyncio.run(agent.process("Mình quên mật khẩu, MSSV 20210001", [], None))
+    assert not response["success"] and response["reason"] == "tools_unavailable"
+
+
+@pytest.mark.parametrize("message, context", [
+    ("làm sao để đổi mật khẩu?", {"student_id": "20210001"}),
+    ("tôi không quên mật khẩu đâu", {"student_id": "20210001"}),
+    ("Đổi mật khẩu giúp mình", {"student_id": "20210001"}),
+    # Không có sinh viên đã xác thực: MSSV trong tin nhắn / session_context không đủ
+    ("Quên mật khẩu 20219999", None),
+    ("Quên mật khẩu", {"session_context": {"student_id": "20219999"}}),
+])
+def test_reset_password_fast_path_negative_cases(agent, message, context):
+    assert agent._match_simple_request(message, context) is None
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import sys
+import threading
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+# Action service modules use flat imports; make sure we get the action versions
+_FLAT_MODULES = ("app", "models", "toolspec", "tools")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'action')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import app as action
+import toolspec
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+from agents import ActionExecutorAgent  # noqa: E402
+from agents import action_executor  # noqa: E402
+sys.path.pop(0)
+
+
+class FakeSession:
+    def add(self, obj):
+        obj.id = 1
+
+    def commit(self):
+        pass
+
+    def refresh(self, obj):
+        pass
+
+
+@pytest.fixture
+def client():
+    action.app.dependency_overrides[action.get_db] = lambda: FakeSession()
+    yield TestClient(action.app)
+    action.app.dependency_overrides.clear()
+
+
+def test_tools_catalog_is_served_with_etag(client):
+    response = client.get("/tools")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    tools = {t["name"]: t for t in response.json()["tools"]}
+    assert set(tools) == set(toolspec.registry.names())
+    assert tools["book_room"]["parameters"]["required"] == ["room_id", "start_time", "end_time"]
+    assert tools["book_room"]["concurrency"] == 1
+
+    assert client.get("/tools", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_call_tool_dispatches_through_registry(client):
+    response = client.post("/call_tool", json={"tool_name": "reset_password", "tool_args": {"student_id": "20210001"}})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+
+    response = client.post("/call_tool", json={"tool_name": "reset_password", "tool_args": {}})
+    assert response.status_code == 400
+    assert "student_id" in response.json()["detail"]["message"]
+
+    assert client.post("/call_tool", json={"tool_name": "fly", "tool_args": {}}).status_code == 404
+
+
+def test_registry_enforces_concurrency_and_timeout():
+    registry = toolspec.ToolRegistry()
+    running = []
+
+    @registry.tool("slow", "slow tool", {"type": "object"}, timeout=0.05, concurrency=1)
+    async def slow(args):
+        running.append(args["n"])
+        await asyncio.sleep(args["delay"])
+        return {"n": args["n"]}
+
+    async def scenario():
+        first = asyncio.create_task(registry.get("slow")({"n": 1, "delay": 0.03}))
+        await asyncio.sleep(0)
+        # Chờ slot của lần gọi đầu rồi vượt timeout
+        with pytest.raises(toolspec.ToolTimeoutError):
+            await registry.get("slow")({"n": 2, "delay": 0.05})
+        return await first
+
+    assert asyncio.run(scenario()) == {"n": 1}
+    assert registry.stats()["slow"] == {"calls": 2, "timeouts": 1, "in_flight": 0}
+
+    with pytest.raises(TypeError):
+        registry.tool("sync", "", {"type": "object"})(lambda args: {})
+
+
+def test_gateway_agent_loads_and_revalidates_catalog(monkeypatch):
+    requests = []
+
+    async def record(request):
+        requests.append((request.url.path, request.headers.get("if-none-match")))
+
+    client_class = httpx.AsyncClient
+    transport = httpx.ASGITransport(app=action.app)
+    monkeypatch.setattr(action_executor.httpx, "AsyncClient",
+                        lambda: client_class(transport=transport, event_hooks={"request": [record]}))
+    agent = ActionExecutorAgent()
+    assert agent.available_tools == {}
+
+    async def scenario():
+        await agent._load_tools()
+        await agent._load_tools()  # cached: no request
+        agent._tools_next_check = 0
+        await agent._load_tools()  # revalidate -> 304
+
+    asyncio.run(scenario())
+    etag = toolspec.registry.etag()
+    assert requests == [("/tools", None), ("/tools", etag)]
+    assert set(agent.available_tools) == set(toolspec.registry.names())
+    assert agent.available_tools["renew_library_card"]["required_params"] == ["student_id", "card_number", "duration"]
+    assert {t["function"]["name"] for t in agent.tool_definitions} == set(toolspec.registry.names())
+
+
+def test_gateway_agent_loads_catalog_from_several_event_loops(monkeypatch):
+    # /ask/batch and /ws/chat run the agent in worker threads, each with its own loop
+    client_class = httpx.AsyncClient
+    transport = httpx.ASGITransport(app=action.app)
+    monkeypatch.setattr(action_executor.httpx, "AsyncClient", lambda: client_class(transport=transport))
+    agent = ActionExecutorAgent()
+    errors = []
+
+    def worker():
+        try:
+            asyncio.run(agent._load_tools())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    agent._tools_next_check = 0
+    asyncio.run(agent._load_tools())
+
+    assert errors == []
+    assert set(agent.available_tools) == set(toolspec.registry.names())
+
+
+@pytest.mark.parametrize("start_time, valid", [
+    ("2024-01-15T10:00:00", True),
+    ("2024-01-15T10:00:00+07:00", True),
+    ("2024-01-15 10:00", True),
+    ("2024-01-15", False),
+    ("15/1 10h", False),
+    ("2024-13-45T10:00:00", False),
+])
+def test_date_time_format_is_checked(client, start_time, valid):
+    args = {"room_id": "A101", "start_time": start_time, "end_time": "2024-01-15T12:00:00"}
+    response = client.post("/call_tool", json={"tool_name": "book_room", "tool_args": args})
+    assert (response.status_code == 200) is valid
+    if not valid:
+        assert response.json()["detail"]["field"] == "start_time"
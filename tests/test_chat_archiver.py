@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Gateway modules use flat imports; make sure we get the gateway versions
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+for name in ("models", "database"):
+    sys.modules.pop(name, None)
+import chat_archiver
+import chat_history_codec
+import models
+sys.path.pop(0)
+for name in ("models", "database"):
+    sys.modules.pop(name, None)
+
+
+def _push(redis, session_id, text, status="active", last_activity=None, ttl=86400):
+    turn = {"user": text, "bot": f"re: {text}", "timestamp": time.time(), "agent": "faq", "student_id": "SV1"}
+    redis.lpush(f"chat_history:{session_id}", chat_history_codec.encode_turn(turn))
+    redis.expire(f"chat_history:{session_id}", ttl)
+    redis.hset(f"session_meta:{session_id}", mapping={
+        "status": status,
+        "last_activity": last_activity or time.time(),
+    })
+
+
+@pytest.fixture
+def archiver():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine, tables=[models.ChatTurnArchive.__table__])
+    factory = sessionmaker(bind=engine)
+    return chat_archiver.ChatArchiver(fakeredis.FakeRedis(), session_factory=factory, parquet_dir=""), factory
+
+
+def _archived(factory, session_id):
+    with factory() as db:
+        rows = db.execute(
+            select(models.ChatTurnArchive).where(models.ChatTurnArchive.session_id == session_id)
+            .order_by(models.ChatTurnArchive.turn_index)
+        ).scalars().all()
+    return [(row.turn_index, row.user_message) for row in rows]
+
+
+def test_only_completed_or_idle_sessions_are_archived(archiver):
+    arch, factory = archiver
+    _push(arch.redis, "done", "cảm ơn", status="completed")
+    _push(arch.redis, "idle", "hello", last_activity=time.time() - chat_archiver.ARCHIVE_IDLE_SECONDS - 1)
+    _push(arch.redis, "hot", "học phí")
+
+    assert arch.run_once() == {"sessions": 2, "turns": 2}
+    assert _archived(factory, "done") == [(0, "cảm ơn")]
+    assert _archived(factory, "idle") == [(0, "hello")]
+    assert _archived(factory, "hot") == []
+    # Được copy nhưng vẫn giữ trong Redis: câu hỏi tiếp theo sau "cảm ơn" còn ngữ cảnh
+    assert arch.redis.llen("chat_history:done") == 1
+    assert arch.redis.llen("chat_history:hot") == 1
+
+    # Không có turn mới thì pass sau không copy lại
+    assert arch.run_once() == {"sessions": 0, "turns": 0}
+
+
+def test_expiring_session_is_archived_and_trimmed(archiver):
+    arch, factory = archiver
+    _push(arch.redis, "old", "first", status="completed")
+    arch.run_once()
+    _push(arch.redis, "old", "second", ttl=chat_archiver.ARCHIVE_TTL_MARGIN_SECONDS - 1)
+
+    assert arch.run_once() == {"sessions": 1, "turns": 1}
+    assert _archived(factory, "old") == [(0, "first"), (1, "second")]
+    assert not arch.redis.exists("chat_history:old")
+
+
+def test_reopened_session_continues_turn_numbering(archiver):
+    arch, factory = archiver
+    _push(arch.redis, "s1", "first", status="completed")
+    _push(arch.redis, "s1", "second", status="completed")
+    arch.run_once()
+    _push(arch.redis, "s1", "third", status="completed")
+    arch.run_once()
+    assert _archived(factory, "s1") == [(0, "first"), (1, "second"), (2, "third")]
+
+
+def test_idle_session_keeps_only_recent_turns_in_redis(archiver, monkeypatch):
+    arch, factory = archiver
+    monkeypatch.setattr(chat_archiver, "ARCHIVE_KEEP_TURNS", 2)
+    for text in ("1", "2", "3", "4"):
+        _push(arch.redis, "s1", text, status="completed")
+    arch.run_once()
+    assert arch.redis.llen("chat_history:s1") == 4
+
+    # Không hoạt động quá ARCHIVE_TRIM_AFTER_SECONDS: chỉ giữ các lượt gần nhất
+    arch.redis.hset("session_meta:s1", "last_activity", time.time() - chat_archiver.ARCHIVE_TRIM_AFTER_SECONDS - 1)
+    assert arch.run_once() == {"sessions": 0, "turns": 0}
+    assert _archived(factory, "s1") == [(0, "1"), (1, "2"), (2, "3"), (3, "4")]
+    recent = [chat_history_codec.decode_turn(t)["user"] for t in arch.redis.lrange("chat_history:s1", 0, -1)]
+    assert recent == ["4", "3"]
@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+import chat_history_codec as codec
+sys.path.pop(0)
+
+TURN = {
+    "user": "Làm thế nào để đặt lại mật khẩu?",
+    "bot": "Bạn có thể đặt lại mật khẩu tại cổng sinh viên.",
+    "timestamp": 1725000000.5,
+    "agent": "technical",
+    "student_id": "SV123456",
+}
+
+
+def test_roundtrip_is_smaller_than_json():
+    encoded = codec.encode_turn(TURN)
+    assert encoded[0] == codec.VERSION_1
+    assert codec.decode_turn(encoded) == TURN
+    assert len(encoded) < len(json.dumps(TURN).encode())
+
+
+def test_long_bot_reply_is_compressed():
+    turn = dict(TURN, bot="Theo quy định của trường, sinh viên cần hoàn thành học phí. " * 40, agent="custom_agent")
+    encoded = codec.encode_turn(turn)
+    assert len(encoded) < len(turn["bot"].encode()) / 4
+    assert codec.decode_turn(encoded) == turn
+
+
+def test_legacy_json_entries_still_decode():
+    assert codec.decode_turn(json.dumps(TURN)) == TURN
+    assert codec.decode_turn(json.dumps(TURN).encode()) == TURN
@@ -0,0 +1,50 @@
+import gzip
+import os
+import sys
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.web import DefaultJSONResponse, CompressionMiddleware
+
+app = FastAPI(default_response_class=DefaultJSONResponse)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+
+@app.get("/large")
+def large():
+    return {"logs": [{"last_message": "Làm thế nào để đặt lại mật khẩu?"} for _ in range(50)]}
+
+
+@app.get("/small")
+def small():
+    return {"status": "healthy"}
+
+
+@app.get("/encoded")
+def encoded():
+    return Response(gzip.compress(b"x" * 2000), headers={"content-encoding": "gzip"})
+
+
+client = TestClient(app)
+
+
+def test_large_response_is_gzipped():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json()["logs"][0]["last_message"].startswith("Làm")
+
+
+def test_small_response_is_not_compressed():
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"status": "healthy"}
+
+
+def test_already_encoded_response_passes_through():
+    response = client.get("/encoded", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == b"x" * 2000
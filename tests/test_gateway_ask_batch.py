@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+_FLAT_MODULES = ("app", "models", "database", "schemas", "crud")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("ARCHIVER_INTERVAL_SECONDS", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import app as gateway
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(gateway, "r", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(gateway, "r_history", fakeredis.FakeRedis(server=server))
+    return TestClient(gateway.app)
+
+
+def test_ask_batch_dedupes_and_streams_ndjson(client, monkeypatch):
+    seen = []
+
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        seen.append(user_message)
+        if "lỗi" in user_message:
+            raise RuntimeError("boom")
+        return {"reply": f"trả lời: {user_message}", "agent": "faq"}
+
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    items = [
+        {"id": "a", "text": "Học phí bao nhiêu?"},
+        {"id": "b", "text": "  học phí   bao nhiêu? "},
+        {"id": "c", "text": "Lịch thi khi nào?"},
+        {"id": "d", "text": "câu gây lỗi"},
+    ]
+    response = client.post("/ask/batch", json={"items": items, "concurrency": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results = {line["id"]: line for line in lines if line["type"] == "result"}
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert (summary["items"], summary["unique"], summary["errors"]) == (4, 3, 1)
+    assert len(seen) == 3
+    assert results["b"]["duplicate_of"] == 0
+    assert results["b"]["reply"] == results["a"]["reply"]
+    assert results["d"]["error"] == "boom"
+
+
+def test_ask_batch_limits(client, monkeypatch):
+    monkeypatch.setattr(gateway, "ASK_BATCH_MAX_ITEMS", 1)
+    response = client.post("/ask/batch", json={"items": [{"text": "a"}, {"text": "b"}]})
+    assert response.status_code == 413
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+import security
+sys.path.pop(0)
+
+
+def test_verify_rehashes_when_cost_changes():
+    old_hash = security.CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    pool = security.PasswordHashPool(max_workers=1, max_queue=4)
+    try:
+        ok, new_hash = asyncio.run(pool.verify_and_update("secret", old_hash))
+        assert ok
+        assert new_hash and new_hash.startswith(f"$2b${security.BCRYPT_ROUNDS:02d}$")
+        assert pool.stats()["rehashed"] == 1
+
+        ok, new_hash = asyncio.run(pool.verify_and_update("wrong", old_hash))
+        assert not ok and new_hash is None
+    finally:
+        pool.shutdown()
+
+
+def test_full_queue_rejects():
+    fast_hash = security.CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    pool = security.PasswordHashPool(max_workers=1, max_queue=0)
+
+    async def storm():
+        return await asyncio.gather(
+            *(pool.verify_and_update("secret", fast_hash) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    try:
+        results = asyncio.run(storm())
+    finally:
+        pool.shutdown()
+    assert sum(isinstance(r, security.HashPoolBusy) for r in results) == 2
+    assert pool.stats()["rejected"] == 2
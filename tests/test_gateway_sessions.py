@@ -0,0 +1,84 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+# Gateway modules use flat imports; load the gateway versions and then release the names
+_FLAT_MODULES = ("app", "models", "database", "schemas", "crud")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("ARCHIVER_INTERVAL_SECONDS", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import app as gateway
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(gateway, "r", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(gateway, "r_history", fakeredis.FakeRedis(server=server))
+    return TestClient(gateway.app)
+
+
+def test_me_sessions_lists_most_recent_first(client):
+    gateway.add_to_chat_history("s-old", "học phí?", "...", {"agent": "faq"}, "SV1")
+    gateway.add_to_chat_history("s-other", "hello", "...", {"agent": "greeting"}, "SV2")
+    gateway.add_to_chat_history("s-new", "mật khẩu", "...", {"agent": "technical"}, "SV1")
+
+    response = client.get("/me/sessions", headers={"x-student-id": "SV1"}, params={"per_page": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert [s["session_id"] for s in data["sessions"]] == ["s-new"]
+
+    page2 = client.get("/me/sessions", headers={"x-student-id": "SV1"}, params={"per_page": 1, "page": 2}).json()
+    assert [s["session_id"] for s in page2["sessions"]] == ["s-old"]
+
+
+def test_history_requires_session_ownership(client):
+    gateway.add_to_chat_history("s1", "xin chào", "chào bạn", {"agent": "greeting"}, "SV1")
+
+    own = client.get("/sessions/s1/history", headers={"x-student-id": "SV1"})
+    assert own.status_code == 200
+    assert [m["user"] for m in own.json()] == ["xin chào"]
+
+    other = client.get("/sessions/s1/history", headers={"x-student-id": "SV2"})
+    assert other.status_code == 404
+
+
+def test_history_falls_back_to_archive_after_redis_expiry(client, monkeypatch):
+    gateway.add_to_chat_history("s1", "học phí?", "...", {"agent": "faq"}, "SV1")
+    archived = [{"user": "học phí?", "bot": "...", "timestamp": 1.0, "agent": "faq", "student_id": "SV1"}]
+    monkeypatch.setattr(gateway.chat_archiver, "load_archived_history", lambda session_id, limit: archived)
+    # Lịch sử trong Redis hết hạn sau 24h, index phiên còn 30 ngày
+    gateway.r_history.delete("chat_history:s1")
+    gateway.r.delete("session_meta:s1")
+
+    assert [s["session_id"] for s in client.get("/me/sessions", headers={"x-student-id": "SV1"}).json()["sessions"]] == ["s1"]
+    history = client.get("/sessions/s1/history", headers={"x-student-id": "SV1"})
+    assert [m["user"] for m in history.json()] == ["học phí?"]
+
+
+def test_other_student_cannot_take_over_a_session(client, monkeypatch):
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        return {"reply": f"{len(chat_history)} lượt trước", "agent": "faq"}
+
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    body = {"channel": "web", "text": "học phí?", "session_id": "s-b"}
+    assert client.post("/ask", json={**body, "student_id": "SV-A"}, headers={"x-student-id": "SV-B"}).status_code == 200
+
+    # SV-A ghi vào phiên của SV-B (student_id trong body không có tác dụng)
+    takeover = client.post("/ask", json={**body, "student_id": "SV-A"}, headers={"x-student-id": "SV-A"})
+    assert takeover.status_code == 404
+    assert not gateway.add_to_chat_history("s-b", "xin chào", "...", {"agent": "greeting"}, "SV-A")
+
+    assert client.get("/sessions/s-b/history", headers={"x-student-id": "SV-A"}).status_code == 404
+    assert client.get("/me/sessions", headers={"x-student-id": "SV-A"}).json()["total"] == 0
+    own = client.get("/sessions/s-b/history", headers={"x-student-id": "SV-B"})
+    assert [m["user"] for m in own.json()] == ["học phí?"]
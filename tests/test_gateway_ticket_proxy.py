@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+from routers import tickets as ticket_router
+sys.path.pop(0)
+
+ETAG = 'W/"abc"'
+
+
+def _chunks(*parts: bytes):
+    # Async iterator content keeps the mock response unread, like a real upstream stream
+    async def gen():
+        for part in parts:
+            yield part
+    return gen()
+
+
+async def _upstream(request: httpx.Request) -> httpx.Response:
+    json_headers = {"content-type": "application/json", "etag": ETAG}
+    if request.method == "POST":
+        body = await request.aread()
+        return httpx.Response(201, content=_chunks(b'{"echo": ', json.dumps(body.decode()).encode(), b"}"), headers=json_headers)
+    if request.headers.get("if-none-match") == ETAG:
+        return httpx.Response(304, headers={"etag": ETAG})
+    return httpx.Response(200, content=_chunks(b'{"tickets": [], ', b'"total": 0}'), headers=json_headers)
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.include_router(ticket_router.router)
+    app.state.http_client = httpx.AsyncClient(transport=httpx.MockTransport(_upstream))
+    return TestClient(app)
+
+
+def test_get_streams_body_and_etag():
+    response = _client().get("/tickets", headers={"Authorization": "Bearer t"})
+    assert response.status_code == 200
+    assert response.json() == {"tickets": [], "total": 0}
+    assert response.headers["etag"] == ETAG
+
+
+def test_if_none_match_passes_through_as_304():
+    response = _client().get("/tickets", headers={"If-None-Match": ETAG})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_post_body_is_forwarded():
+    response = _client().post("/tickets", content=b'{"subject": "hello"}', headers={"Content-Type": "application/json"})
+    assert response.status_code == 201
+    assert response.json() == {"echo": '{"subject": "hello"}'}
@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from starlette.websockets import WebSocketDisconnect
+
+_FLAT_MODULES = ("app", "models", "database", "schemas", "crud")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("ARCHIVER_INTERVAL_SECONDS", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import app as gateway
+import security
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+from common import llm, timing  # noqa: E402
+
+
+def auth(student_id="20210001"):
+    token = jwt.encode({"sub": student_id}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(gateway, "r", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(gateway, "r_history", fakeredis.FakeRedis(server=server))
+    return TestClient(gateway.app)
+
+
+def receive_until(ws, kind):
+    events = []
+    while True:
+        event = ws.receive_json()
+        events.append(event)
+        if event["type"] == kind:
+            return events
+
+
+def test_ws_chat_streams_stages_and_keeps_history(client, monkeypatch):
+    histories = []
+    tokens = ["trả lời ", "cho câu ", "hỏi: "]
+
+    def native_stream(messages, settings):
+        async def stream():
+            for token in tokens + [messages[-1]["content"]]:
+                yield token
+        return ("vllm", "qwen"), stream()
+
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        histories.append(list(chat_history))
+        with timing.stage("routing"):
+            llm.chat([{"role": "user", "content": "route?"}], profile="classify", agent="lead")
+        result = llm.chat([{"role": "user", "content": user_message}], agent="faq")
+        return {"reply": result["content"], "agent": "faq"}
+
+    monkeypatch.setattr(llm, "_native_stream", native_stream)
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    gateway.add_to_chat_history("s1", "xin chào", "chào bạn", {"agent": "greeting"}, "20210001")
+    with client.websocket_connect("/ws/chat?session_id=s1", headers=auth()) as ws:
+        ready = ws.receive_json()
+        assert ready == {"type": "ready", "session_id": "s1", "student_id": "20210001"}
+
+        ws.send_json({"type": "message", "id": "m1", "text": "Học phí bao nhiêu?"})
+        events = receive_until(ws, "done")
+        stages = [(e["stage"], e["status"]) for e in events if e["type"] == "stage"]
+        assert stages == [("routing", "start"), ("routing", "end"), ("generation", "start"), ("generation", "end")]
+        # Token của lời gọi generate được stream, không phải câu trả lời cắt sau khi xong
+        deltas = [e["text"] for e in events if e["type"] == "delta"]
+        assert deltas == tokens + ["Học phí bao nhiêu?"]
+        assert "".join(deltas) == events[-1]["reply"] == "trả lời cho câu hỏi: Học phí bao nhiêu?"
+        assert events[-1]["agent_info"]["agent"] == "faq"
+
+        ws.send_json({"type": "message", "id": "m2", "text": "Còn lịch thi?"})
+        receive_until(ws, "done")
+
+    assert [t["user"] for t in histories[0]] == ["xin chào"]
+    assert histories[1][-1]["user"] == "Học phí bao nhiêu?"
+    assert [t["user"] for t in gateway.get_chat_history("s1")] == ["xin chào", "Học phí bao nhiêu?", "Còn lịch thi?"]
+
+
+def test_ws_chat_requires_valid_jwt(client):
+    for headers in ({}, {"x-student-id": "20210001"}, {"Authorization": "Bearer not-a-jwt"}):
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect("/ws/chat", headers=headers) as ws:
+                ws.receive_json()
+        assert closed.value.code == 1008
+
+
+def test_ws_chat_does_not_join_another_students_session(client, monkeypatch):
+    histories = []
+
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        histories.append(list(chat_history))
+        return {"reply": "ok", "agent": "faq"}
+
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    gateway.add_to_chat_history("theirs", "điểm thi của mình", "...", {"agent": "faq"}, "20219999")
+    with client.websocket_connect("/ws/chat?session_id=theirs", headers=auth()) as ws:
+        session_id = ws.receive_json()["session_id"]
+        ws.send_json({"type": "message", "text": "xin chào"})
+        receive_until(ws, "done")
+
+    assert session_id != "theirs"
+    assert histories == [[]]
+    assert [t["user"] for t in gateway.get_chat_history("theirs")] == ["điểm thi của mình"]
+
+
+def test_ws_chat_new_message_cancels_in_flight_answer(client, monkeypatch):
+    release = threading.Event()
+
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        if user_message == "chậm":
+            with timing.stage("routing"):
+                release.wait(5)
+            with timing.stage("llm"):
+                raise AssertionError("cancelled answer must not reach generation")
+        return {"reply": "nhanh", "agent": "greeting"}
+
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    with client.websocket_connect("/ws/chat", headers=auth()) as ws:
+        session_id = ws.receive_json()["session_id"]
+        ws.send_json({"type": "message", "id": "slow", "text": "chậm"})
+        assert ws.receive_json()["stage"] == "routing"
+        ws.send_json({"type": "message", "id": "fast", "text": "nhanh"})
+        events = receive_until(ws, "done")
+        release.set()
+
+    assert {"type": "cancelled", "id": "slow"} in events
+    assert events[-1]["id"] == "fast"
+    assert [t["user"] for t in gateway.get_chat_history(session_id)] == ["nhanh"]
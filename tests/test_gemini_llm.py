@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+genai = pytest.importorskip("google.generativeai")
+from google.generativeai import protos  # noqa: E402
+
+from common import gemini_llm, llm  # noqa: E402
+
+TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "book_room",
+        "description": "Đặt phòng học/họp",
+        "parameters": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "room_id": {"type": "string"},
+                "start_time": {"type": "string", "format": "date-time"},
+            },
+            "required": ["room_id", "start_time"],
+        },
+    },
+}]
+
+
+def response(*parts, prompt_tokens=12, cached=8):
+    proto = protos.GenerateContentResponse(
+        candidates=[protos.Candidate(content=protos.Content(role="model", parts=list(parts)))],
+        usage_metadata={"prompt_token_count": prompt_tokens, "candidates_token_count": 3,
+                        "cached_content_token_count": cached},
+    )
+    return genai.types.GenerateContentResponse.from_response(proto)
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    calls = []
+    replies = []
+
+    def generate_content(self, contents, **kwargs):
+        calls.append({"model": self, "contents": contents, **kwargs})
+        return replies.pop(0)
+
+    monkeypatch.setattr(genai.GenerativeModel, "generate_content", generate_content)
+    monkeypatch.setattr(gemini_llm, "GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(gemini_llm, "models", gemini_llm.ModelCache())
+    return calls, replies
+
+
+def test_tool_calls_round_trip_with_cached_model(gemini):
+    calls, replies = gemini
+    replies.append(response(protos.Part(function_call=protos.FunctionCall(
+        name="book_room", args={"room_id": "A101", "start_time": "2024-01-15T10:00:00"}))))
+    messages = [
+        {"role": "system", "content": "Bạn là trợ lý đặt phòng."},
+        {"role": "user", "content": "Đặt phòng A101 lúc 10h ngày 15/1"},
+    ]
+
+    result = llm._gemini_chat(messages, "gemini-1.5-flash", TOOLS, {"temperature": 0.0, "max_tokens": 64})
+    call = result["tool_calls"][0]
+    assert call["function"]["name"] == "book_room"
+    assert json.loads(call["function"]["arguments"]) == {"room_id": "A101", "start_time": "2024-01-15T10:00:00"}
+    assert result["usage"] == {"prompt_tokens": 12, "completion_tokens": 3, "cached_tokens": 8}
+
+    sent = calls[0]
+    assert sent["contents"] == [{"role": "user", "parts": ["Đặt phòng A101 lúc 10h ngày 15/1"]}]
+    assert sent["generation_config"] == {"temperature": 0.0, "max_output_tokens": 64}
+    declaration = sent["model"]._tools.to_proto()[0].function_declarations[0]
+    assert declaration.name == "book_room"
+    assert "additionalProperties" not in str(declaration.parameters)
+
+    # Lượt tiếp theo: kết quả tool gửi lại dưới dạng function_response, model handle được dùng lại
+    replies.append(response(protos.Part(text="Đã đặt phòng A101.")))
+    follow_up = messages + [
+        {"role": "assistant", "content": None, "tool_calls": [call]},
+        {"role": "tool", "tool_call_id": call["id"], "content": json.dumps({"status": "booked"})},
+    ]
+    assert llm._gemini_chat(follow_up, "gemini-1.5-flash", TOOLS)["content"] == "Đã đặt phòng A101."
+    assert calls[1]["model"] is sent["model"]
+    assert calls[1]["contents"][-1] == {"role": "user", "parts": [
+        {"function_response": {"name": "book_room", "response": {"status": "booked"}}}]}
+    assert gemini_llm.stats() == {"models": 1, "hits": 1, "misses": 1}
+
+
+def test_astream_yields_text_chunks(monkeypatch):
+    chunks = [response(protos.Part(text="Xin ")), response(protos.Part(text="chào"))]
+
+    class FakeStream:
+        def __aiter__(self):
+            async def gen():
+                for chunk in chunks:
+                    yield chunk
+            return gen()
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        assert stream
+        return FakeStream()
+
+    monkeypatch.setattr(genai.GenerativeModel, "generate_content_async", generate_content_async)
+    monkeypatch.setattr(gemini_llm, "models", gemini_llm.ModelCache())
+
+    async def collect():
+        return [d async for d in gemini_llm.astream([{"role": "user", "content": "alo"}], "gemini-1.5-flash")]
+
+    assert asyncio.run(collect()) == ["Xin ", "chào"]
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import llm
+
+MESSAGES = [{"role": "user", "content": "Học phí kỳ này bao nhiêu?"}]
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "gemini")
+    monkeypatch.setattr(llm, "LLM_MODEL", "gpt-3.5-turbo")
+    monkeypatch.setattr(llm, "LLM_BREAKER_FAILURES", 2)
+    return llm.LLMRouter()
+
+
+def test_failover_and_breaker(router, monkeypatch):
+    calls = []
+
+    def broken(messages, model, tools=None, options=None):
+        calls.append(model)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(llm, "_openai_chat", broken)
+    monkeypatch.setattr(llm, "_gemini_chat", lambda messages, model, tools=None, options=None: {"content": "gemini"})
+
+    for _ in range(3):
+        result = router.chat(MESSAGES)
+        assert result["content"] == "gemini"
+        assert result["served_by"] == "failover"
+        assert result["provider"] == "gemini:gemini-1.5-flash"
+    # Breaker opened after two failures, so the third call skipped OpenAI
+    assert calls == ["gpt-4o-mini", "gpt-4o-mini"]
+    assert router.stats()["breakers"]["openai:gpt-4o-mini"]["state"] == "open"
+
+
+def test_slow_primary_is_hedged(router, monkeypatch):
+    def slow(messages, model, tools=None, options=None):
+        time.sleep(0.5)
+        return {"content": "openai"}
+
+    monkeypatch.setattr(llm, "_openai_chat", slow)
+    monkeypatch.setattr(llm, "_gemini_chat", lambda messages, model, tools=None, options=None: {"content": "gemini"})
+    monkeypatch.setattr(llm, "LLM_HEDGE_MIN_DELAY_MS", 10)
+    primary = ("openai", "gpt-4o-mini")
+    router._breaker(primary)
+    for _ in range(llm.LLM_HEDGE_MIN_SAMPLES):
+        router._latency["openai:gpt-4o-mini"].add(0.02)
+
+    started = time.perf_counter()
+    result = router.chat(MESSAGES)
+    assert result["served_by"] == "hedge"
+    assert result["content"] == "gemini"
+    assert time.perf_counter() - started < 0.4
+    assert router.stats()["hedging"] == {"fired": 1, "won": 1}
+
+
+def test_all_providers_down(router, monkeypatch):
+    def broken(messages, model, tools=None, options=None):
+        raise RuntimeError("down")
+
+    monkeypatch.setattr(llm, "_openai_chat", broken)
+    monkeypatch.setattr(llm, "_gemini_chat", broken)
+    with pytest.raises(llm.LLMUnavailableError):
+        router.chat(MESSAGES)
+
+
+def test_profiles_select_routes_and_options(router, monkeypatch):
+    seen = []
+
+    def record(name):
+        def call(messages, model, tools=None, options=None):
+            seen.append((name, model, options))
+            return {"content": "ok", "usage": {"prompt_tokens": 1000, "completion_tokens": 1000}}
+        return call
+
+    monkeypatch.setattr(llm, "_openai_chat", record("openai"))
+    monkeypatch.setattr(llm, "_local_provider", lambda name: record(name))
+    monkeypatch.setenv("LLM_PROFILE_CLASSIFY_ROUTES", "vllm:Qwen/Qwen2.5-1.5B-Instruct")
+    monkeypatch.setenv("LLM_PROFILE_CLASSIFY_MAX_TOKENS", "64")
+
+    router.chat(MESSAGES, profile="classify")
+    router.chat(MESSAGES)
+    assert seen[0] == ("vllm", "Qwen/Qwen2.5-1.5B-Instruct", {"temperature": 0.0, "max_tokens": 64, "timeout": 20.0})
+    assert seen[1] == ("openai", "gpt-4o-mini", {"temperature": 0.7, "max_tokens": None, "timeout": None})
+
+    profiles = router.stats()["profiles"]
+    assert profiles["classify"]["routes"] == ["vllm:Qwen/Qwen2.5-1.5B-Instruct"]
+    assert profiles["classify"]["est_cost_usd"] == 0.0
+    assert profiles["generate"]["est_cost_usd"] == 0.00075
+
+
+def test_unknown_provider_is_skipped_not_stubbed(monkeypatch, caplog):
+    monkeypatch.setenv("LLM_PROVIDER", "opnai")
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "gemini,stubb")
+    monkeypatch.setattr(llm, "LLM_MODEL", "gpt-3.5-turbo")
+    monkeypatch.setattr(llm, "_invalid_route_entries", set())
+
+    assert llm.configured_routes() == [("gemini", "gemini-1.5-flash")]
+    assert "Unknown LLM provider 'opnai'" in caplog.text
+
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "")
+    with pytest.raises(ValueError):
+        llm.configured_routes()
+
+
+def test_provider_sdks_are_imported_lazily():
+    # Một interpreter mới, như container vừa khởi động với LLM_PROVIDER=stub
+    code = ("import sys; from common import llm; llm.chat([{'role': 'user', 'content': 'alo'}]); "
+            "print(sorted(m for m in ('openai', 'google.generativeai') if m in sys.modules))")
+    env = dict(os.environ, LLM_PROVIDER="stub", LLM_FALLBACK_PROVIDERS="",
+               PYTHONPATH=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
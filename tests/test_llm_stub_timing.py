@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import llm, timing
+
+MESSAGES = [{"role": "user", "content": "Xin chào"}]
+
+
+def test_stub_is_instant_by_default(monkeypatch):
+    monkeypatch.delenv("STUB_LLM_LATENCY_DIST", raising=False)
+    started = time.perf_counter()
+    assert llm.simulated_stub_chat(MESSAGES)["content"] == llm.stub_chat(MESSAGES)["content"]
+    assert time.perf_counter() - started < 0.05
+
+
+def test_stub_fixed_latency_and_error_injection(monkeypatch):
+    monkeypatch.setenv("STUB_LLM_LATENCY_DIST", "fixed")
+    monkeypatch.setenv("STUB_LLM_TTFT_MS", "50")
+    started = time.perf_counter()
+    llm.simulated_stub_chat(MESSAGES)
+    assert time.perf_counter() - started >= 0.05
+
+    monkeypatch.setenv("STUB_LLM_ERROR_RATE", "1")
+    with pytest.raises(llm.StubLLMError):
+        llm.simulated_stub_chat(MESSAGES)
+
+
+def test_stub_stream_reassembles_reply(monkeypatch):
+    monkeypatch.setenv("STUB_LLM_LATENCY_DIST", "none")
+    assert "".join(llm.stub_chat_stream(MESSAGES)) == llm.stub_chat(MESSAGES)["content"]
+
+
+def test_server_timing_header():
+    app = FastAPI()
+    app.add_middleware(timing.ServerTimingMiddleware)
+
+    @app.get("/work")
+    async def work():
+        with timing.stage("llm"):
+            pass
+        timing.record("llm", 0.010)
+        return {"ok": True}
+
+    response = TestClient(app).get("/work")
+    header = response.headers["server-timing"]
+    assert "total;dur=" in header
+    llm_ms = float(header.split("llm;dur=")[1].split(",")[0])
+    assert llm_ms >= 10.0
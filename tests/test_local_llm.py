@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+sys.path.pop(0)
+
+from common import llm, local_llm  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeOpenAIServer(latency_ms=50).start()
+    monkeypatch.setenv("VLLM_BASE_URL", server.base_url)
+    monkeypatch.setenv("LLM_PROVIDER", "vllm:Qwen/Qwen2.5-0.5B-Instruct")
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "")
+    monkeypatch.setattr(llm, "router", llm.LLMRouter())
+    local_llm.reset()
+    yield server
+    local_llm.reset()
+    server.stop()
+
+
+def ask(text):
+    return llm.chat([{"role": "user", "content": text}])
+
+
+def test_vllm_chat_through_router(server):
+    result = ask("Xin chào")
+    assert result["content"] == "echo: Xin chào"
+    assert result["provider"] == "vllm:Qwen/Qwen2.5-0.5B-Instruct"
+    assert result["usage"]["completion_tokens"] > 0
+
+
+def test_short_prompts_are_micro_batched_and_deduplicated(server, monkeypatch):
+    monkeypatch.setattr(local_llm, "LOCAL_LLM_BATCH_WINDOW_MS", 30.0)
+    questions = [f"phân loại câu {i % 6}" for i in range(12)]
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        replies = list(pool.map(lambda q: ask(q)["content"], questions))
+
+    assert replies == [f"echo: {q}" for q in questions]
+    stats = local_llm.stats()["vllm"]
+    assert stats["prompts"] == 12
+    assert stats["deduplicated"] == 6
+    assert server.stats["requests"] == 6
+    assert stats["batches"] <= 2
+    # Kết nối keep-alive được dùng lại thay vì mở một kết nối cho mỗi request
+    assert server.stats["connections"] <= 6
+
+
+def test_long_prompts_bypass_the_batcher(server, monkeypatch):
+    monkeypatch.setattr(local_llm, "LOCAL_LLM_BATCH_MAX_CHARS", 10)
+    for _ in range(3):
+        ask("một câu hỏi rất dài về quy chế đào tạo")
+    assert local_llm.stats() == {}
+    assert server.stats["connections"] == 1
+
+
+def test_astream_chat_yields_deltas(server):
+    async def collect():
+        return [delta async for delta in llm.astream_chat([{"role": "user", "content": "lịch thi học kỳ"}])]
+
+    deltas = asyncio.run(collect())
+    assert len(deltas) == 5
+    assert "".join(deltas) == "echo: lịch thi học kỳ"
+    assert server.stats["streams"] == 1
+
+
+def test_server_errors_fail_over(server, monkeypatch):
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "stub")
+    server.fail_next = 1
+    result = ask("Xin chào")
+    assert result["served_by"] == "failover"
+    assert result["provider"] == "stub:stub"
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+sys.path.pop(0)
+sys.path.insert(0, os.path.join(ROOT, 'services', 'gateway'))
+from agents import SmartLeadAgent  # noqa: E402
+sys.path.pop(0)
+
+from common import llm, local_llm  # noqa: E402
+
+HISTORY = [{"user": "Học phí kỳ này bao nhiêu?", "bot": "500.000đ/tín chỉ."}]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeOpenAIServer().start()
+    monkeypatch.setenv("VLLM_BASE_URL", server.base_url)
+    monkeypatch.setenv("LLM_PROVIDER", "vllm:fake")
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "")
+    monkeypatch.setattr(llm, "router", llm.LLMRouter())
+    monkeypatch.setattr(llm, "prompt_cache", llm.PromptCacheStats())
+    local_llm.reset()
+    yield server
+    local_llm.reset()
+    server.stop()
+
+
+def test_static_prefix_comes_first():
+    agent = SmartLeadAgent()
+    first = agent._assemble_messages("Hướng dẫn", "CÂU HỎI: a", catalog="Danh mục", history=HISTORY,
+                                     dynamic_context="NGỮ CẢNH: x")
+    second = agent._assemble_messages("Hướng dẫn", "CÂU HỎI: b", catalog="Danh mục")
+
+    assert first[0] == second[0] == {"role": "system", "content": "Hướng dẫn\n\nDanh mục"}
+    assert [m["role"] for m in first] == ["system", "user", "assistant", "user"]
+    assert first[-1]["content"] == "NGỮ CẢNH: x\n\nCÂU HỎI: a"
+
+
+def test_cached_prefix_tokens_are_reported_per_agent(server):
+    agent = SmartLeadAgent()
+    agent._make_intelligent_decision("Làm sao đổi mật khẩu?", [], {})
+    agent._make_intelligent_decision("Lịch thi cuối kỳ khi nào?", HISTORY, {})
+
+    stats = llm.stats()["prompt_cache"]["SmartLead"]
+    assert stats["calls"] == 2
+    assert stats["cache_hits"] == 1
+    assert 0 < stats["cached_tokens"] < stats["prompt_tokens"]
+    assert 0 < stats["hit_ratio"] < 1
+    assert stats["static_share"] > 0.5
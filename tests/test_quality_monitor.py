@@ -0,0 +1,76 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+import quality_monitor  # noqa: E402
+sys.path.pop(0)
+
+
+class FakeCritic:
+    def __init__(self):
+        self.batches = []
+
+    def evaluate_batch(self, items):
+        self.batches.append(len(items))
+        evaluations = []
+        for item in items:
+            if "lỗi" in item["original_request"]:
+                evaluations.append({"overall_score": 6.0, "scores": {}, "fallback": True})
+            else:
+                score = 9.0 if item["response"]["agent"] == "faq" else 5.0
+                evaluations.append({"overall_score": score, "scores": {"accuracy": score, "safety": 10}})
+        return evaluations
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_sampling_rate(redis_client):
+    assert not quality_monitor.enqueue_turn(redis_client, "s", "q", {"reply": "a"}, sample_rate=0)
+    assert quality_monitor.enqueue_turn(redis_client, "s", "q", {"reply": "a"}, sample_rate=1)
+    assert redis_client.xlen(quality_monitor.QUALITY_STREAM_KEY) == 1
+
+
+def test_worker_scores_in_batches_and_aggregates_per_agent_day(redis_client):
+    turns = [("Học phí?", "faq")] * 3 + [("Quên mật khẩu", "technical"), ("câu gây lỗi", "technical")]
+    for question, agent in turns:
+        quality_monitor.enqueue_turn(redis_client, "s1", question, {"reply": "...", "agent": agent}, sample_rate=1)
+
+    critic = FakeCritic()
+    worker = quality_monitor.QualityWorker(redis_client, critic=critic, batch_size=2, concurrency=2)
+    assert worker.drain() == 5
+    assert critic.batches == [2, 2, 1]
+    assert redis_client.xpending(quality_monitor.QUALITY_STREAM_KEY, quality_monitor.QUALITY_GROUP)["pending"] == 0
+
+    report = {row["agent"]: row for row in quality_monitor.quality_report(redis_client, days=1)}
+    assert report["faq"]["count"] == 3
+    assert report["faq"]["mean_overall_score"] == 9.0
+    assert report["faq"]["criteria"] == {"accuracy": 9.0, "safety": 10.0}
+    assert (report["technical"]["count"], report["technical"]["fallback"]) == (1, 1)
+    assert report["technical"]["mean_overall_score"] == 5.0
+
+
+def test_failing_batch_is_retried_then_counted_as_failed(redis_client, monkeypatch):
+    monkeypatch.setattr(quality_monitor, "QUALITY_CLAIM_IDLE_MS", 0)
+    quality_monitor.enqueue_turn(redis_client, "s1", "câu quá dài", {"reply": "...", "agent": "faq"}, sample_rate=1)
+    calls = []
+
+    class BrokenCritic:
+        def evaluate_batch(self, items):
+            calls.append(len(items))
+            raise RuntimeError("context length exceeded")
+
+    worker = quality_monitor.QualityWorker(redis_client, critic=BrokenCritic())
+    worker.ensure_group()
+    for _ in range(quality_monitor.QUALITY_MAX_DELIVERIES + 2):
+        assert worker.run_once() == 0
+
+    assert len(calls) == quality_monitor.QUALITY_MAX_DELIVERIES
+    assert redis_client.xpending(quality_monitor.QUALITY_STREAM_KEY, quality_monitor.QUALITY_GROUP)["pending"] == 0
+    report = quality_monitor.quality_report(redis_client, days=1)
+    assert [(row["agent"], row["count"], row["failed"]) for row in report] == [("faq", 0, 1)]
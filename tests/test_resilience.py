@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common import resilience
+from common.resilience import Upstream, UpstreamUnavailableError
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRY_BASE_MS", 1)
+
+
+def _client(statuses):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1], json={})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+
+def test_idempotent_calls_are_retried():
+    async def run():
+        client, calls = _client([503, 503, 200])
+        u = Upstream("policy", retries=2)
+        resp = await u.request(client, "GET", "http://policy/check")
+        assert resp.status_code == 200
+        assert calls == ["GET", "GET", "GET"]
+
+        client, calls = _client([503, 200])
+        resp = await u.request(client, "POST", "http://action/call_tool")
+        assert resp.status_code == 503
+        assert calls == ["POST"]
+
+    asyncio.run(run())
+
+
+def test_open_breaker_fails_fast():
+    async def run():
+        client, calls = _client([500])
+        u = Upstream("action", failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            assert (await u.request(client, "POST", "http://action/call_tool")).status_code == 500
+        with pytest.raises(httpx.RequestError):
+            await u.request(client, "POST", "http://action/call_tool")
+        assert len(calls) == 2
+        assert u.stats()["rejected"] == 1
+
+    asyncio.run(run())
+
+
+def test_timeout_adapts_to_latency():
+    u = Upstream("ticket", min_timeout=0.5, max_timeout=30)
+    assert u.timeout() == 30
+    for _ in range(50):
+        u.latency.add(0.05)
+    assert u.timeout() == 0.5
+    for _ in range(50):
+        u.latency.add(2.0)
+    assert u.timeout() == pytest.approx(6.0)
+    assert issubclass(UpstreamUnavailableError, httpx.RequestError)
+
+
+def test_latency_is_tracked_per_route():
+    async def run():
+        client, _calls = _client([200])
+        u = Upstream("action", min_timeout=0.5, max_timeout=30)
+        for _ in range(50):
+            await u.request(client, "GET", "http://action/tools")
+        # Các lần GET /tools nhanh không kéo timeout của /call_tool xuống sàn
+        assert u.timeout(resilience.route_of("GET", "http://action/tools")) == 0.5
+        assert u.timeout("POST /call_tool") == 30
+        assert u.timeout() == 30
+        assert resilience.route_of("GET", "http://ticket/tickets/42/comments") == "GET /tickets/{id}/comments"
+        assert set(u.stats()["latency"]) == {"GET /tools"}
+
+    asyncio.run(run())
+
+
+def test_route_windows_are_capped(monkeypatch):
+    monkeypatch.setattr(resilience, "UPSTREAM_MAX_ROUTES", 3)
+    u = Upstream("elevenlabs")
+    windows = [u.window(f"POST /voice/{name}") for name in ("a", "b", "c", "d")]
+    assert windows[2] is windows[3] is u.window(resilience.OTHER_ROUTE)
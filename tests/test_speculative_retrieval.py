@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+from agents.manager import SmartAgentManager  # noqa: E402
+sys.path.pop(0)
+
+
+def delegation(target):
+    def process(user_message, chat_history, context=None):
+        time.sleep(0.1)  # routing LLM call
+        if target is None:
+            return {"reply": "Chào bạn!", "agent": "smart_lead"}
+        return {"reply": "", "agent": "smart_lead", "requires_specialist": True, "target_agent": target}
+    return process
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = SmartAgentManager()
+    rag = manager.rag_agent
+    calls = {"optimize": 0, "search": 0, "cancelled": 0}
+
+    async def optimize(user_message, chat_history, context=None):
+        calls["optimize"] += 1
+        return user_message
+
+    async def search(query):
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        calls["search"] += 1
+        return [{"content": "Học phí 500.000đ/tín chỉ"}]
+
+    async def rerank(results, user_message, context=None):
+        return results
+
+    async def generate(user_message, docs, chat_history):
+        return docs[0]["content"]
+
+    monkeypatch.setattr(rag, "_optimize_search_query", optimize)
+    monkeypatch.setattr(rag, "_search_documents", search)
+    monkeypatch.setattr(rag, "_rerank_and_filter", rerank)
+    monkeypatch.setattr(rag, "_generate_answer", generate)
+    monkeypatch.setattr("agents.enhanced_rag.HTTPX_AVAILABLE", False)
+    manager.calls = calls
+    return manager
+
+
+def test_speculative_search_is_reused_when_routed_to_faq(manager, monkeypatch):
+    monkeypatch.setattr(manager.smart_lead, "process", delegation("faq"))
+    response = asyncio.run(manager.process_message("Học phí kỳ này bao nhiêu?", [], session_id="s1"))
+
+    assert response["reply"] == "Học phí 500.000đ/tín chỉ"
+    assert manager.calls == {"optimize": 1, "search": 1, "cancelled": 0}
+    stats = manager.speculation.stats()
+    assert (stats["launched"], stats["hits"], stats["misses"]) == (1, 1, 0)
+    assert stats["latency_saved_ms_total"] >= 40
+
+
+def test_speculative_search_is_cancelled_for_other_routes(manager, monkeypatch):
+    monkeypatch.setattr(manager.smart_lead, "process", delegation(None))
+    monkeypatch.setattr(manager.rag_agent, "_search_documents", _slow_search(manager.calls))
+    asyncio.run(manager.process_message("Cho mình hỏi học phí", [], session_id="s2"))
+
+    assert manager.calls["cancelled"] == 1
+    assert manager.speculation.stats()["hit_rate"] == 0.0
+
+
+def test_no_speculation_for_small_talk(manager, monkeypatch):
+    monkeypatch.setattr(manager.smart_lead, "process", delegation(None))
+    asyncio.run(manager.process_message("Xin chào", [], session_id="s3"))
+    assert manager.speculation.stats()["launched"] == 0
+
+
+def _slow_search(calls):
+    async def search(query):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+    return search
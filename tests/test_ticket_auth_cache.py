@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+# Ticket service modules use flat imports; make sure we get the ticket versions
+os.environ.setdefault("DB_CONNECTION", "mysql+pymysql")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "3306")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'ticket')))
+for name in ("auth", "schemas", "models", "database"):
+    sys.modules.pop(name, None)
+import auth
+import schemas
+sys.path.pop(0)
+for name in ("auth", "schemas", "models", "database"):
+    sys.modules.pop(name, None)
+
+
+def _token(sub="student1", role="student"):
+    return jwt.encode({"sub": sub, "role": role}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+
+
+@pytest.fixture
+def gateway_calls(monkeypatch):
+    calls = []
+
+    async def fake_gateway(token):
+        calls.append(token)
+        await asyncio.sleep(0)
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        return schemas.CurrentUser(id=7, username=payload["sub"], email="s1@example.edu", role=payload["role"])
+
+    auth.user_cache.invalidate()
+    monkeypatch.setattr(auth, "get_current_user_from_gateway", fake_gateway)
+    return calls
+
+
+def test_gateway_only_called_on_miss(gateway_calls):
+    token = _token()
+    first = asyncio.run(auth.get_current_user(token))
+    second = asyncio.run(auth.get_current_user(token))
+    assert first.id == second.id == 7
+    assert len(gateway_calls) == 1
+
+
+def test_concurrent_misses_share_one_lookup(gateway_calls):
+    token = _token()
+
+    async def burst():
+        return await asyncio.gather(*(auth.get_current_user(token) for _ in range(10)))
+
+    users = asyncio.run(burst())
+    assert {u.id for u in users} == {7}
+    assert len(gateway_calls) == 1
+
+
+def test_invalid_token_rejected_without_gateway(gateway_calls):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(auth.get_current_user("not-a-jwt"))
+    assert exc.value.status_code == 401
+    assert gateway_calls == []
+
+
+def test_expired_entry_refetched(gateway_calls, monkeypatch):
+    token = _token()
+    asyncio.run(auth.get_current_user(token))
+    monkeypatch.setattr(auth.time, "monotonic", lambda: float("inf"))
+    asyncio.run(auth.get_current_user(token))
+    assert len(gateway_calls) == 2
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+_FLAT_MODULES = ("app", "models", "database", "schemas", "crud")
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("ARCHIVER_INTERVAL_SECONDS", "0")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'services', 'gateway')))
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+import app as gateway
+from agents import SmartLeadAgent
+import security
+sys.path.pop(0)
+for name in _FLAT_MODULES:
+    sys.modules.pop(name, None)
+
+from common import llm, token_ledger  # noqa: E402
+
+
+def auth(student_id):
+    token = jwt.encode({"sub": student_id}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture(autouse=True)
+def stub_llm(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "stub")
+    monkeypatch.setenv("LLM_FALLBACK_PROVIDERS", "")
+    monkeypatch.setattr(llm, "router", llm.LLMRouter())
+    monkeypatch.setattr(token_ledger, "stats", token_ledger.LedgerStats())
+
+
+def test_ledger_counts_calls_and_trips_request_budget():
+    messages = [{"role": "user", "content": "Học phí kỳ này là bao nhiêu vậy?"}]
+    llm.chat(messages, agent="outside")  # không có ledger: không ghi nhận
+
+    with token_ledger.track(budget=10 ** 6) as ledger:
+        llm.chat(messages, agent="SmartLead", profile="classify")
+        assert not token_ledger.budget_exceeded()
+        ledger.budget = ledger.total_tokens + 1
+        llm.chat(messages, agent="FAQ")
+        assert token_ledger.budget_exceeded()
+
+    summary = ledger.summary()
+    assert summary["calls"] == 2
+    assert summary["total_tokens"] >= ledger.budget
+    assert summary["budget_exceeded"] == "request_budget"
+    assert summary["by_agent"]["SmartLead"]["calls"] == 1
+    assert [c["profile"] for c in ledger.calls] == ["classify", "generate"]
+
+    totals = llm.stats()["tokens"]
+    assert totals["requests"] == 1
+    assert totals["budget_exceeded"] == {"request_budget": 1}
+    assert set(totals["agents"]) == {"SmartLead", "FAQ"}
+
+
+def test_agents_take_fast_path_when_budget_is_used_up(monkeypatch):
+    agent = SmartLeadAgent()
+    monkeypatch.setattr(agent, "_call_llm", lambda *a, **k: pytest.fail("LLM should be skipped"))
+
+    with token_ledger.track(exhausted_reason="student_budget") as ledger:
+        decision = agent._make_intelligent_decision("Quên mật khẩu email", [], {})
+
+    assert decision["target_specialist"] == "technical"
+    assert ledger.summary()["fast_paths"] == ["smart_lead_decision"]
+
+
+def test_ask_debug_output_and_student_budget(monkeypatch):
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(gateway, "r", redis)
+    monkeypatch.setattr(gateway, "r_history", fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(token_ledger, "TOKEN_BUDGET_PER_STUDENT_DAILY", 1)
+    seen = []
+
+    async def fake_process(user_message, chat_history, session_id=None, student_id=None):
+        seen.append((student_id, token_ledger.budget_exceeded()))
+        llm.chat([{"role": "user", "content": user_message}], agent="FAQ")
+        return {"reply": "ok", "agent": "faq"}
+
+    monkeypatch.setattr(gateway.agent_manager, "process_message", fake_process)
+    client = TestClient(gateway.app)
+    headers = auth("20210001")
+    body = {"channel": "web", "text": "Học phí bao nhiêu?", "debug": True}
+
+    first = client.post("/ask", json=body, headers=headers).json()
+    assert first["debug"]["tokens"]["calls"] == 1
+    assert first["debug"]["tokens"]["by_agent"]["FAQ"]["prompt_tokens"] > 0
+
+    # Budget (và student_id của agents) theo subject của JWT, không theo student_id trong body
+    second = client.post("/ask", json={**body, "student_id": "someone-else"}, headers=headers).json()
+    assert seen == [("20210001", False), ("20210001", True)]
+    assert second["debug"]["tokens"]["budget_exceeded"] == "student_budget"
+
+    # /ask/batch (và /ws/chat) cũng đi qua ledger và budget của người gọi
+    client.post("/ask/batch", json={"items": [{"text": "Lịch thi?"}]}, headers=headers)
+    assert seen[-1] == ("20210001", True)
+    client.post("/ask/batch", json={"items": [{"text": "Lịch thi?"}]}, headers=auth("20210002"))
+    assert seen[-1] == ("20210002", False)
+    assert int(redis.get(token_ledger._student_key("20210002"))) > 0
+
+    # x-student-id không được xác thực: không có budget theo sinh viên, không ai bị trừ
+    for spoofed in ("20210001", "random-id"):
+        client.post("/ask", json=body, headers={"x-student-id": spoofed})
+        assert seen[-1] == (None, False)
+    assert redis.get(token_ledger._student_key("random-id")) is None